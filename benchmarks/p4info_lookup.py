@@ -0,0 +1,74 @@
+"""Micro-benchmark of the P4InfoHelper lookups done by the proxy for every update.
+
+Run from the repository root:
+    python -m benchmarks.p4info_lookup
+"""
+import argparse
+import time
+
+from google.protobuf.text_format import MessageToString
+
+from benchmarks.synthetic_p4info import build_synthetic_p4info
+from common.p4runtime_lib.helper import P4InfoHelper
+
+
+class LinearScanP4InfoHelper(P4InfoHelper):
+    """The lookups as they were implemented before the indexes, kept as the baseline."""
+    def get(self, entity_type, name=None, id=None):
+        for o in getattr(self.p4info, entity_type):
+            pre = o.preamble
+            if name:
+                if pre.name == name or pre.alias == name:
+                    return o
+            else:
+                if pre.id == id:
+                    return o
+        raise AttributeError(f'Could not find {name if name else id} of type {entity_type}')
+
+    def get_match_field(self, table_name, name=None, id=None):
+        for t in self.p4info.tables:
+            if t.preamble.name == table_name:
+                for mf in t.match_fields:
+                    if name is not None and mf.name == name:
+                        return mf
+                    elif id is not None and mf.id == id:
+                        return mf
+        raise AttributeError(f'{table_name} has no attribute {name if name is not None else id}')
+
+
+def lookups_of_one_update(helper: P4InfoHelper, table_id: int, action_id: int) -> None:
+    # Same lookups as a table entry write does on the path through the proxy
+    table_name = helper.get_tables_name(table_id)
+    helper.get_match_field_name(table_name, 1)
+    helper.get_match_field_name(table_name, 2)
+    action_name = helper.get_actions_name(action_id)
+    helper.get_tables_id(table_name)
+    helper.get_actions_id(action_name)
+
+
+def measure(helper: P4InfoHelper, table_ids, action_ids, repeat: int) -> float:
+    start_time = time.perf_counter()
+    for _ in range(repeat):
+        for table_id, action_id in zip(table_ids, action_ids):
+            lookups_of_one_update(helper, table_id, action_id)
+    return (time.perf_counter() - start_time) / (repeat * len(table_ids))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--tables', type=int, nargs='+', default=[10, 100, 500, 2000])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    print(f'{"tables":>8} {"linear scan [us/update]":>24} {"indexed [us/update]":>20} {"speedup":>8}')
+    for table_num in args.tables:
+        raw_p4info = MessageToString(build_synthetic_p4info(table_num))
+        linear_helper = LinearScanP4InfoHelper(raw_p4info=raw_p4info)
+        indexed_helper = P4InfoHelper(raw_p4info=raw_p4info)
+
+        table_ids = [t.preamble.id for t in indexed_helper.p4info.tables]
+        action_ids = [t.action_refs[0].id for t in indexed_helper.p4info.tables]
+
+        linear_time = measure(linear_helper, table_ids, action_ids, args.repeat)
+        indexed_time = measure(indexed_helper, table_ids, action_ids, args.repeat)
+        print(f'{table_num:>8} {linear_time * 1e6:>24.2f} {indexed_time * 1e6:>20.2f} {linear_time / indexed_time:>7.1f}x')
@@ -0,0 +1,123 @@
+"""Benchmark of forwarding packet-outs and packet-ins through the proxy.
+
+A local stand-in target answers every packet-out with a packet-in of the same payload, the controller sends the
+packet-outs on its StreamChannel as fast as it can and waits for all the packet-ins.
+
+Run from the repository root:
+    python -m benchmarks.packet_io
+"""
+import argparse
+import asyncio
+import logging
+import os
+import tempfile
+import time
+
+import grpc
+import grpc.aio
+from google.protobuf.text_format import MessageToString
+from p4.v1 import p4runtime_pb2, p4runtime_pb2_grpc
+from p4.v1.p4runtime_pb2_grpc import P4RuntimeServicer, add_P4RuntimeServicer_to_server
+
+from benchmarks.synthetic_p4info import build_synthetic_p4info
+from common.high_level_switch_connection_async import HighLevelSwitchConnection
+from common.model.proxy_config import RedisMode, ProxyStreamSettings, StreamOverflowPolicy
+from proxy import ProxyServer, TargetSwitchConfig
+
+
+class StandInTarget(P4RuntimeServicer):
+    """Answers the arbitration and sends back every packet-out as a packet-in."""
+    async def StreamChannel(self, request_iterator, context):
+        async for request in request_iterator:
+            response = p4runtime_pb2.StreamMessageResponse()
+            which_one = request.WhichOneof('update')
+            if which_one == 'arbitration':
+                response.arbitration.device_id = request.arbitration.device_id
+            elif which_one == 'packet':
+                response.packet.payload = request.packet.payload
+                metadata = response.packet.metadata.add()
+                metadata.metadata_id = 1
+                metadata.value = b'\x00\x01'
+            else:
+                continue
+            yield response
+
+
+async def send_packets(stub: p4runtime_pb2_grpc.P4RuntimeStub, packet_num: int, payload_size: int) -> float:
+    """Sends packet_num packet-outs and returns the seconds until all the packet-ins arrived."""
+    arbitration_done = asyncio.Event()
+
+    async def requests():
+        request = p4runtime_pb2.StreamMessageRequest()
+        request.arbitration.device_id = 0
+        request.arbitration.election_id.low = 1
+        yield request
+        await arbitration_done.wait()
+        for packet_index in range(packet_num):
+            request = p4runtime_pb2.StreamMessageRequest()
+            request.packet.payload = packet_index.to_bytes(4, 'big') + bytes(payload_size - 4)
+            metadata = request.packet.metadata.add()
+            metadata.metadata_id = 1
+            metadata.value = b'\x00\x02'
+            yield request
+
+    stream = stub.StreamChannel(requests())
+    start_time = None
+    received = 0
+    async for response in stream:
+        if response.WhichOneof('update') == 'arbitration':
+            start_time = time.perf_counter()
+            arbitration_done.set()
+        elif response.WhichOneof('update') == 'packet':
+            received += 1
+            if received == packet_num:
+                break
+    elapsed = time.perf_counter() - start_time
+    stream.cancel()
+    return elapsed
+
+
+async def main(args) -> None:
+    build_dir = tempfile.mkdtemp()
+    p4info_paths = {}
+    for name, prefix in [('source', ''), ('target', args.prefix)]:
+        p4info_paths[name] = os.path.join(build_dir, f'{name}.p4info.txt')
+        with open(p4info_paths[name], 'w') as f:
+            f.write(MessageToString(build_synthetic_p4info(table_num=10, counter_num=0, prefix=prefix, packet_io=True)))
+
+    target_server = grpc.aio.server()
+    add_P4RuntimeServicer_to_server(StandInTarget(), target_server)
+    target_server.add_insecure_port(f'127.0.0.1:{args.target_port}')
+    await target_server.start()
+
+    target_connection = HighLevelSwitchConnection(0, 'target', args.target_port, send_p4info=False, p4info_path=p4info_paths['target'])
+    await target_connection.init()
+    # Nothing is dropped, the throughput is limited by the slowest part of the path
+    stream_settings = ProxyStreamSettings(overflow_policy=StreamOverflowPolicy.BLOCK)
+    proxy_server = ProxyServer(args.proxy_port, args.prefix, p4info_paths['source'], [TargetSwitchConfig(target_connection)], RedisMode.OFF,
+                               stream_settings=stream_settings)
+    await proxy_server.start()
+
+    print(f'{"path":>8} {"packets":>8} {"payload [B]":>12} {"packets/s":>10}')
+    for path, port in [('direct', args.target_port), ('proxy', args.proxy_port)]:
+        async with grpc.aio.insecure_channel(f'127.0.0.1:{port}') as channel:
+            stub = p4runtime_pb2_grpc.P4RuntimeStub(channel)
+            elapsed = await send_packets(stub, args.packets, args.payload_size)
+        print(f'{path:>8} {args.packets:>8} {args.payload_size:>12} {args.packets / elapsed:>10.0f}')
+
+    await proxy_server.stop()
+    await target_server.stop(None)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--packets', type=int, default=20000)
+    parser.add_argument('--payload-size', type=int, default=64)
+    parser.add_argument('--prefix', default='NF1_')
+    parser.add_argument('--target-port', type=int, default=50151)
+    parser.add_argument('--proxy-port', type=int, default=60151)
+    args = parser.parse_args()
+
+    # The proxy logs every stream message on debug level
+    logging.getLogger().setLevel(logging.WARNING)
+    asyncio.run(main(args))
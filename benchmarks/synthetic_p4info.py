@@ -0,0 +1,72 @@
+import zlib
+
+from p4.config.v1 import p4info_pb2
+from google.protobuf.text_format import MessageToString
+
+from common.p4runtime_lib.helper import P4InfoHelper
+
+
+def build_synthetic_p4info(table_num: int = 500, actions_per_table: int = 2, counter_num: int = 100, prefix: str = '',
+                           packet_io: bool = False) -> p4info_pb2.P4Info:
+    """Builds a p4info with table_num exact match tables that resembles a large compiled P4 program.
+
+    With packet_io it has packet_in and packet_out controller headers with a port metadata.
+
+    Ids are derived from the entity name, so p4infos built with different prefixes have different ids
+    for the "same" entity like two independently compiled programs would have.
+    """
+    p4info = p4info_pb2.P4Info()
+
+    def next_id(resource_type: int, name: str) -> int:
+        return (resource_type << 24) | (zlib.crc32(name.encode()) & 0xffffff)
+
+    for table_index in range(table_num):
+        table_name = f'MyIngress.{prefix}table_{table_index}'
+        table = p4info.tables.add()
+        table.preamble.id = next_id(0x02, table_name)
+        table.preamble.name = table_name
+        table.preamble.alias = f'{prefix}table_{table_index}'
+        for field_index in range(2):
+            match_field = table.match_fields.add()
+            match_field.id = field_index + 1
+            match_field.name = f'hdr.field_{field_index}'
+            match_field.bitwidth = 32
+            match_field.match_type = p4info_pb2.MatchField.EXACT
+        table.size = 1024
+
+        for action_index in range(actions_per_table):
+            action_name = f'MyIngress.{prefix}action_{table_index}_{action_index}'
+            action = p4info.actions.add()
+            action.preamble.id = next_id(0x01, action_name)
+            action.preamble.name = action_name
+            action.preamble.alias = f'{prefix}action_{table_index}_{action_index}'
+            param = action.params.add()
+            param.id = 1
+            param.name = 'port'
+            param.bitwidth = 9
+            table.action_refs.add().id = action.preamble.id
+
+    for counter_index in range(counter_num):
+        counter_name = f'MyIngress.{prefix}counter_{counter_index}'
+        counter = p4info.counters.add()
+        counter.preamble.id = next_id(0x12, counter_name)
+        counter.preamble.name = counter_name
+        counter.preamble.alias = f'{prefix}counter_{counter_index}'
+        counter.spec.unit = p4info_pb2.CounterSpec.BOTH
+        counter.size = 1024
+
+    if packet_io:
+        for controller_header_name, metadata_name in [('packet_in', 'ingress_port'), ('packet_out', 'egress_port')]:
+            controller_header = p4info.controller_packet_metadata.add()
+            controller_header.preamble.id = next_id(0x40, controller_header_name)
+            controller_header.preamble.name = controller_header_name
+            metadata = controller_header.metadata.add()
+            metadata.id = 1
+            metadata.name = f'{prefix}{metadata_name}'
+            metadata.bitwidth = 9
+
+    return p4info
+
+
+def build_synthetic_p4info_helper(*args, **kwargs) -> P4InfoHelper:
+    return P4InfoHelper(raw_p4info=MessageToString(build_synthetic_p4info(*args, **kwargs)))
@@ -0,0 +1,99 @@
+"""Micro-benchmark of distributing the updates of one WriteRequest to replicated targets.
+
+Run from the repository root:
+    python -m benchmarks.write_fanout
+"""
+import argparse
+import time
+from typing import Dict, List
+
+from p4.v1 import p4runtime_pb2
+
+from benchmarks.synthetic_p4info import build_synthetic_p4info_helper
+from common.p4_name_id_helper import P4NameConverter
+from common.p4runtime_lib.helper import P4InfoHelper
+
+
+def build_write_request(p4info_helper: P4InfoHelper, update_num: int, table_num: int) -> p4runtime_pb2.WriteRequest:
+    request = p4runtime_pb2.WriteRequest()
+    for update_index in range(update_num):
+        table_index = update_index % table_num
+        update = request.updates.add()
+        update.type = p4runtime_pb2.Update.INSERT
+        update.entity.table_entry.CopyFrom(p4info_helper.build_table_entry(
+            f'MyIngress.table_{table_index}',
+            match_fields={'hdr.field_0': update_index, 'hdr.field_1': 1},
+            action_name=f'MyIngress.action_{table_index}_0',
+            action_params={'port': 1}
+        ))
+    return request
+
+
+def in_place_fanout(request: p4runtime_pb2.WriteRequest, converters: List[P4NameConverter]) -> Dict[int, bytes]:
+    """The distribution as it was before the serialized per-target updates, kept as the baseline.
+
+    It translates the shared entity in place, so it is only correct when the translation does not change the ids,
+    like with the identical source and target p4infos used here. Every target request is serialized, as gRPC does on send.
+    """
+    updates_distributed_by_target = {target_index: [] for target_index in range(len(converters))}
+    for update in request.updates:
+        for target_index, converter in enumerate(converters):
+            converter.convert_entity(update.entity, verbose=False)
+            updates_distributed_by_target[target_index].append(update)
+
+    ret = {}
+    for target_index, updates in updates_distributed_by_target.items():
+        target_request = p4runtime_pb2.WriteRequest()
+        for update in updates:
+            target_request.updates.add().CopyFrom(update)
+        ret[target_index] = target_request.SerializeToString()
+    return ret
+
+
+def translation_group_fanout(request: p4runtime_pb2.WriteRequest, converters: List[P4NameConverter], translation_groups: List[int]) -> Dict[int, bytes]:
+    """The distribution of ProxyP4RuntimeServicer.Write: an update is translated and serialized once per translation group."""
+    serialized_updates_by_target: Dict[int, List[bytes]] = {}
+    for update in request.updates:
+        serialized_update_by_translation_group: Dict[int, bytes] = {}
+        for target_index, converter in enumerate(converters):
+            serialized_update = serialized_update_by_translation_group.get(translation_groups[target_index])
+            if serialized_update is None:
+                translated_request = p4runtime_pb2.WriteRequest()
+                translated_update = translated_request.updates.add()
+                translated_update.CopyFrom(update)
+                converter.convert_entity(translated_update.entity, verbose=False)
+                serialized_update = serialized_update_by_translation_group[translation_groups[target_index]] = translated_request.SerializeToString()
+            serialized_updates_by_target.setdefault(target_index, []).append(serialized_update)
+
+    return {target_index: b''.join(serialized_updates) for target_index, serialized_updates in serialized_updates_by_target.items()}
+
+
+def measure(fanout, repeat: int, *args) -> float:
+    start_time = time.perf_counter()
+    for _ in range(repeat):
+        fanout(*args)
+    return (time.perf_counter() - start_time) / repeat
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--targets', type=int, nargs='+', default=[1, 4, 16])
+    parser.add_argument('--updates', type=int, default=100)
+    parser.add_argument('--tables', type=int, default=100)
+    parser.add_argument('--repeat', type=int, default=50)
+    args = parser.parse_args()
+
+    source_p4info_helper = build_synthetic_p4info_helper(args.tables)
+    # Every target runs the same program, as the replicated nodes behind a balancer
+    target_p4info_helper = build_synthetic_p4info_helper(args.tables)
+    write_request = build_write_request(source_p4info_helper, args.updates, args.tables)
+
+    print(f'{"targets":>8} {"in place [us/update]":>21} {"one target per group [us/update]":>34} {"one group [us/update]":>22}')
+    for target_num in args.targets:
+        target_converters = [P4NameConverter(source_p4info_helper, target_p4info_helper, '') for _ in range(target_num)]
+        in_place_time = measure(in_place_fanout, args.repeat, write_request, target_converters) / args.updates
+        # Worst case, the targets run different programs, every target has to be translated on its own
+        distinct_groups_time = measure(translation_group_fanout, args.repeat, write_request, target_converters, list(range(target_num))) / args.updates
+        # Replicated nodes, the translation is shared by all targets
+        one_group_time = measure(translation_group_fanout, args.repeat, write_request, target_converters, [0] * target_num) / args.updates
+        print(f'{target_num:>8} {in_place_time * 1e6:>21.2f} {distinct_groups_time * 1e6:>34.2f} {one_group_time * 1e6:>22.2f}')
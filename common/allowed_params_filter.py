@@ -0,0 +1,76 @@
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from p4.config.v1 import p4info_pb2
+from p4.v1 import p4runtime_pb2
+
+from common.model.proxy_config import ProxyAllowedParamsDict
+from common.p4runtime_lib.helper import P4InfoHelper
+
+
+class AllowedParamsFilter:
+    """Compiled form of a filter_params_allow_only dict.
+
+    The allowed values are encoded once for every exact match field of every table that has a field
+    with the filtered name, and kept in sets keyed by (table id, field id).
+    """
+    def __init__(self, p4info_helper: P4InfoHelper, filter_params_allow_only: Optional[ProxyAllowedParamsDict] = None) -> None:
+        self.p4info_helper = p4info_helper
+        self.filter_params_allow_only: ProxyAllowedParamsDict = {}
+        self._allowed_values: Dict[Tuple[int, int], Set[bytes]] = {}
+        # match field name -> (table name, table id, field id) of the exact fields with that name
+        self._exact_fields_by_name: Dict[str, List[Tuple[str, int, int]]] = {}
+        for table in p4info_helper.p4info.tables:
+            for match_field in table.match_fields:
+                if match_field.match_type == p4info_pb2.MatchField.EXACT:
+                    self._exact_fields_by_name.setdefault(match_field.name, []).append((table.preamble.name, table.preamble.id, match_field.id))
+
+        if filter_params_allow_only is not None:
+            self.add(filter_params_allow_only)
+
+    def add(self, filters_to_add: ProxyAllowedParamsDict) -> ProxyAllowedParamsDict:
+        """Allows the given values too, returns the values that were not allowed before."""
+        new_added_params_dict: ProxyAllowedParamsDict = {}
+        for param_name, allowed_values in filters_to_add.items():
+            actual_values = self.filter_params_allow_only.setdefault(param_name, [])
+            new_values = []
+            for allowed_value in allowed_values:
+                if allowed_value not in actual_values:
+                    actual_values.append(allowed_value)
+                    new_values.append(allowed_value)
+            new_added_params_dict[param_name] = new_values
+
+            for table_name, table_id, field_id in self._exact_fields_by_name.get(param_name, []):
+                encoded_values = self._allowed_values.setdefault((table_id, field_id), set())
+                encoded_values.update(self._encode_values(table_name, param_name, new_values))
+
+        return new_added_params_dict
+
+    def remove(self, filters_to_remove: ProxyAllowedParamsDict) -> None:
+        for param_name, values_to_remove in filters_to_remove.items():
+            if param_name not in self.filter_params_allow_only:
+                continue
+
+            actual_values = self.filter_params_allow_only[param_name]
+            for value in values_to_remove:
+                if value in actual_values:
+                    actual_values.remove(value)
+
+            # Different values can have the same encoding, so the remaining values are encoded again
+            for table_name, table_id, field_id in self._exact_fields_by_name.get(param_name, []):
+                self._allowed_values[(table_id, field_id)] = set(self._encode_values(table_name, param_name, actual_values))
+
+    def is_entity_allowed(self, entity: p4runtime_pb2.Entity) -> bool:
+        if entity.WhichOneof('entity') != 'table_entry':
+            return True
+
+        table_id = entity.table_entry.table_id
+        for match in entity.table_entry.match:
+            if match.WhichOneof('field_match_type') == 'exact':
+                allowed_values = self._allowed_values.get((table_id, match.field_id))
+                if allowed_values is not None and match.exact.value not in allowed_values:
+                    return False
+
+        return True
+
+    def _encode_values(self, table_name: str, match_field_name: str, values: Iterable) -> Iterable[bytes]:
+        return (self.p4info_helper.get_match_field_pb(table_name, match_field_name, value).exact.value for value in values)
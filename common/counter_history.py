@@ -0,0 +1,92 @@
+from dataclasses import dataclass
+from typing import Dict, Hashable, Sequence
+
+import numpy as np
+
+
+@dataclass
+class CounterRates:
+    """Rates of several counters, the arrays are in the order of the requested keys."""
+    packets_per_sec: np.ndarray
+    bytes_per_sec: np.ndarray
+    # Seconds between the samples the rates are calculated from, 0 if a counter has less than 2 samples in the window
+    elapsed: np.ndarray
+
+    @classmethod
+    def zeros(cls, size: int) -> 'CounterRates':
+        return cls(np.zeros(size), np.zeros(size), np.zeros(size))
+
+
+class CounterHistory:
+    """The last depth samples of counters, in one ring buffer row per counter key.
+
+    The samples are kept in 2D arrays, so the memory is fixed per counter and the rates of many counters
+    are calculated with array operations.
+    """
+    def __init__(self, depth: int, initial_capacity: int = 64) -> None:
+        if depth < 2:
+            raise ValueError(f'At least 2 samples are needed for a rate, the depth of the counter history is {depth}')
+
+        self.depth = depth
+        self._rows: Dict[Hashable, int] = {}
+        self._times = np.full((initial_capacity, depth), np.nan)
+        self._packet_counts = np.zeros((initial_capacity, depth), dtype=np.int64)
+        self._byte_counts = np.zeros((initial_capacity, depth), dtype=np.int64)
+        # The slot of the next sample in every row
+        self._heads = np.zeros(initial_capacity, dtype=np.int64)
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def record(self, keys: Sequence[Hashable], packet_counts: Sequence[int], byte_counts: Sequence[int], timestamp: float) -> None:
+        """Adds one sample for each key, the keys are expected to be different."""
+        if len(keys) == 0:
+            return
+
+        rows = np.fromiter((self._get_or_add_row(key) for key in keys), dtype=np.int64, count=len(keys))
+        slots = self._heads[rows]
+        self._times[rows, slots] = timestamp
+        self._packet_counts[rows, slots] = packet_counts
+        self._byte_counts[rows, slots] = byte_counts
+        self._heads[rows] = (slots + 1) % self.depth
+
+    def get_rates(self, keys: Sequence[Hashable], window: float) -> CounterRates:
+        """Rates between the newest sample of each counter and its oldest sample not older than window seconds before that."""
+        ret = CounterRates.zeros(len(keys))
+        positions = np.fromiter((position for position, key in enumerate(keys) if key in self._rows), dtype=np.int64)
+        if len(positions) == 0:
+            return ret
+
+        rows = np.fromiter((self._rows[keys[position]] for position in positions), dtype=np.int64, count=len(positions))
+        row_range = np.arange(len(rows))
+        times = self._times[rows]
+        newest_slots = (self._heads[rows] - 1) % self.depth
+        newest_times = times[row_range, newest_slots]
+        # NaN, the never written slots, is never in the window
+        in_window = times >= (newest_times - window)[:, np.newaxis]
+        oldest_slots = np.where(in_window, times, np.inf).argmin(axis=1)
+        elapsed = newest_times - times[row_range, oldest_slots]
+
+        has_rate = elapsed > 0
+        safe_elapsed = np.where(has_rate, elapsed, 1.0)
+        for counts, rates in [(self._packet_counts, ret.packets_per_sec), (self._byte_counts, ret.bytes_per_sec)]:
+            # A counter reset of the switch would give a negative rate
+            deltas = np.maximum(counts[rows, newest_slots] - counts[rows, oldest_slots], 0)
+            rates[positions] = np.where(has_rate, deltas / safe_elapsed, 0.0)
+        ret.elapsed[positions] = np.where(has_rate, elapsed, 0.0)
+        return ret
+
+    def _get_or_add_row(self, key: Hashable) -> int:
+        row = self._rows.get(key)
+        if row is None:
+            row = len(self._rows)
+            if row == len(self._heads):
+                self._grow()
+            self._rows[key] = row
+        return row
+
+    def _grow(self) -> None:
+        self._times = np.concatenate([self._times, np.full_like(self._times, np.nan)])
+        self._packet_counts = np.concatenate([self._packet_counts, np.zeros_like(self._packet_counts)])
+        self._byte_counts = np.concatenate([self._byte_counts, np.zeros_like(self._byte_counts)])
+        self._heads = np.concatenate([self._heads, np.zeros_like(self._heads)])
@@ -0,0 +1,105 @@
+import asyncio
+import itertools
+import time
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+
+from p4.v1 import p4runtime_pb2
+
+
+@dataclass
+class DigestAggregatorStats:
+    # DigestLists arrived from the targets
+    received_lists: int
+    # DigestLists sent to the controllers
+    published_lists: int
+    # Digest payloads dropped because the same payload was already in the window
+    suppressed_duplicates: int
+
+
+class PendingDigestList:
+    def __init__(self, digest_id: int, list_id: int) -> None:
+        self.message = p4runtime_pb2.StreamMessageResponse()
+        self.message.digest.digest_id = digest_id
+        self.message.digest.list_id = list_id
+        # Serialized payloads of the window, for the duplicate suppression
+        self.seen_payloads: Set[bytes] = set()
+        # The DigestLists of the targets whose first digest is in this list
+        self.origins: List[Any] = []
+        self.flush_task: Optional[asyncio.Task] = None
+
+
+class DigestAggregator:
+    """Collects the digests of every target into one DigestList per source digest id.
+
+    The list is published when the window of its first digest is over or when it reaches max_list_size, whichever
+    comes first. The aggregated lists get their own list_id, the origins of the DigestLists of the targets are
+    published with the list that holds their first digest.
+    """
+    def __init__(self,
+                 window: float,
+                 max_list_size: int,
+                 suppress_duplicates: bool,
+                 publish: Callable[[p4runtime_pb2.StreamMessageResponse, List[Any]], Awaitable[None]]) -> None:
+        self.window = window
+        self.max_list_size = max_list_size
+        self.suppress_duplicates = suppress_duplicates
+        self._publish = publish
+        self._pending: Dict[int, PendingDigestList] = {}
+        self._list_ids = itertools.count(1)
+
+        self.received_lists = 0
+        self.published_lists = 0
+        self.suppressed_duplicates = 0
+
+    async def add(self, digest_id: int, digest_list: p4runtime_pb2.DigestList, origin: Any = None) -> None:
+        """Adds the payloads of a DigestList of a target, digest_id is the id of the source.
+
+        The origin identifies the DigestList of the target, it is published with the aggregated list.
+        """
+        self.received_lists += 1
+        for index, data in enumerate(digest_list.data):
+            pending = self._pending.get(digest_id)
+            if pending is None:
+                pending = PendingDigestList(digest_id, next(self._list_ids))
+                pending.flush_task = asyncio.ensure_future(self._flush_after_window(digest_id, pending))
+                self._pending[digest_id] = pending
+            if index == 0 and origin is not None:
+                pending.origins.append(origin)
+
+            if self.suppress_duplicates:
+                payload = data.SerializeToString(deterministic=True)
+                if payload in pending.seen_payloads:
+                    self.suppressed_duplicates += 1
+                    continue
+                pending.seen_payloads.add(payload)
+
+            pending.message.digest.data.add().CopyFrom(data)
+            if len(pending.message.digest.data) >= self.max_list_size:
+                pending.flush_task.cancel()
+                await self._flush(digest_id, pending)
+
+    async def _flush_after_window(self, digest_id: int, pending: PendingDigestList) -> None:
+        await asyncio.sleep(self.window)
+        await self._flush(digest_id, pending)
+
+    async def _flush(self, digest_id: int, pending: PendingDigestList) -> None:
+        if self._pending.get(digest_id) is not pending:
+            return
+        del self._pending[digest_id]
+        pending.message.digest.timestamp = time.time_ns()
+        self.published_lists += 1
+        await self._publish(pending.message, pending.origins)
+
+    def stop(self) -> None:
+        """Drops the lists that are not published yet."""
+        for pending in self._pending.values():
+            pending.flush_task.cancel()
+        self._pending.clear()
+
+    def get_stats(self) -> DigestAggregatorStats:
+        return DigestAggregatorStats(
+            received_lists=self.received_lists,
+            published_lists=self.published_lists,
+            suppressed_duplicates=self.suppressed_duplicates,
+        )
@@ -1,24 +1,63 @@
-from typing import List, Union, Dict
+from typing import List, Dict, Iterable, Optional, Tuple, Hashable
 
-from google.protobuf.json_format import MessageToJson
 from p4.v1 import p4runtime_pb2
 
-def calculate_read_entity_custom_identifier(entity: p4runtime_pb2.Entity) -> Union[str, int]:
+def calculate_read_entity_custom_identifier(entity: p4runtime_pb2.Entity) -> Hashable:
+    """Canonical structural key of an entity of a read answer, the entities with the same key are merged."""
     which_one = entity.WhichOneof('entity')
     if which_one == 'table_entry':
-        return entity.table_entry.table_id
+        return which_one, EntityHelper.get_table_entry_match_key(entity.table_entry), entity.table_entry.priority
     if which_one == 'meter_entry':
-        return entity.meter_entry.meter_id
+        return which_one, entity.meter_entry.meter_id, entity.meter_entry.index.index
     if which_one == 'direct_meter_entry':
-        return entity.direct_meter_entry.table_entry.table_id
+        table_entry = entity.direct_meter_entry.table_entry
+        return which_one, EntityHelper.get_table_entry_match_key(table_entry), table_entry.priority
     if which_one == 'counter_entry':
-        return f'{entity.counter_entry.counter_id}-{entity.counter_entry.index}'
+        return which_one, entity.counter_entry.counter_id, entity.counter_entry.index.index
     if which_one == 'direct_counter_entry':
-        return MessageToJson(entity.direct_counter_entry.table_entry) #table and match are both in
+        table_entry = entity.direct_counter_entry.table_entry
+        return which_one, EntityHelper.get_table_entry_match_key(table_entry), table_entry.priority
     raise NotImplementedError(f'{which_one} is not handled by read feedback')
 
 
+TableEntryMatchKey = Tuple[int, Tuple[Tuple[int, bytes], ...]]
+
 class EntityHelper:
+    @staticmethod
+    def get_table_entry_match_key(table_entry: p4runtime_pb2.TableEntry) -> TableEntryMatchKey:
+        """Table id and the serialized match fields sorted by field id, independently of the match field order."""
+        return table_entry.table_id, tuple(sorted((match.field_id, match.SerializeToString(deterministic=True)) for match in table_entry.match))
+
+    @staticmethod
+    def get_table_entry_key(table_entry: p4runtime_pb2.TableEntry) -> bytes:
+        """Identifies the table entry by table id, match and priority independently of the match field order and action."""
+        key_entry = p4runtime_pb2.TableEntry()
+        key_entry.table_id = table_entry.table_id
+        key_entry.match.extend(sorted(table_entry.match, key=lambda match: match.field_id))
+        key_entry.priority = table_entry.priority
+        key_entry.is_default_action = table_entry.is_default_action
+        return key_entry.SerializeToString(deterministic=True)
+
+    @staticmethod
+    def collapse_table_entry_updates(updates: Iterable[p4runtime_pb2.Update],
+                                     collapsed: Optional[Dict[bytes, p4runtime_pb2.Update]] = None) -> Dict[bytes, p4runtime_pb2.Update]:
+        """Replays table entry updates and returns only the live entries keyed by get_table_entry_key.
+
+        If collapsed is given the updates are replayed on top of it, so a long log can be collapsed page by page.
+        """
+        ret: Dict[bytes, p4runtime_pb2.Update] = {} if collapsed is None else collapsed
+        for update in updates:
+            key = EntityHelper.get_table_entry_key(update.entity.table_entry)
+            if update.type == p4runtime_pb2.Update.DELETE:
+                ret.pop(key, None)
+            elif update.type == p4runtime_pb2.Update.MODIFY and key in ret:
+                modified = p4runtime_pb2.Update(type=ret[key].type)
+                modified.entity.CopyFrom(update.entity)
+                ret[key] = modified
+            else:
+                ret[key] = update
+        return ret
+
     @staticmethod
     def is_entity_mergable_to_entity_list(entity: p4runtime_pb2.Entity, entities: List[p4runtime_pb2.Entity]) -> bool:
         to_add_cid = calculate_read_entity_custom_identifier(entity)
@@ -30,65 +69,112 @@ class EntityHelper:
 
     @staticmethod
     def merge_duplicates_for_read_answer(received_entries: List[p4runtime_pb2.Entity]) -> List[p4runtime_pb2.Entity]:
-        groupped_entries: Dict[Union[str, int], p4runtime_pb2.Entity] = {}
+        merger = EntityMerger()
         for entity in received_entries:
-            identifier = calculate_read_entity_custom_identifier(entity)
-            if identifier not in groupped_entries:
-                groupped_entries[identifier] = []
-
-            groupped_entries[identifier].append(entity)
-
-        ret: List[p4runtime_pb2.Entity] = []
-        def are_all_same_entity(entities: List[p4runtime_pb2.Entity]) -> bool:
-            json_dump = None
-            for entity in entities:
-                if json_dump is None:
-                    json_dump = MessageToJson(entity)
-                elif json_dump != MessageToJson(entity):
-                    return False
-            return True
-
-        for group in groupped_entries.values():
-            first_entity = group[0]
-            which_one = first_entity.WhichOneof('entity')
-            if which_one in ['table_entry', 'meter_entry', 'direct_meter_entry']:
-                if not are_all_same_entity(group):
-                    raise Exception(f'Cannot merge, because responses are differs on different targets {group}')
-            elif which_one == 'counter_entry':
-                for entity in group[1:]:
-                    first_entity.counter_entry.data.byte_count += entity.counter_entry.data.byte_count
-                    first_entity.counter_entry.data.packet_count += entity.counter_entry.data.packet_count
-            elif which_one == 'direct_counter_entry':
-                for entity in group[1:]:
-                    first_entity.direct_counter_entry.data.byte_count += entity.direct_counter_entry.data.byte_count
-                    first_entity.direct_counter_entry.data.packet_count += entity.direct_counter_entry.data.packet_count
-            else:
-                raise NotImplementedError(f'{which_one} is not handled by read feedback')
-            ret.append(first_entity)
+            merger.add(entity)
+        return merger.get_entities()
 
-        return ret
+    @staticmethod
+    def get_counter_data(entity: p4runtime_pb2.Entity) -> p4runtime_pb2.CounterData:
+        which_one = entity.WhichOneof('entity')
+        if which_one == 'direct_counter_entry':
+            return entity.direct_counter_entry.data
+        elif which_one == 'counter_entry':
+            return entity.counter_entry.data
+        else:
+            raise Exception(f'Here only counter entry should arrive: {which_one}')
 
     @staticmethod
-    def is_counter_entity_data_empty(entity: p4runtime_pb2) -> bool:
+    def get_counter_entity_key(entity: p4runtime_pb2.Entity) -> bytes:
+        """Identifies a counter or direct counter entity independently of its data and the match field order."""
+        key_entity = p4runtime_pb2.Entity()
         which_one = entity.WhichOneof('entity')
         if which_one == 'direct_counter_entry':
-            data = entity.direct_counter_entry.data
+            key_entity.direct_counter_entry.table_entry.ParseFromString(EntityHelper.get_table_entry_key(entity.direct_counter_entry.table_entry))
         elif which_one == 'counter_entry':
-            data = entity.counter_entry.data
+            key_entity.counter_entry.counter_id = entity.counter_entry.counter_id
+            key_entity.counter_entry.index.CopyFrom(entity.counter_entry.index)
         else:
             raise Exception(f'Here only counter entry should arrive: {which_one}')
+        return key_entity.SerializeToString(deterministic=True)
 
+    @staticmethod
+    def is_counter_entity_data_empty(entity: p4runtime_pb2) -> bool:
+        data = EntityHelper.get_counter_data(entity)
         return data.packet_count == 0 and data.byte_count == 0
 
     @classmethod
     def is_table_id_and_match_equals(cls, table_entry1: p4runtime_pb2.TableEntry, table_entry2: p4runtime_pb2.TableEntry) -> bool:
-        if table_entry1.table_id != table_entry2.table_id:
-            return False
+        return cls.get_table_entry_match_key(table_entry1) == cls.get_table_entry_match_key(table_entry2)
+
+
+class EntityMerger:
+    """Merges the entities of read answers one by one, as they arrive from the targets.
+
+    Entities with the same custom identifier are merged into the first one: counter data is summed,
+    every other entity has to be the same on all targets.
+    """
+    def __init__(self) -> None:
+        self._merged_entities: Dict[Hashable, p4runtime_pb2.Entity] = {}
+        # The serialized first entity, the later ones are compared to it
+        self._serialized_entities: Dict[Hashable, bytes] = {}
+
+    def __len__(self) -> int:
+        return len(self._merged_entities)
 
-        for match1, match2 in zip(table_entry1.match, table_entry2.match):
-            if MessageToJson(match1) != MessageToJson(match2):
-                return False
+    def add(self, entity: p4runtime_pb2.Entity) -> None:
+        self._add(calculate_read_entity_custom_identifier(entity), entity)
 
-        return True
+    def merge_known_entities_from(self, other: 'EntityMerger') -> List[p4runtime_pb2.Entity]:
+        """Merges the entities of the other merger that have a mergable entity here, returns the merged ones.
+
+        The keys of the other merger are not calculated again, so this is a dict lookup per entity.
+        """
+        ret = []
+        for identifier, entity in other._merged_entities.items():
+            if identifier in self._merged_entities:
+                self._add(identifier, entity)
+                ret.append(entity)
+        return ret
+
+    def _add(self, identifier: Hashable, entity: p4runtime_pb2.Entity) -> None:
+        first_entity = self._merged_entities.get(identifier)
+        if first_entity is None:
+            self._merged_entities[identifier] = entity
+            return
+
+        which_one = first_entity.WhichOneof('entity')
+        if which_one in ['table_entry', 'meter_entry', 'direct_meter_entry']:
+            if identifier not in self._serialized_entities:
+                self._serialized_entities[identifier] = self._serialize_with_sorted_match(first_entity)
+            if self._serialized_entities[identifier] != self._serialize_with_sorted_match(entity):
+                raise Exception(f'Cannot merge, because responses are differs on different targets {[first_entity, entity]}')
+        elif which_one == 'counter_entry':
+            first_entity.counter_entry.data.byte_count += entity.counter_entry.data.byte_count
+            first_entity.counter_entry.data.packet_count += entity.counter_entry.data.packet_count
+        elif which_one == 'direct_counter_entry':
+            first_entity.direct_counter_entry.data.byte_count += entity.direct_counter_entry.data.byte_count
+            first_entity.direct_counter_entry.data.packet_count += entity.direct_counter_entry.data.packet_count
+        else:
+            raise NotImplementedError(f'{which_one} is not handled by read feedback')
+
+    @staticmethod
+    def _serialize_with_sorted_match(entity: p4runtime_pb2.Entity) -> bytes:
+        """The targets can answer the match fields in any order, they are compared sorted by field id."""
+        sorted_entity = p4runtime_pb2.Entity()
+        sorted_entity.CopyFrom(entity)
+        which_one = sorted_entity.WhichOneof('entity')
+        if which_one == 'table_entry':
+            table_entry = sorted_entity.table_entry
+        elif which_one == 'direct_meter_entry':
+            table_entry = sorted_entity.direct_meter_entry.table_entry
+        else:
+            return entity.SerializeToString(deterministic=True)
 
+        sorted_match = sorted(table_entry.match, key=lambda match: match.field_id)
+        del table_entry.match[:]
+        table_entry.match.extend(sorted_match)
+        return sorted_entity.SerializeToString(deterministic=True)
 
+    def get_entities(self) -> List[p4runtime_pb2.Entity]:
+        return list(self._merged_entities.values())
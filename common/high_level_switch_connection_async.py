@@ -1,9 +1,10 @@
 import asyncio
+import logging
 import time
 from abc import abstractmethod
 from collections import deque
-from dataclasses import dataclass
-from typing import Any
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Deque, Dict, Sequence, Set, Tuple
 
 from google.protobuf.text_format import MessageToString
 from p4.v1 import p4runtime_pb2
@@ -18,11 +19,18 @@ from typing import Optional, List, Union
 import grpc
 from p4.v1 import p4runtime_pb2, p4runtime_pb2_grpc
 
+from common.counter_history import CounterHistory
+from common.entity_helper import EntityHelper
 from common.enviroment import enviroment_settings
+from common.p4runtime_lib.error_utils import parseGrpcErrorBinaryDetails, P4RuntimeErrorFormatException
+
+logger = logging.getLogger(__name__)
 
 # List of all active connections
 connections = []
 
+DEFAULT_MAX_IN_FLIGHT_WRITES = 64
+
 def ShutdownAllSwitchConnections():
     for c in connections:
         c.shutdown()
@@ -114,12 +122,319 @@ class RateLimitedP4RuntimeStub:
         self.rate_limiter.reset()
 
 
+@dataclass
+class WriteFailure:
+    updates: Sequence[p4runtime_pb2.Update]
+    error: Exception
+    # (index in updates, error) pairs, if the target reported the errors per update
+    update_errors: List[Tuple[int, p4runtime_pb2.Error]]
+
+
+@dataclass
+class WriteWindowStats:
+    max_in_flight: int
+    in_flight: int
+    completed_writes: int
+    completed_updates: int
+    failed_writes: int
+    failed_updates: int
+    last_ack_latency: float
+    avg_ack_latency: float
+    max_ack_latency: float
+
+
+class WriteWindow:
+    """Limits the Write RPCs in flight to one target and tracks their acknowledgements.
+
+    submit() returns as soon as there is room in the window, so the caller does not wait for the
+    target, but it is slowed down when the target cannot keep up. The room is given in submit order.
+    If ordered, every write is sent only after the previous one is acknowledged, so the target applies them
+    in submit order (e.g. a MODIFY after the INSERT of the same entry) and only the acknowledgements to
+    the callers overlap. Otherwise the writes in flight are not ordered, the target can apply a later write first.
+    """
+    def __init__(self, max_in_flight: int = DEFAULT_MAX_IN_FLIGHT_WRITES, ordered: bool = True, max_failures_kept: int = 100) -> None:
+        self.max_in_flight = max_in_flight
+        self.ordered = ordered
+        # The submitters waiting for room, woken in submit order
+        self._room_waiters: Deque[asyncio.Future] = deque()
+        # The last submitted write, the next one is chained after it if ordered
+        self._last_task: Optional[asyncio.Task] = None
+        self._tasks: Set[asyncio.Task] = set()
+
+        self.in_flight = 0
+        self.completed_writes = 0
+        self.completed_updates = 0
+        self.failed_writes = 0
+        self.failed_updates = 0
+        self.last_ack_latency = 0.0
+        self.max_ack_latency = 0.0
+        self._sum_ack_latency = 0.0
+        self.failures: Deque[WriteFailure] = deque(maxlen=max_failures_kept)
+
+    async def submit(self,
+                     update_num: int,
+                     write: Callable[[], Awaitable[None]],
+                     get_updates: Callable[[], Sequence[p4runtime_pb2.Update]]) -> asyncio.Task:
+        """Starts write() once there is room in the window and returns the task of it.
+
+        The task raises the error of the write, but it does not have to be awaited, the failure is kept in failures anyway.
+        get_updates is called only if the write fails, to keep the failed updates.
+        """
+        await self._wait_for_room()
+        previous_task = self._last_task if self.ordered else None
+        task = asyncio.ensure_future(self._tracked_write(update_num, write, get_updates, previous_task))
+        self._last_task = task
+        self._tasks.add(task)
+        task.add_done_callback(self._on_write_done)
+        return task
+
+    async def drain(self) -> None:
+        """Waits until every submitted write is acknowledged."""
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def get_stats(self) -> WriteWindowStats:
+        acknowledged_writes = self.completed_writes + self.failed_writes
+        return WriteWindowStats(
+            max_in_flight=self.max_in_flight,
+            in_flight=self.in_flight,
+            completed_writes=self.completed_writes,
+            completed_updates=self.completed_updates,
+            failed_writes=self.failed_writes,
+            failed_updates=self.failed_updates,
+            last_ack_latency=self.last_ack_latency,
+            avg_ack_latency=self._sum_ack_latency / acknowledged_writes if acknowledged_writes > 0 else 0.0,
+            max_ack_latency=self.max_ack_latency,
+        )
+
+    async def _wait_for_room(self) -> None:
+        if self.in_flight < self.max_in_flight and len(self._room_waiters) == 0:
+            self.in_flight += 1
+            return
+
+        room = asyncio.get_event_loop().create_future()
+        self._room_waiters.append(room)
+        try:
+            # The finished write passes its place in the window (in_flight is not decreased), see _release_room
+            await room
+        except asyncio.CancelledError:
+            if room.done() and not room.cancelled():
+                self._release_room()
+            else:
+                self._room_waiters.remove(room)
+            raise
+
+    def _release_room(self) -> None:
+        while len(self._room_waiters) > 0:
+            room = self._room_waiters.popleft()
+            if not room.done():
+                room.set_result(None)
+                return
+        self.in_flight -= 1
+
+    async def _tracked_write(self,
+                             update_num: int,
+                             write: Callable[[], Awaitable[None]],
+                             get_updates: Callable[[], Sequence[p4runtime_pb2.Update]],
+                             previous_task: Optional[asyncio.Task] = None) -> None:
+        if previous_task is not None and not previous_task.done():
+            # A failed previous write does not stop this one, like the writes of a controller without the proxy
+            await asyncio.wait([previous_task])
+        start_time = time.monotonic()
+        try:
+            await write()
+            self.completed_writes += 1
+            self.completed_updates += update_num
+        except Exception as e:
+            self._record_failure(update_num, get_updates(), e)
+            raise
+        finally:
+            ack_latency = time.monotonic() - start_time
+            self.last_ack_latency = ack_latency
+            self._sum_ack_latency += ack_latency
+            self.max_ack_latency = max(self.max_ack_latency, ack_latency)
+            self._release_room()
+
+    def _record_failure(self, update_num: int, updates: Sequence[p4runtime_pb2.Update], error: Exception) -> None:
+        update_errors = []
+        if isinstance(error, grpc.aio.AioRpcError):
+            try:
+                update_errors = parseGrpcErrorBinaryDetails(error) or []
+            except P4RuntimeErrorFormatException:
+                pass
+
+        self.failed_writes += 1
+        self.failed_updates += len(update_errors) if len(update_errors) > 0 else update_num
+        self.failures.append(WriteFailure(updates, error, update_errors))
+        logger.error(f'Write of {update_num} updates failed: {error}')
+
+    def _on_write_done(self, task: asyncio.Task) -> None:
+        self._tasks.discard(task)
+        if not task.cancelled():
+            # The failure is recorded already, this only marks the exception as retrieved for unawaited tasks
+            task.exception()
+
+
+@dataclass
+class CounterInterest:
+    """Target ids of the counters and of the tables of the direct counters a subscriber reads."""
+    counter_ids: Set[int] = field(default_factory=set)
+    direct_counter_table_ids: Set[int] = field(default_factory=set)
+
+
+@dataclass
+class CounterPollerStats:
+    subscriptions: int
+    reads: int
+    # Counter reads of the subscribers answered by a read made for another subscriber
+    shared_reads: int
+
+
+class CounterSubscription:
+    def __init__(self, interest: CounterInterest) -> None:
+        self.interest = interest
+        self.entities: List[p4runtime_pb2.Entity] = []
+        self.polled_at: Optional[float] = None
+
+
+class CounterPoller:
+    """Reads the counters of one switch for every subscriber, e.g. the proxy servicers of the sources mapped to it.
+
+    One Read asks for the counters of all subscribers and the answer is split among them by their interest.
+    A subscriber gets the result of a read started at most max_age before it asked, or after it, instead of reading
+    the switch again, so the read load of the switch does not grow with the number of subscribers. With max_age=0
+    a read already in flight is too old, the subscriber waits for it and then joins the next read with the others waiting.
+
+    With a history the counters are also polled every poll_interval and every read is recorded in it,
+    so the counter rates are calculated without reading the switch.
+    """
+    def __init__(self, connection: 'SwitchConnection', history_depth: Optional[int] = None, poll_interval: float = 1.0) -> None:
+        self.connection = connection
+        self.history: Optional[CounterHistory] = None if history_depth is None else CounterHistory(history_depth)
+        self.poll_interval = poll_interval
+        self._subscriptions: List[CounterSubscription] = []
+        self._in_flight_poll: Optional[asyncio.Task] = None
+        self._poll_loop_task: Optional[asyncio.Task] = None
+        self.last_polled_at: Optional[float] = None
+        self.reads = 0
+        self.shared_reads = 0
+
+    def start(self) -> None:
+        if self.history is not None and self._poll_loop_task is None:
+            self._poll_loop_task = asyncio.ensure_future(self._poll_loop())
+
+    def stop(self) -> None:
+        if self._poll_loop_task is not None:
+            self._poll_loop_task.cancel()
+            self._poll_loop_task = None
+
+    def subscribe(self, interest: CounterInterest) -> CounterSubscription:
+        subscription = CounterSubscription(interest)
+        self._subscriptions.append(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: CounterSubscription) -> None:
+        if subscription in self._subscriptions:
+            self._subscriptions.remove(subscription)
+
+    async def read(self, subscription: CounterSubscription, max_age: float = 0.0) -> List[p4runtime_pb2.Entity]:
+        """Returns the counter entities of the subscription from a read started at most max_age seconds before the call, or after it.
+
+        The entities are shared with the other subscribers, they have to be copied before they are modified.
+        """
+        oldest_accepted = time.monotonic() - max_age
+        shared = True
+        while subscription.polled_at is None or subscription.polled_at < oldest_accepted:
+            if subscription not in self._subscriptions:
+                raise Exception('Cannot read the counters of a cancelled subscription')
+
+            if self._in_flight_poll is None or self._in_flight_poll.done():
+                shared = False
+            await asyncio.shield(self._get_or_start_poll())
+
+        if shared:
+            self.shared_reads += 1
+        return subscription.entities
+
+    def get_stats(self) -> CounterPollerStats:
+        return CounterPollerStats(subscriptions=len(self._subscriptions), reads=self.reads, shared_reads=self.shared_reads)
+
+    def _get_or_start_poll(self) -> asyncio.Task:
+        if self._in_flight_poll is None or self._in_flight_poll.done():
+            self._in_flight_poll = asyncio.ensure_future(self._poll())
+            self._in_flight_poll.add_done_callback(self._on_poll_done)
+        return self._in_flight_poll
+
+    async def _poll_loop(self) -> None:
+        while True:
+            if len(self._subscriptions) > 0 and (self.last_polled_at is None or self.last_polled_at <= time.monotonic() - self.poll_interval):
+                try:
+                    await asyncio.shield(self._get_or_start_poll())
+                except Exception as e:
+                    logger.warning(f'Counter poll of {self.connection.address} failed: {e}')
+
+            # A read of a subscriber counts as a poll too
+            next_poll_at = time.monotonic() + self.poll_interval if self.last_polled_at is None else self.last_polled_at + self.poll_interval
+            await asyncio.sleep(max(next_poll_at - time.monotonic(), 0.01))
+
+    async def _poll(self) -> None:
+        subscriptions = list(self._subscriptions)
+        polled_at = time.monotonic()
+
+        subscriptions_by_counter_id: Dict[int, List[CounterSubscription]] = {}
+        subscriptions_by_table_id: Dict[int, List[CounterSubscription]] = {}
+        for subscription in subscriptions:
+            for counter_id in subscription.interest.counter_ids:
+                subscriptions_by_counter_id.setdefault(counter_id, []).append(subscription)
+            for table_id in subscription.interest.direct_counter_table_ids:
+                subscriptions_by_table_id.setdefault(table_id, []).append(subscription)
+
+        request = p4runtime_pb2.ReadRequest()
+        request.device_id = self.connection.device_id
+        for table_id in sorted(subscriptions_by_table_id.keys()):
+            request.entities.add().direct_counter_entry.table_entry.table_id = table_id
+        # Only the counters of the subscribers are read, not every counter of the switch
+        for counter_id in sorted(subscriptions_by_counter_id.keys()):
+            request.entities.add().counter_entry.counter_id = counter_id
+
+        entities_by_subscription: Dict[CounterSubscription, List[p4runtime_pb2.Entity]] = {subscription: [] for subscription in subscriptions}
+        if len(request.entities) > 0:
+            self.reads += 1
+            async for response in self.connection.client_stub.Read(request):
+                for entity in response.entities:
+                    if entity.WhichOneof('entity') == 'counter_entry':
+                        interested_subscriptions = subscriptions_by_counter_id.get(entity.counter_entry.counter_id, [])
+                    else:
+                        interested_subscriptions = subscriptions_by_table_id.get(entity.direct_counter_entry.table_entry.table_id, [])
+                    for subscription in interested_subscriptions:
+                        entities_by_subscription[subscription].append(entity)
+
+        for subscription, entities in entities_by_subscription.items():
+            subscription.entities = entities
+            subscription.polled_at = polled_at
+        self.last_polled_at = polled_at
+
+        if self.history is not None:
+            # The counters of several subscribers are recorded once
+            entities_by_key = {EntityHelper.get_counter_entity_key(entity): entity for entities in entities_by_subscription.values() for entity in entities}
+            counter_data = [EntityHelper.get_counter_data(entity) for entity in entities_by_key.values()]
+            self.history.record(list(entities_by_key.keys()), [data.packet_count for data in counter_data], [data.byte_count for data in counter_data], polled_at)
+
+    def _on_poll_done(self, task: asyncio.Task) -> None:
+        if self._in_flight_poll is task:
+            self._in_flight_poll = None
+        if not task.cancelled():
+            # Raised to the waiting subscribers, this only marks the exception as retrieved if nobody waits
+            task.exception()
+
+
 class SwitchConnection(object):
 
     def __init__(self, name=None, address='127.0.0.1:50051', device_id=0,
                  proto_dump_file=None, rate_limit=None, rate_limiter_buffer_size=None,
                  production_mode=True, p4_config_support=True,
-                 batch_delay: Optional[float] = None):
+                 batch_delay: Optional[float] = None,
+                 max_in_flight_writes: Optional[int] = None,
+                 ordered_writes: bool = True):
         self.name = name
         self.address = address
         self.device_id = device_id
@@ -139,6 +454,17 @@ class SwitchConnection(object):
 
         self.batch = []
         self.batch_delay = batch_delay
+        self.write_window = WriteWindow(DEFAULT_MAX_IN_FLIGHT_WRITES if max_in_flight_writes is None else max_in_flight_writes, ordered_writes)
+        # Write RPC that takes the request as bytes, the fields of a message can be concatenated on the wire
+        self.serialized_write = self.channel.unary_unary(
+            '/p4.v1.P4Runtime/Write',
+            request_serializer=None,
+            response_deserializer=p4runtime_pb2.WriteResponse.FromString
+        )
+        write_request_header = p4runtime_pb2.WriteRequest()
+        write_request_header.device_id = self.device_id
+        write_request_header.election_id.low = 1
+        self.serialized_write_request_header = write_request_header.SerializeToString()
         connections.append(self)
 
     async def start(self) -> List[asyncio.Task]:
@@ -320,7 +646,7 @@ class SwitchConnection(object):
         update.entity.direct_meter_entry.CopyFrom(direct_meter_entry)
         await self.client_stub.Write(request)
 
-    async def WriteDigest(self, digest_id: int):
+    async def WriteDigest(self, digest_id: int, max_list_size: int = 1, max_timeout_ns: int = 0, ack_timeout_ns: int = 0):
         request = p4runtime_pb2.WriteRequest()
         request.device_id = self.device_id
         request.election_id.low = 1
@@ -328,17 +654,62 @@ class SwitchConnection(object):
         update.type = p4runtime_pb2.Update.INSERT
         digest_entry = update.entity.digest_entry
         digest_entry.digest_id = digest_id
-        digest_entry.config.max_timeout_ns = 0
-        digest_entry.config.max_list_size = 1
-        digest_entry.config.ack_timeout_ns = 0
+        digest_entry.config.max_timeout_ns = max_timeout_ns
+        digest_entry.config.max_list_size = max_list_size
+        digest_entry.config.ack_timeout_ns = ack_timeout_ns
         await self.client_stub.Write(request)
 
+    async def SendStreamMessage(self, request: p4runtime_pb2.StreamMessageRequest) -> None:
+        await self.requests_stream.put(request)
+
+    async def SendDigestListAck(self, digest_id: int, list_id: int) -> None:
+        request = p4runtime_pb2.StreamMessageRequest()
+        request.digest_ack.digest_id = digest_id
+        request.digest_ack.list_id = list_id
+        await self.SendStreamMessage(request)
+
     async def WriteUpdates(self, updates):
         if self.batch_delay is None:
             await self.WriteUpdates_inner(updates)
         else:
             self.batch.extend(updates)
 
+    async def WriteUpdatesPipelined(self, updates: List[p4runtime_pb2.Update]) -> asyncio.Task:
+        """Sends the updates through the write window, waits only while the window is full."""
+        return await self.write_window.submit(len(updates), lambda: self.WriteUpdates(updates), lambda: updates)
+
+    async def WritePreparedRequest(self, request: p4runtime_pb2.WriteRequest) -> None:
+        """Sends a WriteRequest built by the caller without copying its updates, only device_id and election_id are set."""
+        if self.batch_delay is None:
+            request.device_id = self.device_id
+            request.election_id.low = 1
+            await self.client_stub.Write(request)
+        else:
+            self.batch.extend(request.updates)
+
+    async def WritePreparedRequestPipelined(self, request: p4runtime_pb2.WriteRequest) -> asyncio.Task:
+        """Same as WriteUpdatesPipelined for a WriteRequest built by the caller."""
+        return await self.write_window.submit(len(request.updates), lambda: self.WritePreparedRequest(request), lambda: request.updates)
+
+    async def WriteSerializedUpdates(self, serialized_updates: bytes) -> None:
+        """Sends updates that are already serialized as the updates field of a WriteRequest.
+
+        The serialized updates can be shared by several connections, the request is not parsed again
+        unless it has to go through the rate limiter or the batching.
+        """
+        if self.rate_limit is None and self.batch_delay is None:
+            await self.serialized_write(self.serialized_write_request_header + serialized_updates)
+        else:
+            await self.WritePreparedRequest(p4runtime_pb2.WriteRequest.FromString(serialized_updates))
+
+    async def WriteSerializedUpdatesPipelined(self, serialized_updates: bytes, update_num: int) -> asyncio.Task:
+        """Same as WriteUpdatesPipelined for updates serialized by the caller."""
+        return await self.write_window.submit(
+            update_num,
+            lambda: self.WriteSerializedUpdates(serialized_updates),
+            lambda: p4runtime_pb2.WriteRequest.FromString(serialized_updates).updates
+        )
+
     async def WriteUpdates_inner(self, updates: List[p4runtime_pb2.Entity]):
         request = p4runtime_pb2.WriteRequest()
         request.device_id = self.device_id
@@ -423,7 +794,11 @@ class HighLevelSwitchConnection:
                  production_mode: Optional[bool] = None,
                  p4_config_support: Optional[bool] = None,
                  batch_delay: Optional[float] = None,
-                 host='127.0.0.1'
+                 host='127.0.0.1',
+                 max_in_flight_writes: Optional[int] = None,
+                 ordered_writes: bool = True,
+                 counter_history_depth: Optional[int] = None,
+                 counter_poll_interval: float = 1.0
                  ):
         self.device_id = device_id
         self.filename = filename
@@ -454,10 +829,13 @@ class HighLevelSwitchConnection:
             rate_limiter_buffer_size=rate_limiter_buffer_size,
             production_mode=enviroment_settings.production_mode if production_mode is None else production_mode,
             p4_config_support=enviroment_settings.p4_config_support if p4_config_support is None else p4_config_support,
-            batch_delay=batch_delay
+            batch_delay=batch_delay,
+            max_in_flight_writes=max_in_flight_writes,
+            ordered_writes=ordered_writes
         )
 
         self.stream_subscribed_queues: List[QueueWithInfo] = []
+        self.counter_poller = CounterPoller(self.connection, counter_history_depth, counter_poll_interval)
 
     async def init(self) -> List[asyncio.Task]:
         await self.connection.start()
@@ -485,23 +863,30 @@ class HighLevelSwitchConnection:
                                                bmv2_json_file_path=self.bmv2_file_path)
 
         asyncio.ensure_future(self.proxy_digest_forwarding())
+        self.counter_poller.start()
         return []
 
     async def proxy_digest_forwarding(self) -> None:
+        """Puts every message of the stream to every subscribed queue.
+
+        The same message object is shared by all subscribers, so it must not be modified by them.
+        """
         async for x in self.connection.stream_msg_resp:
             for q in self.stream_subscribed_queues:
-                copy = p4runtime_pb2.StreamMessageResponse()
-                copy.CopyFrom(x)
-                await q.queue.put(StreamMessageResponseWithInfo(copy, q.extra_information))
+                await q.queue.put(StreamMessageResponseWithInfo(x, q.extra_information))
 
     def stop(self) -> None:
-        pass
+        self.counter_poller.stop()
 
     def subscribe_to_stream_with_queue(self, queue: asyncio.Queue, extra_information: Optional[Any] = None) -> None:
         self.stream_subscribed_queues.append(QueueWithInfo(queue, extra_information))
 
     def unsubscribe_from_stream_with_queue(self, queue: asyncio.Queue) -> None:
-        pass
+        # A new list, so a forwarding in progress goes on with the old one
+        self.stream_subscribed_queues = [q for q in self.stream_subscribed_queues if q.queue is not queue]
+        # The forwarding can be blocked on the full queue, nobody reads it anymore
+        while not queue.empty():
+            queue.get_nowait()
 
     def get_address(self) -> str:
         return f'{self.host}:{self.port}'
\ No newline at end of file
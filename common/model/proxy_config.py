@@ -18,6 +18,77 @@ class RedisMode(Enum):
         return redis_mode == RedisMode.READWRITE or redis_mode == RedisMode.ONLY_WRITE
 
 
+class RedisJournalDurability(Enum):
+    AFTER_FLUSH = 'AFTER_FLUSH'
+    IMMEDIATE = 'IMMEDIATE'
+
+
+class RedisStorageFormat(Enum):
+    JSON = 'JSON'
+    BINARY = 'BINARY'
+
+
+class RedisStateLayout(Enum):
+    LOG = 'LOG'
+    KEYED = 'KEYED'
+
+
+class ProxyRedisSettings(BaseModel):
+    storage_format: RedisStorageFormat = RedisStorageFormat.JSON
+    state_layout: RedisStateLayout = RedisStateLayout.LOG
+    durability: RedisJournalDurability = RedisJournalDurability.AFTER_FLUSH
+    journal_max_batch_size: int = 512
+    journal_max_batch_delay: float = 0.002
+    restore_page_size: int = 1000
+    restore_batch_size: int = 500
+    checkpoint_interval: float = 2.0
+    checkpoint_jitter: float = 0.0
+
+
+class ReadPartialResultPolicy(Enum):
+    FAIL = 'FAIL'
+    PARTIAL = 'PARTIAL'
+
+
+class ProxyReadSettings(BaseModel):
+    target_timeout: Optional[float] = None
+    partial_result_policy: ReadPartialResultPolicy = ReadPartialResultPolicy.FAIL
+    coalesce_reads: bool = True
+    # P4Runtime entity type (e.g. counter_entry) -> seconds the answer is reused for identical Read requests
+    cache_ttl: Dict[str, float] = {}
+    # Upper bound of the entities in one streamed ReadResponse
+    max_response_entities: int = 1000
+
+
+class StreamOverflowPolicy(Enum):
+    DROP_OLDEST = 'DROP_OLDEST'
+    DROP_NEWEST = 'DROP_NEWEST'
+    BLOCK = 'BLOCK'
+
+
+class DigestAckMode(Enum):
+    PASS_THROUGH = 'PASS_THROUGH'
+    AUTO = 'AUTO'
+
+
+class ProxyStreamSettings(BaseModel):
+    # Messages kept for one StreamChannel subscriber that has not received them yet
+    subscriber_queue_size: int = 1024
+    overflow_policy: StreamOverflowPolicy = StreamOverflowPolicy.DROP_OLDEST
+    # Seconds the digests of the targets are collected into one DigestList per digest, forwarded one by one if None
+    digest_aggregation_window: Optional[float] = None
+    digest_aggregation_max_list_size: int = 1000
+    suppress_duplicate_digests: bool = False
+    digest_ack_mode: DigestAckMode = DigestAckMode.PASS_THROUGH
+
+
+class ProxyDigestSettings(BaseModel):
+    # Override the DigestEntry config the controller writes, the field of the controller is kept if None
+    max_list_size: Optional[int] = None
+    max_timeout_ns: Optional[int] = None
+    ack_timeout_ns: Optional[int] = None
+
+
 ProxyAllowedParamsDict = Dict[str, List[Union[str, float, Tuple[str, int]]]]
 
 class ProxyConfigTarget(BaseModel):
@@ -31,6 +102,17 @@ class ProxyConfigTarget(BaseModel):
     batch_delay: Optional[float] = None
     host: Optional[str] = '127.0.0.1'
     filter_params_allow_only: Optional[ProxyAllowedParamsDict] = None
+    max_in_flight_writes: Optional[int] = None
+    # The Writes in the window are sent one after the other, so the target applies them in order
+    ordered_writes: bool = True
+    counter_history_depth: Optional[int] = None
+    counter_poll_interval: float = 1.0
+    # Seconds between the reconciliations of the in-memory copy of the tables with the switch, no copy if None
+    shadow_reconcile_interval: Optional[float] = None
+    # Digest name in the program of the target -> batching of the digest on the target
+    digests: Dict[str, ProxyDigestSettings] = {}
+    # Dataplane ports of the target that belong to the source, the packet-outs are routed and the packet-ins are filtered by them
+    packet_ports: Optional[List[int]] = None
 
 
 class ProxyConfigSource(BaseModel):
@@ -38,6 +120,8 @@ class ProxyConfigSource(BaseModel):
     prefix: str = ''
     port: int = Field(validation_alias=AliasChoices('controller_port', 'port'))
     worker_num: int = 10
+    read_settings: ProxyReadSettings = ProxyReadSettings()
+    stream_settings: ProxyStreamSettings = ProxyStreamSettings()
 
 
 class ProxyConfigPreloadEntry(BaseModel):
@@ -56,4 +140,5 @@ class ProxyConfigMapping(BaseModel):
 
 class ProxyConfig(BaseModel):
     redis: RedisMode
+    redis_settings: ProxyRedisSettings = ProxyRedisSettings()
     mappings: List[ProxyConfigMapping]
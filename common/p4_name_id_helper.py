@@ -1,5 +1,6 @@
 from p4.v1 import p4runtime_pb2
-from typing import Dict, Optional
+from p4.config.v1 import p4info_pb2
+from typing import Dict, Optional, Tuple, Union
 
 from common.p4runtime_lib.helper import P4InfoHelper
 
@@ -45,20 +46,145 @@ def get_pure_p4_name(original_table_name : str) -> str:
 
     return f'{p4_name}'
 
+# id_type used by the converter -> the p4info field that holds that kind of entities
+P4INFO_FIELD_BY_ID_TYPE = {
+    'table': 'tables',
+    'meter': 'meters',
+    'action': 'actions',
+    'counter': 'counters',
+    'register': 'registers',
+    'digest': 'digests',
+}
+
+IdTranslationTable = Dict[str, Dict[int, int]]
+
+# The id_type and the source id of the p4info entity that an entity belongs to, see get_entity_routing_key
+EntityRoutingKey = Tuple[str, int]
+
 class P4NameConverter:
     def __init__(self, from_p4info_helper: P4InfoHelper, to_p4info_helper: P4InfoHelper, prefix: str, converts: Optional[Dict[str, str]] = None) -> None:
-        self.source_p4info_helper = from_p4info_helper
-        self.target_p4info_helper = to_p4info_helper
-        self.prefix = prefix
-        self.converts = converts
-        if self.converts is not None:
-            self.reverse_converts = {value: key for key,value in converts.items()}
+        self._source_p4info_helper = from_p4info_helper
+        self._target_p4info_helper = to_p4info_helper
+        self._prefix = prefix
+        self._converts = converts
+        self.rebuild_id_translation_tables()
+
+    @property
+    def source_p4info_helper(self) -> P4InfoHelper:
+        return self._source_p4info_helper
+
+    @source_p4info_helper.setter
+    def source_p4info_helper(self, value: P4InfoHelper) -> None:
+        self._source_p4info_helper = value
+        self.rebuild_id_translation_tables()
+
+    @property
+    def target_p4info_helper(self) -> P4InfoHelper:
+        return self._target_p4info_helper
+
+    @target_p4info_helper.setter
+    def target_p4info_helper(self, value: P4InfoHelper) -> None:
+        self._target_p4info_helper = value
+        self.rebuild_id_translation_tables()
+
+    @property
+    def prefix(self) -> str:
+        return self._prefix
+
+    @prefix.setter
+    def prefix(self, value: str) -> None:
+        self._prefix = value
+        self.rebuild_id_translation_tables()
+
+    @property
+    def converts(self) -> Optional[Dict[str, str]]:
+        return self._converts
+
+    @converts.setter
+    def converts(self, value: Optional[Dict[str, str]]) -> None:
+        self._converts = value
+        self.rebuild_id_translation_tables()
+
+    def rebuild_id_translation_tables(self) -> None:
+        """Precomputes the source->target and target->source id mappings of every convertible entity.
+
+        It has to be called again if the content of the p4info helpers or the converts dict is changed in place,
+        assigning a new value to these attributes rebuilds the tables automatically.
+        """
+        if self._converts is not None:
+            self.reverse_converts = {value: key for key,value in self._converts.items()}
+
+        self.forward_id_table: IdTranslationTable = {}
+        self.reverse_id_table: IdTranslationTable = {}
+        for id_type, p4info_field in P4INFO_FIELD_BY_ID_TYPE.items():
+            self.forward_id_table[id_type] = self._build_id_translation(id_type, self._source_p4info_helper, p4info_field, reverse=False)
+            self.reverse_id_table[id_type] = self._build_id_translation(id_type, self._target_p4info_helper, p4info_field, reverse=True)
+
+        # Metadata ids of the packet-outs (source -> target) and the packet-ins (target -> source),
+        # None if the source or the target has no such controller header
+        self.packet_out_metadata_table = self._build_packet_metadata_translation('packet_out', reverse=False)
+        self.packet_in_metadata_table = self._build_packet_metadata_translation('packet_in', reverse=True)
+
+    def has_same_forward_translation(self, other: 'P4NameConverter') -> bool:
+        """True if the two converters translate every source id to the same target id."""
+        return self.forward_id_table == other.forward_id_table
+
+    def _build_id_translation(self, id_type: str, from_p4info_helper: P4InfoHelper, p4info_field: str, reverse: bool) -> Dict[int, int]:
+        ret = {}
+        for entity in getattr(from_p4info_helper.p4info, p4info_field):
+            try:
+                ret[entity.preamble.id] = self.convert_id_by_names(id_type, entity.preamble.id, reverse, verbose=False)
+            except Exception:
+                # Entities that has no pair on the other side (e.g. other prefix or filtered by names)
+                # are left out, convert_id falls back to the name based conversion that raises the proper error
+                pass
+        return ret
+
+    def _build_packet_metadata_translation(self, controller_header_name: str, reverse: bool) -> Optional[Dict[int, int]]:
+        source_header = self._get_controller_header(self._source_p4info_helper, controller_header_name)
+        target_header = self._get_controller_header(self._target_p4info_helper, prefix_p4_name(controller_header_name, self._prefix))
+        if target_header is None:
+            target_header = self._get_controller_header(self._target_p4info_helper, controller_header_name)
+        if source_header is None or target_header is None:
+            return None
+
+        target_metadata_ids = {metadata.name: metadata.id for metadata in target_header.metadata}
+        ret = {}
+        for metadata in source_header.metadata:
+            target_metadata_id = target_metadata_ids.get(prefix_p4_name(metadata.name, self._prefix), target_metadata_ids.get(metadata.name))
+            if target_metadata_id is None:
+                continue
+            if reverse:
+                ret[target_metadata_id] = metadata.id
+            else:
+                ret[metadata.id] = target_metadata_id
+        return ret
+
+    @staticmethod
+    def _get_controller_header(p4info_helper: P4InfoHelper, name: str) -> Optional[p4info_pb2.ControllerPacketMetadata]:
+        for controller_header in p4info_helper.p4info.controller_packet_metadata:
+            if controller_header.preamble.name == name:
+                return controller_header
+        return None
 
     def convert_id(self,
                    id_type:str,
                    original_id: int,
                    reverse = False,
                    verbose=True) -> int:
+        if not verbose:
+            id_table = self.reverse_id_table if reverse else self.forward_id_table
+            converted_id = id_table[id_type].get(original_id) if id_type in id_table else None
+            if converted_id is not None:
+                return converted_id
+
+        return self.convert_id_by_names(id_type, original_id, reverse, verbose)
+
+    def convert_id_by_names(self,
+                            id_type:str,
+                            original_id: int,
+                            reverse = False,
+                            verbose=True) -> int:
 
         if not reverse:
            from_p4info_helper_inner = self.source_p4info_helper
@@ -187,13 +313,37 @@ class P4NameConverter:
             raise Exception(f'Not implemented type for convert_entity "{which_one}"')
 
 
-    def convert_digest_list(self, digest: p4runtime_pb2.DigestList) -> None:
-        digest.digest_id = self.convert_id('digest', digest.digest_id, reverse=True)
+    def get_source_id(self, id_type: str, target_id: int) -> Optional[int]:
+        """The source id of a target id from the precomputed table, None if the entity does not belong to the source."""
+        return self.reverse_id_table[id_type].get(target_id)
 
-    def convert_stream_response(self, stream_response: p4runtime_pb2.StreamMessageResponse) -> None:
+    def convert_digest_list(self, digest: p4runtime_pb2.DigestList, verbose: bool = False) -> None:
+        digest.digest_id = self.convert_id('digest', digest.digest_id, reverse=True, verbose=verbose)
+
+    def convert_packet_metadata(self, packet: Union[p4runtime_pb2.PacketIn, p4runtime_pb2.PacketOut], reverse: bool = False) -> None:
+        """Translates the metadata ids of a packet-out, or of a packet-in if reverse, the metadata without pair are removed."""
+        metadata_table = self.packet_in_metadata_table if reverse else self.packet_out_metadata_table
+        if metadata_table is None:
+            raise Exception(f'No {"packet_in" if reverse else "packet_out"} controller header in the source or in the target p4info')
+
+        if all(metadata.metadata_id in metadata_table for metadata in packet.metadata):
+            for metadata in packet.metadata:
+                metadata.metadata_id = metadata_table[metadata.metadata_id]
+            return
+
+        translated_metadata = [(metadata_table[metadata.metadata_id], metadata.value) for metadata in packet.metadata if metadata.metadata_id in metadata_table]
+        packet.ClearField('metadata')
+        for metadata_id, value in translated_metadata:
+            metadata = packet.metadata.add()
+            metadata.metadata_id = metadata_id
+            metadata.value = value
+
+    def convert_stream_response(self, stream_response: p4runtime_pb2.StreamMessageResponse, verbose: bool = False) -> None:
         which_one = stream_response.WhichOneof('update')
         if which_one == 'digest':
-            self.convert_digest_list(stream_response.digest)
+            self.convert_digest_list(stream_response.digest, verbose)
+        elif which_one == 'packet':
+            self.convert_packet_metadata(stream_response.packet, reverse=True)
         else:
             raise Exception(f'Not implemented type for convert_stream_response "{which_one}"')
 
@@ -230,6 +380,47 @@ class P4NameConverter:
         else:
             raise Exception(f'Not implemented type for get_entity_name "{which_one}"')
 
+    @staticmethod
+    def get_entity_routing_key(entity: p4runtime_pb2.Entity) -> EntityRoutingKey:
+        which_one = entity.WhichOneof('entity')
+        if which_one == 'table_entry':
+            ret = ('table', entity.table_entry.table_id)
+        elif which_one == 'counter_entry':
+            ret = ('counter', entity.counter_entry.counter_id)
+        elif which_one == 'direct_counter_entry':
+            ret = ('table', entity.direct_counter_entry.table_entry.table_id)
+        elif which_one == 'meter_entry':
+            ret = ('meter', entity.meter_entry.meter_id)
+        elif which_one == 'direct_meter_entry':
+            ret = ('table', entity.direct_meter_entry.table_entry.table_id)
+        elif which_one == 'digest_entry':
+            ret = ('digest', entity.digest_entry.digest_id)
+        else:
+            raise Exception(f'Not implemented type for get_entity_routing_key "{which_one}"')
+
+        if ret[1] == 0:
+            raise EntityCannotHaveZeroId()
+        return ret
+
+    @staticmethod
+    def set_entity_routing_id(entity: p4runtime_pb2.Entity, routing_id: int) -> None:
+        """Sets the id that get_entity_routing_key returns, e.g. to expand a wildcard read with 0 id."""
+        which_one = entity.WhichOneof('entity')
+        if which_one == 'table_entry':
+            entity.table_entry.table_id = routing_id
+        elif which_one == 'counter_entry':
+            entity.counter_entry.counter_id = routing_id
+        elif which_one == 'direct_counter_entry':
+            entity.direct_counter_entry.table_entry.table_id = routing_id
+        elif which_one == 'meter_entry':
+            entity.meter_entry.meter_id = routing_id
+        elif which_one == 'direct_meter_entry':
+            entity.direct_meter_entry.table_entry.table_id = routing_id
+        elif which_one == 'digest_entry':
+            entity.digest_entry.digest_id = routing_id
+        else:
+            raise Exception(f'Not implemented type for set_entity_routing_id "{which_one}"')
+
     @staticmethod
     def get_p4_name_from_id(from_p4info_helper_inner: P4InfoHelper, id_type: str, original_id: int) -> str:
         if id_type == 'table':
@@ -22,6 +22,38 @@ from p4.v1 import p4runtime_pb2
 from .convert import encode
 
 
+# Repeated fields of the P4Info message whose elements carry a preamble
+P4INFO_ENTITY_TYPES = ['tables', 'actions', 'action_profiles', 'counters', 'direct_counters', 'meters',
+                       'direct_meters', 'controller_packet_metadata', 'value_sets', 'registers', 'digests']
+
+
+class P4InfoEntityIndex(object):
+    """Name/alias and id lookup tables for one entity type of a P4Info.
+
+    The first entity wins on collisions, so the lookups return the same object as a
+    linear scan over the repeated field would.
+    """
+    def __init__(self, entities):
+        self.by_name = {}
+        self.by_id = {}
+        for o in entities:
+            pre = o.preamble
+            self.by_name.setdefault(pre.name, o)
+            self.by_name.setdefault(pre.alias, o)
+            self.by_id.setdefault(pre.id, o)
+
+
+class P4InfoFieldIndex(object):
+    """Name and id lookup tables for the match fields of a table or the params of an action."""
+    def __init__(self, fields):
+        self.fields = fields
+        self.by_name = {}
+        self.by_id = {}
+        for f in fields:
+            self.by_name.setdefault(f.name, f)
+            self.by_id.setdefault(f.id, f)
+
+
 class P4InfoHelper(object):
     def __init__(self, p4_info_filepath = None, raw_p4info = None):
         if p4_info_filepath is None and raw_p4info is None:
@@ -38,18 +70,34 @@ class P4InfoHelper(object):
 
         self.p4info = p4info
 
+        self._entity_indexes = {}
+        for entity_type in P4INFO_ENTITY_TYPES:
+            self._entity_indexes[entity_type] = P4InfoEntityIndex(getattr(self.p4info, entity_type))
+
+        self._match_field_indexes = {}
+        for t in self.p4info.tables:
+            self._match_field_indexes.setdefault(t.preamble.name, P4InfoFieldIndex(t.match_fields))
+
+        self._action_param_indexes = {}
+        for a in self.p4info.actions:
+            self._action_param_indexes.setdefault(a.preamble.name, P4InfoFieldIndex(a.params))
+
+    def _get_entity_index(self, entity_type):
+        if entity_type not in self._entity_indexes:
+            self._entity_indexes[entity_type] = P4InfoEntityIndex(getattr(self.p4info, entity_type))
+        return self._entity_indexes[entity_type]
+
     def get(self, entity_type, name=None, id=None):
         if name is not None and id is not None:
             raise AssertionError("name or id must be None")
 
-        for o in getattr(self.p4info, entity_type):
-            pre = o.preamble
-            if name:
-                if (pre.name == name or pre.alias == name):
-                    return o
-            else:
-                if pre.id == id:
-                    return o
+        entity_index = self._get_entity_index(entity_type)
+        if name:
+            o = entity_index.by_name.get(name)
+        else:
+            o = entity_index.by_id.get(id)
+        if o is not None:
+            return o
 
         if name:
             raise AttributeError("Could not find %r of type %s" % (name, entity_type))
@@ -102,22 +150,20 @@ class P4InfoHelper(object):
         return self.get(entity_type, id=id).preamble.alias
 
     def get_match_field(self, table_name, name=None, id=None):
-        for t in self.p4info.tables:
-            pre = t.preamble
-            if pre.name == table_name:
-                if name is None and id is None:
-                    if len(t.match_fields) == 1:
-                        return t.match_fields[0]
-                    else:
-                        raise Exception('You have to set id or name for match field if there are multiple match_fields')
-
-                for mf in t.match_fields:
-                    if name is not None:
-                        if mf.name == name:
-                            return mf
-                    elif id is not None:
-                        if mf.id == id:
-                            return mf
+        field_index = self._match_field_indexes.get(table_name)
+        if field_index is not None:
+            if name is None and id is None:
+                if len(field_index.fields) == 1:
+                    return field_index.fields[0]
+                else:
+                    raise Exception('You have to set id or name for match field if there are multiple match_fields')
+
+            if name is not None:
+                mf = field_index.by_name.get(name)
+            else:
+                mf = field_index.by_id.get(id)
+            if mf is not None:
+                return mf
         raise AttributeError("%r has no attribute %r" % (table_name, name if name is not None else id))
 
     def get_match_field_id(self, table_name, match_field_name):
@@ -167,17 +213,16 @@ class P4InfoHelper(object):
             raise Exception("Unsupported match type with type %r" % match_type)
 
     def get_action_param(self, action_name, name=None, id=None):
-        for a in self.p4info.actions:
-            pre = a.preamble
-            if pre.name == action_name:
-                for p in a.params:
-                    if name is not None:
-                        if p.name == name:
-                            return p
-                    elif id is not None:
-                        if p.id == id:
-                            return p
-        raise AttributeError("action %r has no param %r, (has: %r)" % (action_name, name if name is not None else id, a.params))
+        param_index = self._action_param_indexes.get(action_name)
+        if param_index is not None:
+            if name is not None:
+                p = param_index.by_name.get(name)
+            else:
+                p = param_index.by_id.get(id)
+            if p is not None:
+                return p
+        raise AttributeError("action %r has no param %r, (has: %r)" % (action_name, name if name is not None else id,
+                                                                       param_index.fields if param_index is not None else []))
 
     def get_action_param_id(self, action_name, param_name):
         return self.get_action_param(action_name, name=param_name).id
@@ -21,7 +21,7 @@ from collections import deque
 from datetime import datetime
 from enum import Enum
 from queue import Queue
-from typing import Optional, List, Union
+from typing import Optional, List, Union, Dict
 
 import grpc
 from p4.v1 import p4runtime_pb2, p4runtime_pb2_grpc
@@ -408,7 +408,7 @@ class SwitchConnection(object):
             print(request)
             self.client_stub.Write(request)
 
-    def WriteDigest(self, digest_id: int):
+    def WriteDigest(self, digest_id: int, max_list_size: int = 1, max_timeout_ns: int = 0, ack_timeout_ns: int = 0):
         request = p4runtime_pb2.WriteRequest()
         request.device_id = self.device_id
         request.election_id.low = 1
@@ -416,11 +416,20 @@ class SwitchConnection(object):
         update.type = p4runtime_pb2.Update.INSERT
         digest_entry = update.entity.digest_entry
         digest_entry.digest_id = digest_id
-        digest_entry.config.max_timeout_ns = 0
-        digest_entry.config.max_list_size = 1
-        digest_entry.config.ack_timeout_ns = 0
+        digest_entry.config.max_timeout_ns = max_timeout_ns
+        digest_entry.config.max_list_size = max_list_size
+        digest_entry.config.ack_timeout_ns = ack_timeout_ns
         self.client_stub.Write(request)
 
+    def SendPacketOut(self, payload: bytes, metadata: Dict[int, bytes]):
+        request = p4runtime_pb2.StreamMessageRequest()
+        request.packet.payload = payload
+        for metadata_id, value in metadata.items():
+            packet_metadata = request.packet.metadata.add()
+            packet_metadata.metadata_id = metadata_id
+            packet_metadata.value = value
+        self.requests_stream.put(request)
+
 
     def WritePREEntry(self, pre_entry, dry_run=False):
         request = p4runtime_pb2.WriteRequest()
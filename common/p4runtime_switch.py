@@ -39,6 +39,7 @@ class P4RuntimeSwitch(P4Switch):
                  device_id = None,
                  enable_debugger = False,
                  log_file = None,
+                 cpu_port = None,
                  **kwargs):
         Switch.__init__(self, name, **kwargs)
         assert (sw_path)
@@ -88,6 +89,8 @@ class P4RuntimeSwitch(P4Switch):
             self.device_id = P4Switch.device_id
             P4Switch.device_id += 1
         self.nanomsg = "ipc:///tmp/bm-{}-log.ipc".format(self.device_id)
+        # Port of the packet-ins and packet-outs of the P4Runtime stream, no packet I/O if None
+        self.cpu_port = cpu_port
 
 
     def check_switch_started(self, pid):
@@ -122,6 +125,8 @@ class P4RuntimeSwitch(P4Switch):
             args.append('--thrift-port ' + str(self.thrift_port))
         if self.grpc_port:
             args.append("-- --grpc-server-addr 0.0.0.0:" + str(self.grpc_port))
+            if self.cpu_port is not None:
+                args.append("--cpu-port " + str(self.cpu_port))
         cmd = ' '.join(args)
         info(cmd + "\n")
 
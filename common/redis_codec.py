@@ -0,0 +1,58 @@
+from typing import Type, TypeVar, Union
+
+from google.protobuf.json_format import MessageToJson, Parse
+from google.protobuf.message import Message
+
+from common.model.proxy_config import RedisStorageFormat
+
+# Binary records start with a zero byte, that cannot be the first character of a JSON record,
+# followed by the format version. The rest is the protobuf wire format of the message.
+BINARY_RECORD_MAGIC = b'\x00PB'
+BINARY_RECORD_VERSION = 1
+BINARY_RECORD_HEADER = BINARY_RECORD_MAGIC + bytes([BINARY_RECORD_VERSION])
+
+MessageType = TypeVar('MessageType', bound=Message)
+
+
+class UnknownRedisRecordVersion(Exception):
+    pass
+
+
+def is_binary_redis_record(raw_record: Union[bytes, str]) -> bool:
+    return isinstance(raw_record, bytes) and raw_record.startswith(BINARY_RECORD_MAGIC)
+
+
+def is_redis_record_in_format(raw_record: Union[bytes, str], storage_format: RedisStorageFormat) -> bool:
+    if storage_format == RedisStorageFormat.BINARY:
+        return raw_record[:len(BINARY_RECORD_HEADER)] == BINARY_RECORD_HEADER
+    return not is_binary_redis_record(raw_record)
+
+
+def encode_redis_record(message: Message, storage_format: RedisStorageFormat) -> Union[bytes, str]:
+    if storage_format == RedisStorageFormat.BINARY:
+        return BINARY_RECORD_HEADER + message.SerializeToString()
+    elif storage_format == RedisStorageFormat.JSON:
+        return MessageToJson(message)
+    else:
+        raise Exception(f'Unknown redis storage format {storage_format}')
+
+
+def decode_redis_record(raw_record: Union[bytes, str], message_class: Type[MessageType]) -> MessageType:
+    """Parses a record stored by encode_redis_record in any of the storage formats."""
+    if is_binary_redis_record(raw_record):
+        version = raw_record[len(BINARY_RECORD_MAGIC)]
+        if version != BINARY_RECORD_VERSION:
+            raise UnknownRedisRecordVersion(f'Cannot decode binary redis record with version {version}')
+        message = message_class()
+        message.ParseFromString(raw_record[len(BINARY_RECORD_HEADER):])
+        return message
+
+    return Parse(raw_record, message_class())
+
+
+def redis_record_to_json(raw_record: Union[bytes, str], message_class: Type[Message]) -> str:
+    if is_binary_redis_record(raw_record):
+        return MessageToJson(decode_redis_record(raw_record, message_class))
+    if isinstance(raw_record, bytes):
+        return raw_record.decode('utf8')
+    return raw_record
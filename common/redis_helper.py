@@ -4,10 +4,17 @@ import time
 from dataclasses import dataclass
 from enum import Enum
 from pprint import pprint
-from typing import List
+from typing import List, Optional, Type, AsyncIterator
 
 import redis
+from redis import Redis
+from redis.asyncio import Redis as AsyncRedis
+from google.protobuf.message import Message
+from p4.v1 import p4runtime_pb2
 
+from common.entity_helper import EntityHelper
+from common.model.proxy_config import RedisStorageFormat
+from common.redis_codec import redis_record_to_json, is_redis_record_in_format, decode_redis_record, encode_redis_record
 from common.validator_tools import diff_strings
 from common.sync import wait_for_condition_blocking
 
@@ -16,20 +23,24 @@ redis = redis.Redis()
 class RedisFieldType(Enum):
     LIST = 'LIST'
     STRING = 'STRING'
+    HASH = 'HASH'
 
 @dataclass
 class RedisRecord:
     postfix: str
     type: RedisFieldType
+    message_class: Optional[Type[Message]] = None
 
 @dataclass
 class RedisRecords:
-    TABLE_ENTRIES: RedisRecord = RedisRecord(postfix='TABLE_ENTRIES', type=RedisFieldType.LIST)
+    TABLE_ENTRIES: RedisRecord = RedisRecord(postfix='TABLE_ENTRIES', type=RedisFieldType.LIST, message_class=p4runtime_pb2.Update)
     P4INFO: RedisRecord = RedisRecord(postfix='P4INFO', type=RedisFieldType.STRING)
-    COUNTER_ENTRIES: RedisRecord = RedisRecord(postfix='COUNTER_ENTRIES', type=RedisFieldType.LIST)
-    METER_ENTRIES: RedisRecord = RedisRecord(postfix='METER_ENTRIES', type=RedisFieldType.LIST)
+    COUNTER_ENTRIES: RedisRecord = RedisRecord(postfix='COUNTER_ENTRIES', type=RedisFieldType.LIST, message_class=p4runtime_pb2.Entity)
+    METER_ENTRIES: RedisRecord = RedisRecord(postfix='METER_ENTRIES', type=RedisFieldType.LIST, message_class=p4runtime_pb2.Entity)
     HEARTBEAT: RedisRecord = RedisRecord(postfix='HEARTBEAT', type=RedisFieldType.STRING)
-    REMOVED_COUNTER_ENTRIES: RedisRecord = RedisRecord(postfix='REMOVED_COUNTER_ENTRIES', type=RedisFieldType.LIST)
+    REMOVED_COUNTER_ENTRIES: RedisRecord = RedisRecord(postfix='REMOVED_COUNTER_ENTRIES', type=RedisFieldType.LIST, message_class=p4runtime_pb2.Entity)
+    TABLE_STATE: RedisRecord = RedisRecord(postfix='TABLE_STATE', type=RedisFieldType.HASH, message_class=p4runtime_pb2.Update)
+    COUNTER_STATE: RedisRecord = RedisRecord(postfix='COUNTER_STATE', type=RedisFieldType.HASH, message_class=p4runtime_pb2.Entity)
 
 @dataclass
 class RedisKeys:
@@ -39,6 +50,116 @@ class RedisKeys:
     METER_ENTRIES: str
     HEARTBEAT: str
     REMOVED_COUNTER_ENTRIES: str
+    TABLE_STATE: str
+    COUNTER_STATE: str
+
+def get_redis_record_by_key(redis_key: str) -> Optional[RedisRecord]:
+    # The longest matching postfix wins, so REMOVED_COUNTER_ENTRIES is not taken as COUNTER_ENTRIES
+    ret = None
+    for redis_record_field in dataclasses.fields(RedisRecords()):
+        redis_record = redis_record_field.default
+        if redis_key.endswith(redis_record.postfix) and (ret is None or len(redis_record.postfix) > len(ret.postfix)):
+            ret = redis_record
+    return ret
+
+
+def decode_redis_value_to_json(redis_key: str, raw_value: bytes) -> str:
+    redis_record = get_redis_record_by_key(redis_key)
+    if redis_record is None or redis_record.message_class is None:
+        return raw_value.decode('utf8')
+    return redis_record_to_json(raw_value, redis_record.message_class)
+
+
+def migrate_redis_list_storage_format(redis_client: Redis,
+                                      redis_key: str,
+                                      message_class: Type[Message],
+                                      storage_format: RedisStorageFormat) -> int:
+    """Rewrites the records of a redis list into the given storage format.
+
+    Returns the number of records that had to be converted, the list is left untouched if it is 0.
+    """
+    raw_records = redis_client.lrange(redis_key, 0, -1)
+    converted_num = sum(1 for raw_record in raw_records if not is_redis_record_in_format(raw_record, storage_format))
+    if converted_num == 0:
+        return 0
+
+    with redis_client.pipeline() as pipe:
+        pipe.multi()
+        pipe.delete(redis_key)
+        for raw_record in raw_records:
+            pipe.rpush(redis_key, encode_redis_record(decode_redis_record(raw_record, message_class), storage_format))
+        pipe.execute()
+
+    return converted_num
+
+
+def migrate_redis_hash_storage_format(redis_client: Redis,
+                                      redis_key: str,
+                                      message_class: Type[Message],
+                                      storage_format: RedisStorageFormat) -> int:
+    """Same as migrate_redis_list_storage_format for the values of a redis hash."""
+    raw_records = redis_client.hgetall(redis_key)
+    records_to_convert = {field: raw_record for field, raw_record in raw_records.items() if not is_redis_record_in_format(raw_record, storage_format)}
+    if len(records_to_convert) == 0:
+        return 0
+
+    redis_client.hset(redis_key, mapping={
+        field: encode_redis_record(decode_redis_record(raw_record, message_class), storage_format)
+        for field, raw_record in records_to_convert.items()
+    })
+
+    return len(records_to_convert)
+
+
+def compact_table_entries_log(redis_client: Redis,
+                              log_key: str,
+                              state_key: str,
+                              storage_format: RedisStorageFormat) -> int:
+    """Replays the TABLE_ENTRIES update log into the keyed TABLE_STATE hash and deletes the log.
+
+    The log can only be written after the hash (the hash is compacted again when the KEYED layout starts),
+    so the log is replayed on top of the entries already in the hash.
+    Returns the number of updates in the log.
+    """
+    raw_records = redis_client.lrange(log_key, 0, -1)
+    if len(raw_records) == 0:
+        return 0
+
+    live_updates = EntityHelper.collapse_table_entry_updates(decode_redis_record(raw_record, p4runtime_pb2.Update) for raw_record in redis_client.hvals(state_key))
+    EntityHelper.collapse_table_entry_updates((decode_redis_record(raw_record, p4runtime_pb2.Update) for raw_record in raw_records), live_updates)
+    with redis_client.pipeline() as pipe:
+        pipe.multi()
+        pipe.delete(state_key)
+        for key, update in live_updates.items():
+            pipe.hset(state_key, key, encode_redis_record(update, storage_format))
+        pipe.delete(log_key)
+        pipe.execute()
+
+    return len(raw_records)
+
+
+async def iter_redis_list_pages(redis_client: AsyncRedis, redis_key: str, page_size: int) -> AsyncIterator[List[bytes]]:
+    """Reads a redis list page by page, so a long list is not loaded with one LRANGE."""
+    start = 0
+    while True:
+        page = await redis_client.lrange(redis_key, start, start + page_size - 1)
+        if len(page) > 0:
+            yield page
+        if len(page) < page_size:
+            return
+        start += page_size
+
+
+async def iter_redis_hash_pages(redis_client: AsyncRedis, redis_key: str, page_size: int) -> AsyncIterator[List[bytes]]:
+    """Reads the values of a redis hash with HSCAN, page_size is a hint for the server."""
+    cursor = 0
+    while True:
+        cursor, page = await redis_client.hscan(redis_key, cursor, count=page_size)
+        if len(page) > 0:
+            yield list(page.values())
+        if cursor == 0:
+            return
+
 
 def json_equals(actual_value: str, expected_value: str, verbose_on_fail=False) -> bool:
     try:
@@ -82,10 +203,10 @@ def compare_redis(redis_file: str) -> bool:
                     if raw_result is None:
                         print(f'{redis_key} key not exists!')
                         success = False
-                    elif not json_equals(raw_result.decode('utf8'), data_one_record, verbose_on_fail=True):
+                    elif not json_equals(decode_redis_value_to_json(redis_key, raw_result), data_one_record, verbose_on_fail=True):
                         print(f'{redis_key} at {index} index differs from the expected!')
                         print('------ REDIS DATA')
-                        print(raw_result.decode('utf8'))
+                        print(decode_redis_value_to_json(redis_key, raw_result))
                         print('------ EXPECTED')
                         print(data_one_record)
 
@@ -93,6 +214,19 @@ def compare_redis(redis_file: str) -> bool:
                     else:
                         print(f'{redis_key} OK')
 
+            if "hash" in table_obj:
+                raw_hash = redis.hgetall(redis_key)
+                for field_hex, data_one_record in table_obj["hash"].items():
+                    raw_result = raw_hash.get(bytes.fromhex(field_hex))
+                    if raw_result is None:
+                        print(f'{redis_key} key does not contain {field_hex}!')
+                        success = False
+                    elif not json_equals(decode_redis_value_to_json(redis_key, raw_result), data_one_record, verbose_on_fail=True):
+                        print(f'{redis_key} at {field_hex} field differs from the expected!')
+                        success = False
+                    else:
+                        print(f'{redis_key} OK')
+
             if "string" in table_obj:
                 raw_result = redis.get(redis_key)
                 if raw_result is None:
@@ -140,7 +274,9 @@ def save_redis_to_json_file(redis_file: str) -> None:
                 if redis_record_field.default.type == RedisFieldType.STRING:
                     output_row['string'] = redis.get(redis_key).decode('utf8')
                 elif redis_record_field.default.type == RedisFieldType.LIST:
-                    output_row['list'] = [x.decode('utf8') for x in redis.lrange(redis_key, 0, -1)]
+                    output_row['list'] = [decode_redis_value_to_json(redis_key, x) for x in redis.lrange(redis_key, 0, -1)]
+                elif redis_record_field.default.type == RedisFieldType.HASH:
+                    output_row['hash'] = {field.hex(): decode_redis_value_to_json(redis_key, x) for field, x in redis.hgetall(redis_key).items()}
                 else:
                     raise Exception(f'Cannot store {redis_key} field, because of unknown type of {redis_record_field.default.type}')
 
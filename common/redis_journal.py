@@ -0,0 +1,187 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from typing import Any, List, Optional, Tuple
+
+import redis.asyncio
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class RedisJournalRecord:
+    command: Optional[str]
+    key: Optional[str] = None
+    args: Tuple[Any, ...] = ()
+    # Sequence number of the record, of a flush marker the sequence number of the next record
+    sequence: int = 0
+    # Set only for flush markers, resolved when every record from flushed_since to the marker is in redis
+    flushed: Optional[asyncio.Future] = None
+    flushed_since: int = 0
+
+
+@dataclass
+class RedisJournalStats:
+    queue_depth: int
+    flush_count: int
+    flushed_records: int
+    failed_records: int
+    last_flush_latency: float
+    avg_flush_latency: float
+    max_flush_latency: float
+
+
+class RedisJournalWriter:
+    """Group commits redis commands in pipelined batches from a background task.
+
+    append() never blocks, the records are collected until max_batch_size records are waiting
+    or max_batch_delay seconds passed since the first record of the batch, then the whole batch is
+    sent in one non-transactional pipeline. The order of the records is kept.
+
+    Every record gets a sequence number. A flush covers the records from a sequence number up to the flush and
+    fails if any of them failed, even if they were written in an earlier batch than the flush marker.
+    """
+    def __init__(self, redis_client: redis.asyncio.Redis, max_batch_size: int = 512, max_batch_delay: float = 0.002) -> None:
+        self.redis_client = redis_client
+        self.max_batch_size = max_batch_size
+        self.max_batch_delay = max_batch_delay
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._writer_task: Optional[asyncio.Task] = None
+        self._next_sequence = 0
+        # The records since the previous flush are covered by a flush without since
+        self._last_flush_sequence = 0
+        self._highest_failed_sequence = -1
+        self._last_error: Optional[Exception] = None
+
+        self.flush_count = 0
+        self.flushed_records = 0
+        self.failed_records = 0
+        self.last_flush_latency = 0.0
+        self.max_flush_latency = 0.0
+        self._sum_flush_latency = 0.0
+
+    def start(self) -> None:
+        if self._writer_task is None or self._writer_task.done():
+            if self._queue is None:
+                self._queue = asyncio.Queue()
+            self._writer_task = asyncio.ensure_future(self._writer_loop())
+
+    async def stop(self) -> None:
+        if self._writer_task is None:
+            return
+        await self.flush()
+        self._writer_task.cancel()
+        try:
+            await self._writer_task
+        except asyncio.CancelledError:
+            pass
+        self._writer_task = None
+
+    @property
+    def next_sequence(self) -> int:
+        """Sequence number of the next appended record."""
+        return self._next_sequence
+
+    def append(self, command: str, key: str, *args: Any) -> int:
+        """Queues a redis command and returns its sequence number."""
+        self.start()
+        sequence = self._next_sequence
+        self._next_sequence += 1
+        self._queue.put_nowait(RedisJournalRecord(command, key, args, sequence=sequence))
+        return sequence
+
+    def queue_flush(self, since: Optional[int] = None) -> asyncio.Future:
+        """Queues a flush marker right away, the returned future is resolved like flush.
+
+        since is the sequence number of the first covered record, by default the first record after the previous flush.
+        """
+        self.start()
+        if since is None:
+            since = self._last_flush_sequence
+        self._last_flush_sequence = self._next_sequence
+        flushed = asyncio.get_event_loop().create_future()
+        self._queue.put_nowait(RedisJournalRecord(None, sequence=self._next_sequence, flushed=flushed, flushed_since=since))
+        return flushed
+
+    async def flush(self, since: Optional[int] = None) -> None:
+        """Waits until every record appended before the call is written to redis.
+
+        Raises the redis error if any record from since (see queue_flush) to the call failed.
+        """
+        await self.queue_flush(since)
+
+    @property
+    def queue_depth(self) -> int:
+        return 0 if self._queue is None else self._queue.qsize()
+
+    def get_stats(self) -> RedisJournalStats:
+        return RedisJournalStats(
+            queue_depth=self.queue_depth,
+            flush_count=self.flush_count,
+            flushed_records=self.flushed_records,
+            failed_records=self.failed_records,
+            last_flush_latency=self.last_flush_latency,
+            avg_flush_latency=self._sum_flush_latency / self.flush_count if self.flush_count > 0 else 0.0,
+            max_flush_latency=self.max_flush_latency,
+        )
+
+    async def _collect_batch(self) -> List[RedisJournalRecord]:
+        batch = [await self._queue.get()]
+        deadline = time.monotonic() + self.max_batch_delay
+        while len(batch) < self.max_batch_size:
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                continue
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+
+        return batch
+
+    async def _writer_loop(self) -> None:
+        while True:
+            batch = await self._collect_batch()
+            records = [record for record in batch if record.command is not None]
+            markers = [record for record in batch if record.flushed is not None]
+
+            # The records of the earlier batches all have lower sequence numbers than the markers of this batch
+            previous_highest_failed_sequence = self._highest_failed_sequence
+            previous_error = self._last_error
+            error: Optional[Exception] = None
+            if len(records) > 0:
+                start_time = time.monotonic()
+                try:
+                    async with self.redis_client.pipeline(transaction=False) as pipe:
+                        for record in records:
+                            getattr(pipe, record.command)(record.key, *record.args)
+                        await pipe.execute()
+                    self.flushed_records += len(records)
+                except Exception as e:
+                    logger.exception(f'Redis journal failed to write {len(records)} records')
+                    self.failed_records += len(records)
+                    self._highest_failed_sequence = records[-1].sequence
+                    self._last_error = e
+                    error = e
+
+                flush_latency = time.monotonic() - start_time
+                self.flush_count += 1
+                self.last_flush_latency = flush_latency
+                self._sum_flush_latency += flush_latency
+                self.max_flush_latency = max(self.max_flush_latency, flush_latency)
+
+            for marker in markers:
+                if marker.flushed.done():
+                    continue
+                if error is not None and records[0].sequence < marker.sequence and records[-1].sequence >= marker.flushed_since:
+                    marker.flushed.set_exception(error)
+                elif previous_highest_failed_sequence >= marker.flushed_since:
+                    marker.flushed.set_exception(previous_error)
+                else:
+                    marker.flushed.set_result(None)
@@ -1,6 +1,10 @@
+import asyncio
 from dataclasses import dataclass
 from typing import Dict, Optional, List
 
+from p4.v1 import p4runtime_pb2
+
+from common.counter_history import CounterRates
 from common.high_level_switch_connection_async import HighLevelSwitchConnection
 from common.model.proxy_config import ProxyAllowedParamsDict, RedisMode
 from proxy import ProxyServer, TargetSwitchConfig
@@ -24,8 +28,10 @@ class ReplicatedNodeBalancerManager:
                            balancer_host: str,
                            balancer_port: int,
                            balancer_device_id: int,
-                           balancer_program_name: str) -> None:
+                           balancer_program_name: str,
+                           counter_history_depth: Optional[int] = None) -> None:
         self.program_name = program_name
+        self.counter_history_depth = counter_history_depth
         self._nodes: Dict[str, NodeHolder] = {}
         self.proxy_server: Optional[ProxyServer] = None
 
@@ -68,7 +74,8 @@ class ReplicatedNodeBalancerManager:
                     node.port,
                     send_p4info=True,
                     reset_dataplane=False,
-                    host=node.host
+                    host=node.host,
+                    counter_history_depth=self.counter_history_depth
                 )
                 await connection.init()
                 node.connection = connection
@@ -81,8 +88,7 @@ class ReplicatedNodeBalancerManager:
 
             await self.proxy_server.start()
         else:
-            for new_target_switch_config in new_target_switch_configs:
-                await self.proxy_server.add_target_switch(new_target_switch_config)
+            await asyncio.gather(*[self.proxy_server.add_target_switch(new_target_switch_config) for new_target_switch_config in new_target_switch_configs])
 
         if self.balancer_connection is None:
             self.balancer_connection = HighLevelSwitchConnection(
@@ -105,3 +111,13 @@ class ReplicatedNodeBalancerManager:
 
     async def remove_from_filter_params_allow_only_to_host(self, host: str, port: int, filters_to_remove: ProxyAllowedParamsDict) -> None:
         await self.proxy_server.remove_from_filter_params_allow_only_to_host(host, port, filters_to_remove)
+
+    def get_counter_rates(self, counter_name: str, indices: List[int], window: float) -> CounterRates:
+        """Rates of the counter summed over the nodes, from the counter history of the nodes."""
+        p4info_helper = self.proxy_server.servicer.from_p4info_helper
+        entities = []
+        for index in indices:
+            entity = p4runtime_pb2.Entity()
+            entity.counter_entry.CopyFrom(p4info_helper.build_counter_entry(counter_name, index, 0, 0))
+            entities.append(entity)
+        return self.proxy_server.get_counter_rates(entities, window)
@@ -0,0 +1,227 @@
+import asyncio
+import logging
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, Hashable, List, Optional, Sequence, Tuple
+
+from p4.v1 import p4runtime_pb2
+
+from common.entity_helper import calculate_read_entity_custom_identifier
+
+logger = logging.getLogger(__name__)
+
+# The entity types kept in the store
+SHADOWED_ENTITY_TYPES = ['table_entry', 'meter_entry']
+
+# Fields of a table entry read that the store can answer, a read with any other field (e.g. counter_data or
+# is_default_action) goes to the switch
+SHADOWED_TABLE_ENTRY_READ_FIELDS = {'table_id', 'match', 'priority'}
+
+# (entity type, table or meter id) -> read entity identifier -> entity
+ShadowedEntities = Dict[Tuple[str, int], Dict[Hashable, p4runtime_pb2.Entity]]
+
+
+@dataclass
+class ShadowTableStoreStats:
+    synced: bool
+    entities: int
+    reconciliations: int
+    # Entities that were different in the store and on the switch, found by the reconciliations
+    mismatches: int
+    served_reads: int
+
+
+class ShadowTableStore:
+    """In-memory copy of the table entries and meter configs of one target switch, in the ids of the source.
+
+    It is updated by the acknowledged writes in the order they were sent and it is replaced by the content of the switch
+    on every reconciliation. Reads are answered from it only while it is in sync: a failed write or a write it cannot
+    follow makes it out of sync until the next reconciliation.
+    """
+    def __init__(self, reconcile_interval: float) -> None:
+        self.reconcile_interval = reconcile_interval
+        self.synced = False
+        self._entities: ShadowedEntities = {}
+
+        # Writes are applied in the order they were sent, even if they are acknowledged in another order
+        self._next_write_ticket = 0
+        self._next_ticket_to_apply = 0
+        # Ticket -> the updates of the acknowledged write, None if the write failed or the store cannot follow it
+        self._finished_writes: Dict[int, Optional[Sequence[p4runtime_pb2.Update]]] = {}
+
+        # The updates applied while the switch is read for a reconciliation, they are replayed on the read content
+        self._updates_during_sync: Optional[List[p4runtime_pb2.Update]] = None
+        self._invalidated_during_sync = False
+        self._reconcile_task: Optional[asyncio.Task] = None
+
+        self.reconciliations = 0
+        self.mismatches = 0
+        self.served_reads = 0
+
+    def start(self, read_target: Callable[[], Awaitable[List[p4runtime_pb2.Entity]]]) -> None:
+        """Starts the periodic reconciliation, read_target returns the shadowed entities of the switch in source ids."""
+        if self._reconcile_task is None:
+            self._reconcile_task = asyncio.ensure_future(self._reconcile_loop(read_target))
+
+    def stop(self) -> None:
+        if self._reconcile_task is not None:
+            self._reconcile_task.cancel()
+            self._reconcile_task = None
+        self.synced = False
+
+    def begin_write(self) -> int:
+        """Reserves the place of a write sent to the switch, its updates are applied by finish_write."""
+        ticket = self._next_write_ticket
+        self._next_write_ticket += 1
+        return ticket
+
+    def finish_write(self, ticket: int, updates: Optional[Sequence[p4runtime_pb2.Update]]) -> None:
+        """Applies the acknowledged updates of the write, None if the write failed or the store cannot follow it."""
+        self._finished_writes[ticket] = updates
+        while self._next_ticket_to_apply in self._finished_writes:
+            finished_updates = self._finished_writes.pop(self._next_ticket_to_apply)
+            self._next_ticket_to_apply += 1
+            if finished_updates is None:
+                self.invalidate()
+                continue
+
+            for update in finished_updates:
+                self._apply_update(self._entities, update)
+            if self._updates_during_sync is not None:
+                self._updates_during_sync.extend(finished_updates)
+
+    def invalidate(self) -> None:
+        """The switch was changed in a way the store does not know, it is not used until the next reconciliation."""
+        self.synced = False
+        if self._updates_during_sync is not None:
+            self._invalidated_during_sync = True
+
+    def read(self, read_entity: p4runtime_pb2.Entity) -> Optional[List[p4runtime_pb2.Entity]]:
+        """The stored entities the read entity asks for, None if the store cannot answer it.
+
+        The returned entities are shared with the store, they have to be copied before they are modified.
+        """
+        if not self.synced:
+            return None
+
+        which_one = read_entity.WhichOneof('entity')
+        if which_one == 'table_entry':
+            table_entry = read_entity.table_entry
+            if table_entry.table_id == 0 or any(field.name not in SHADOWED_TABLE_ENTRY_READ_FIELDS for field, _ in table_entry.ListFields()):
+                return None
+            entities = self._entities.get((which_one, table_entry.table_id), {})
+            if len(table_entry.match) > 0:
+                entity = entities.get(calculate_read_entity_custom_identifier(read_entity))
+                ret = [] if entity is None else [entity]
+            else:
+                ret = list(entities.values())
+        elif which_one == 'meter_entry':
+            meter_entry = read_entity.meter_entry
+            if meter_entry.meter_id == 0:
+                return None
+            entities = self._entities.get((which_one, meter_entry.meter_id), {})
+            if meter_entry.HasField('index'):
+                entity = entities.get(calculate_read_entity_custom_identifier(read_entity))
+                ret = [] if entity is None else [entity]
+            else:
+                ret = list(entities.values())
+        else:
+            return None
+
+        self.served_reads += 1
+        return ret
+
+    def get_stats(self) -> ShadowTableStoreStats:
+        return ShadowTableStoreStats(
+            synced=self.synced,
+            entities=sum(len(entities) for entities in self._entities.values()),
+            reconciliations=self.reconciliations,
+            mismatches=self.mismatches,
+            served_reads=self.served_reads,
+        )
+
+    async def reconcile(self, read_target: Callable[[], Awaitable[List[p4runtime_pb2.Entity]]]) -> int:
+        """Replaces the store by the content of the switch and returns the number of entities that were different."""
+        self._updates_during_sync = []
+        self._invalidated_during_sync = False
+        try:
+            switch_entities = await read_target()
+            entities: ShadowedEntities = {}
+            for entity in switch_entities:
+                self._put_entity(entities, entity)
+            for update in self._updates_during_sync:
+                self._apply_update(entities, update)
+            invalidated = self._invalidated_during_sync
+        finally:
+            self._updates_during_sync = None
+
+        mismatches = self._count_mismatches(self._entities, entities) if self.synced else 0
+        self._entities = entities
+        self.synced = not invalidated
+        self.reconciliations += 1
+        self.mismatches += mismatches
+        if mismatches > 0:
+            logger.warning(f'The shadow table store was different from the switch in {mismatches} entities')
+        return mismatches
+
+    async def _reconcile_loop(self, read_target: Callable[[], Awaitable[List[p4runtime_pb2.Entity]]]) -> None:
+        while True:
+            try:
+                await self.reconcile(read_target)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f'Reconciliation of the shadow table store failed: {e}')
+
+            # Out of sync the reads go to the switch, so it is synced again sooner
+            await asyncio.sleep(self.reconcile_interval if self.synced else min(self.reconcile_interval, 1.0))
+
+    @classmethod
+    def _apply_update(cls, entities: ShadowedEntities, update: p4runtime_pb2.Update) -> None:
+        entity = update.entity
+        which_one = entity.WhichOneof('entity')
+        if which_one == 'table_entry':
+            if entity.table_entry.is_default_action:
+                # The switch does not answer the default entry to table reads, its reads are not served from the store
+                return
+            if update.type == p4runtime_pb2.Update.DELETE:
+                entities.get((which_one, entity.table_entry.table_id), {}).pop(calculate_read_entity_custom_identifier(entity), None)
+            else:
+                cls._put_entity(entities, entity)
+        elif which_one == 'meter_entry':
+            if entity.meter_entry.HasField('index'):
+                cls._put_entity(entities, entity)
+            else:
+                # Without index the config is set for every index of the meter. The stored entities can be shared
+                # with the stores of other target switches and with read answers, so they are replaced, not modified
+                meter_entities = entities.get((which_one, entity.meter_entry.meter_id), {})
+                for identifier, stored_entity in list(meter_entities.items()):
+                    new_entity = p4runtime_pb2.Entity()
+                    new_entity.CopyFrom(stored_entity)
+                    new_entity.meter_entry.ClearField('config')
+                    if entity.meter_entry.HasField('config'):
+                        new_entity.meter_entry.config.CopyFrom(entity.meter_entry.config)
+                    meter_entities[identifier] = new_entity
+
+    @staticmethod
+    def _put_entity(entities: ShadowedEntities, entity: p4runtime_pb2.Entity) -> None:
+        which_one = entity.WhichOneof('entity')
+        if which_one == 'table_entry':
+            entity_id = entity.table_entry.table_id
+        elif which_one == 'meter_entry':
+            entity_id = entity.meter_entry.meter_id
+        else:
+            return
+        entities.setdefault((which_one, entity_id), {})[calculate_read_entity_custom_identifier(entity)] = entity
+
+    @staticmethod
+    def _count_mismatches(entities1: ShadowedEntities, entities2: ShadowedEntities) -> int:
+        ret = 0
+        for key in entities1.keys() | entities2.keys():
+            by_identifier1 = entities1.get(key, {})
+            by_identifier2 = entities2.get(key, {})
+            for identifier in by_identifier1.keys() | by_identifier2.keys():
+                entity1 = by_identifier1.get(identifier)
+                entity2 = by_identifier2.get(identifier)
+                if entity1 is None or entity2 is None or entity1.SerializeToString(deterministic=True) != entity2.SerializeToString(deterministic=True):
+                    ret += 1
+        return ret
@@ -0,0 +1,81 @@
+import asyncio
+from dataclasses import dataclass
+from typing import List, Set
+
+from p4.v1 import p4runtime_pb2
+
+from common.model.proxy_config import StreamOverflowPolicy
+
+
+@dataclass
+class StreamSubscriberStats:
+    # Messages waiting in the queue of the subscriber
+    lag: int
+    max_lag: int
+    delivered: int
+    dropped: int
+
+
+class StreamSubscription:
+    def __init__(self, queue_size: int) -> None:
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.max_lag = 0
+        self.delivered = 0
+        self.dropped = 0
+
+    def get_stats(self) -> StreamSubscriberStats:
+        return StreamSubscriberStats(lag=self.queue.qsize(), max_lag=self.max_lag, delivered=self.delivered, dropped=self.dropped)
+
+
+class StreamMessageBus:
+    """Delivers every published stream message to every subscriber, through a bounded queue per subscriber.
+
+    When the queue of a subscriber is full the overflow policy decides: DROP_OLDEST and DROP_NEWEST drop a message
+    of that subscriber only, BLOCK makes the publisher wait, so the slowest subscriber slows down every subscriber.
+    A blocked publisher stops reading the streams of the targets, which are shared with the other sources of the targets.
+    The messages are shared by the subscribers, they must not be modified.
+    """
+    def __init__(self, queue_size: int, overflow_policy: StreamOverflowPolicy) -> None:
+        self.queue_size = queue_size
+        self.overflow_policy = overflow_policy
+        self._subscriptions: Set[StreamSubscription] = set()
+        # Messages published while nobody was subscribed
+        self.unsubscribed_drops = 0
+
+    def subscribe(self) -> StreamSubscription:
+        subscription = StreamSubscription(self.queue_size)
+        self._subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: StreamSubscription) -> None:
+        self._subscriptions.discard(subscription)
+        # A publisher blocked on the full queue of the subscriber can go on
+        while not subscription.queue.empty():
+            subscription.queue.get_nowait()
+
+    async def publish(self, message: p4runtime_pb2.StreamMessageResponse) -> None:
+        if len(self._subscriptions) == 0:
+            self.unsubscribed_drops += 1
+            return
+
+        for subscription in list(self._subscriptions):
+            queue = subscription.queue
+            if not queue.full():
+                queue.put_nowait(message)
+            elif self.overflow_policy == StreamOverflowPolicy.BLOCK:
+                await queue.put(message)
+            elif self.overflow_policy == StreamOverflowPolicy.DROP_OLDEST:
+                queue.get_nowait()
+                queue.put_nowait(message)
+                subscription.dropped += 1
+            else:
+                subscription.dropped += 1
+            subscription.max_lag = max(subscription.max_lag, queue.qsize())
+
+    async def get(self, subscription: StreamSubscription) -> p4runtime_pb2.StreamMessageResponse:
+        message = await subscription.queue.get()
+        subscription.delivered += 1
+        return message
+
+    def get_stats(self) -> List[StreamSubscriberStats]:
+        return [subscription.get_stats() for subscription in self._subscriptions]
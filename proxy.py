@@ -1,37 +1,50 @@
 import asyncio
-import copy
 import itertools
 import logging
 import os.path
+import random
 import signal
 import sys
 import time
 from dataclasses import dataclass
-from typing import Dict, List, Optional, Union, Tuple, AsyncIterator
+from typing import Dict, List, Optional, Union, Tuple, AsyncIterator, Set, Callable
 import google
 import grpc
 import grpc.aio
+import numpy as np
+from google.protobuf.message import Message
 from google.protobuf.text_format import MessageToString
 from p4.v1 import p4runtime_pb2
 from p4.v1.p4runtime_pb2 import SetForwardingPipelineConfigResponse, Update, WriteResponse, ReadResponse
 from p4.v1.p4runtime_pb2_grpc import P4RuntimeServicer, add_P4RuntimeServicer_to_server
-from google.protobuf.json_format import MessageToJson, Parse
 
-from common.entity_helper import EntityHelper
+from common.entity_helper import EntityHelper, EntityMerger, TableEntryMatchKey
 from common.enviroment import enviroment_settings
-from common.p4_name_id_helper import P4NameConverter, get_pure_p4_name, EntityCannotHaveZeroId
+from common.p4_name_id_helper import P4NameConverter, get_pure_p4_name, EntityCannotHaveZeroId, EntityRoutingKey, P4INFO_FIELD_BY_ID_TYPE
 from common.p4runtime_lib.helper import P4InfoHelper
 import redis
+import redis.asyncio
 
 from common.p4runtime_lib.switch import IterableQueue
-from common.high_level_switch_connection_async import HighLevelSwitchConnection, StreamMessageResponseWithInfo
-from common.model.proxy_config import ProxyConfig, RedisMode, ProxyAllowedParamsDict
-from common.redis_helper import RedisKeys, RedisRecords
+from common.high_level_switch_connection_async import HighLevelSwitchConnection, StreamMessageResponseWithInfo, WriteWindowStats, \
+    CounterInterest, CounterSubscription, CounterPollerStats
+from common.model.proxy_config import ProxyConfig, RedisMode, ProxyAllowedParamsDict, ProxyRedisSettings, RedisJournalDurability, RedisStateLayout, \
+    ProxyReadSettings, ReadPartialResultPolicy, ProxyStreamSettings, ProxyDigestSettings, DigestAckMode
+from common.redis_codec import encode_redis_record, decode_redis_record
+from common.redis_helper import RedisKeys, RedisRecords, migrate_redis_list_storage_format, migrate_redis_hash_storage_format, compact_table_entries_log, \
+    iter_redis_list_pages, iter_redis_hash_pages
+from common.redis_journal import RedisJournalWriter, RedisJournalStats
+from common.allowed_params_filter import AllowedParamsFilter
+from common.counter_history import CounterRates
+from common.stream_message_bus import StreamMessageBus, StreamSubscriberStats
+from common.digest_aggregator import DigestAggregator, DigestAggregatorStats
+from common.shadow_table_store import ShadowTableStore, ShadowTableStoreStats, SHADOWED_ENTITY_TYPES
 
 logger = logging.getLogger()
 logging.basicConfig(level=logging.DEBUG)
 
 _redis: Optional[redis.Redis] = None
+_async_redis: Optional[redis.asyncio.Redis] = None
 
 def get_redis() -> redis.Redis:
     global _redis
@@ -42,12 +55,43 @@ def get_redis() -> redis.Redis:
 
     return _redis
 
+def get_async_redis() -> redis.asyncio.Redis:
+    global _async_redis
+    if _async_redis is None:
+        redis_host = os.getenv('REDIS_HOST', 'localhost')
+        redis_port = int(os.getenv('REDIS_PORT', 6379))
+        _async_redis = redis.asyncio.Redis(host=redis_host, port=redis_port)
+
+    return _async_redis
+
+# id_types of the p4info entities that the entities are routed by to the target switches
+ROUTED_ID_TYPES = ['table', 'counter', 'meter', 'digest']
+
+# The entity type and the routing key of a read entity, the answers of the reads with the same key are merged
+ReadMergeKey = Tuple[str, EntityRoutingKey]
+
+# Target switch index, target digest id and list_id of a DigestList sent by a target switch
+DigestListOrigin = Tuple[str, int, int]
+
+# DigestLists sent to the controllers and not acked yet that are remembered for the pass-through acks, the oldest are forgotten
+MAX_UNACKED_DIGEST_LISTS = 65536
+
+# Metadata of the controller headers of the source that hold the dataplane port, matched with the packet_ports of the targets
+PACKET_OUT_PORT_METADATA_NAME = 'egress_port'
+PACKET_IN_PORT_METADATA_NAME = 'ingress_port'
+
 @dataclass
 class TargetSwitchConfig:
     high_level_connection: HighLevelSwitchConnection
     names: Optional[Dict[str, str]] = None
     filter_params_allow_only: Optional[ProxyAllowedParamsDict] = None
     fill_counter_from_redis: Optional[bool] = True
+    # Seconds between the reconciliations of the shadow table store with the switch, no store if None
+    shadow_reconcile_interval: Optional[float] = None
+    # Digest name in the program of the target -> overrides of the DigestEntry config written to the target
+    digest_settings: Optional[Dict[str, ProxyDigestSettings]] = None
+    # Dataplane ports of the target that belong to the source, all ports if None
+    packet_ports: Optional[List[int]] = None
 
 @dataclass
 class TargetSwitchObject:
@@ -56,6 +100,69 @@ class TargetSwitchObject:
     names: Optional[Dict[str, str]] = None
     filter_params_allow_only: Optional[ProxyAllowedParamsDict] = None
     fill_counter_from_redis: Optional[bool] = True
+    allowed_params_filter: Optional[AllowedParamsFilter] = None
+    counter_subscription: Optional[CounterSubscription] = None
+    shadow_store: Optional[ShadowTableStore] = None
+    # Target digest id -> overrides of the DigestEntry config written to the target
+    digest_settings_by_id: Optional[Dict[int, ProxyDigestSettings]] = None
+    packet_ports: Optional[List[int]] = None
+
+
+@dataclass
+class RedisRestoreStats:
+    target_switch_index: str
+    entries: int = 0
+    write_requests: int = 0
+    elapsed: float = 0.0
+
+    @property
+    def entries_per_sec(self) -> float:
+        return self.entries / self.elapsed if self.elapsed > 0 else 0.0
+
+
+@dataclass
+class ReadCacheStats:
+    hits: int = 0
+    misses: int = 0
+    # Reads that waited for an identical in-flight Read instead of reading the targets
+    coalesced: int = 0
+
+
+class SharedReadAnswer:
+    """The chunks of a Read answer, replayed to every identical Read while it is read and while it is cached."""
+    def __init__(self) -> None:
+        self.chunks: List[ReadResponse] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self._changed = asyncio.Event()
+
+    def add(self, chunk: ReadResponse) -> None:
+        self.chunks.append(chunk)
+        self._notify()
+
+    def finish(self, error: Optional[BaseException] = None) -> None:
+        self.done = True
+        self.error = error
+        self._notify()
+
+    async def replay(self) -> AsyncIterator[ReadResponse]:
+        position = 0
+        while True:
+            changed = self._changed
+            while position < len(self.chunks):
+                yield self.chunks[position]
+                position += 1
+            if self.done:
+                if self.error is not None:
+                    raise self.error
+                return
+            await changed.wait()
+
+    def _notify(self) -> None:
+        # Every waiting replay is woken up, the new waiters wait for the next change
+        changed = self._changed
+        self._changed = asyncio.Event()
+        changed.set()
 
 
 class RuntimeMeasurer:
@@ -94,7 +201,14 @@ class Ticker:
 
 
 class ProxyP4RuntimeServicer(P4RuntimeServicer):
-    def __init__(self, prefix: str, from_p4info_path: str, target_switch_configs: List[TargetSwitchConfig], redis_mode: RedisMode) -> None:
+    def __init__(self,
+                 prefix: str,
+                 from_p4info_path: str,
+                 target_switch_configs: List[TargetSwitchConfig],
+                 redis_mode: RedisMode,
+                 redis_settings: Optional[ProxyRedisSettings] = None,
+                 read_settings: Optional[ProxyReadSettings] = None,
+                 stream_settings: Optional[ProxyStreamSettings] = None) -> None:
         self.prefix = prefix
         self.verbose = False
         self.verbose_name_converting = False
@@ -111,54 +225,256 @@ class ProxyP4RuntimeServicer(P4RuntimeServicer):
             METER_ENTRIES=f'{redis_prefix}{RedisRecords.METER_ENTRIES.postfix}',
             HEARTBEAT=f'{redis_prefix}{RedisRecords.HEARTBEAT.postfix}',
             REMOVED_COUNTER_ENTRIES=f'{redis_prefix}{RedisRecords.REMOVED_COUNTER_ENTRIES.postfix}',
+            TABLE_STATE=f'{redis_prefix}{RedisRecords.TABLE_STATE.postfix}',
+            COUNTER_STATE=f'{redis_prefix}{RedisRecords.COUNTER_STATE.postfix}',
         )
 
         self.from_p4info_helper = P4InfoHelper(from_p4info_path)
         self.raw_p4info = MessageToString(self.from_p4info_helper.p4info)
+        source_p4info = self.from_p4info_helper.p4info
+        # Read entity type -> ids of this source that a wildcard read (0 id) of the type is expanded to
+        self._wildcard_read_ids: Dict[str, List[int]] = {
+            'table_entry': [table.preamble.id for table in source_p4info.tables],
+            'counter_entry': [counter.preamble.id for counter in source_p4info.counters],
+            'direct_counter_entry': [direct_counter.direct_table_id for direct_counter in source_p4info.direct_counters],
+            'meter_entry': [meter.preamble.id for meter in source_p4info.meters],
+            'direct_meter_entry': [direct_meter.direct_table_id for direct_meter in source_p4info.direct_meters],
+            'digest_entry': [digest.preamble.id for digest in source_p4info.digests],
+        }
+        self._packet_out_port_metadata_id = self._get_source_packet_metadata_id('packet_out', PACKET_OUT_PORT_METADATA_NAME)
+        self._packet_in_port_metadata_id = self._get_source_packet_metadata_id('packet_in', PACKET_IN_PORT_METADATA_NAME)
         self.requests_stream = IterableQueue()
         self.redis_mode = redis_mode
-
-        self.stream_queue_from_target = asyncio.Queue()
+        self.redis_settings = ProxyRedisSettings() if redis_settings is None else redis_settings
+        self.read_settings = ProxyReadSettings() if read_settings is None else read_settings
+        self.stream_settings = ProxyStreamSettings() if stream_settings is None else stream_settings
+        self.redis_journal: Optional[RedisJournalWriter] = None
+        if RedisMode.is_writing(self.redis_mode):
+            self.redis_journal = RedisJournalWriter(
+                get_async_redis(),
+                max_batch_size=self.redis_settings.journal_max_batch_size,
+                max_batch_delay=self.redis_settings.journal_max_batch_delay
+            )
+
+        # Bounded, so with the BLOCK overflow policy a slow StreamChannel subscriber slows down the reading of the targets' streams.
+        # The targets' streams are read once for every source mapped to them, so this also slows down the other sources of the targets.
+        self.stream_queue_from_target = asyncio.Queue(maxsize=self.stream_settings.subscriber_queue_size)
+        # Every StreamChannel of the controllers gets every message from the targets
+        self.stream_message_bus = StreamMessageBus(self.stream_settings.subscriber_queue_size, self.stream_settings.overflow_policy)
+        self._stream_publisher_task: Optional[asyncio.Task] = None
+        self.digest_aggregator: Optional[DigestAggregator] = None
+        if self.stream_settings.digest_aggregation_window is not None:
+            self.digest_aggregator = DigestAggregator(
+                self.stream_settings.digest_aggregation_window,
+                self.stream_settings.digest_aggregation_max_list_size,
+                self.stream_settings.suppress_duplicate_digests,
+                self._publish_digest_list
+            )
+        # (source digest id, list_id) of a DigestList sent to the controllers -> the DigestLists of the targets it acks,
+        # the list_id is given by the proxy (or the aggregator), so the same list_id of two targets does not collide
+        self._unacked_digest_lists: Dict[Tuple[int, int], List[DigestListOrigin]] = {}
+        self._digest_list_ids = itertools.count(1)
         self._target_switches: Dict[str, TargetSwitchObject] = {}
+        # (id_type, source id) -> indices of the target switches that get the entities of it, in _target_switches order
+        self._routing_index: Dict[EntityRoutingKey, List[str]] = {}
+        # Target switches in the same group translate the source ids the same way (e.g. replicated nodes),
+        # so an update is translated and serialized only once for the whole group
+        self._translation_group_by_target: Dict[str, int] = {}
+        self._translation_group_counter = itertools.count()
         for target_key in target_switch_configs:
             self._add_target_switch(target_key)
 
         self.running = True
         self.runtime_measurer = RuntimeMeasurer()
         self.ticker = Ticker()
+        # Counters of the removed target switches summed per entity key, loaded from Redis on first use
+        self._removed_counters: Optional[EntityMerger] = None
+        # Keyed by the serialized ReadRequest
+        self._in_flight_reads: Dict[bytes, SharedReadAnswer] = {}
+        # Serialized ReadRequest -> number of its Reads streamed without a shared answer, an identical Read arriving
+        # meanwhile starts a shared answer that the later identical Reads join
+        self._in_flight_direct_reads: Dict[bytes, int] = {}
+        self._read_cache: Dict[bytes, Tuple[float, SharedReadAnswer]] = {}
+        # Incremented on every change of the targets' state, an answer read before it is not cached
+        self._read_cache_generation = 0
+        self.read_cache_stats = ReadCacheStats()
+        # Counter record field -> serialized counter data stored by the last checkpoint, None before the first one
+        self._checkpointed_counter_data: Optional[Dict[bytes, bytes]] = None
 
     def _add_target_switch(self, new_target_switch_config: TargetSwitchConfig) -> None:
         converter = P4NameConverter(self.from_p4info_helper, new_target_switch_config.high_level_connection.p4info_helper, self.prefix, new_target_switch_config.names)
+        allowed_params_filter = None
+        if new_target_switch_config.filter_params_allow_only is not None:
+            allowed_params_filter = AllowedParamsFilter(self.from_p4info_helper, new_target_switch_config.filter_params_allow_only)
         target_switch = TargetSwitchObject(
             new_target_switch_config.high_level_connection,
             converter,
             new_target_switch_config.names,
-            new_target_switch_config.filter_params_allow_only,
-            new_target_switch_config.fill_counter_from_redis
+            None if allowed_params_filter is None else allowed_params_filter.filter_params_allow_only,
+            new_target_switch_config.fill_counter_from_redis,
+            allowed_params_filter,
+            packet_ports=new_target_switch_config.packet_ports
         )
+        if new_target_switch_config.digest_settings:
+            target_p4info_helper = new_target_switch_config.high_level_connection.p4info_helper
+            target_switch.digest_settings_by_id = {
+                target_p4info_helper.get_digests_id(digest_name): digest_settings
+                    for digest_name, digest_settings in new_target_switch_config.digest_settings.items()
+            }
         new_switch_address = target_switch.high_level_connection.get_address()
         print(f'--->{new_switch_address=}')
         target_switch.high_level_connection.subscribe_to_stream_with_queue(self.stream_queue_from_target, new_switch_address)
+        target_switch.counter_subscription = target_switch.high_level_connection.counter_poller.subscribe(self._get_counter_interest(target_switch))
+        if new_target_switch_config.shadow_reconcile_interval is not None:
+            target_switch.shadow_store = ShadowTableStore(new_target_switch_config.shadow_reconcile_interval)
+            target_switch.shadow_store.start(lambda: self._read_shadowed_entities(target_switch))
+        if new_switch_address in self._target_switches:
+            self._remove_target_switch_from_routing_index(new_switch_address)
+            self._translation_group_by_target.pop(new_switch_address)
+            self._unsubscribe_from_counters(self._target_switches[new_switch_address])
+            self._stop_shadow_store(self._target_switches[new_switch_address])
+        self._translation_group_by_target[new_switch_address] = self._get_translation_group(converter)
         self._target_switches[new_switch_address] = target_switch
+        self._add_target_switch_to_routing_index(new_switch_address, target_switch)
+
+    def _get_counter_interest(self, target_switch: TargetSwitchObject) -> CounterInterest:
+        """Target ids of the counters and direct counters of this source, the ones read by return_all_counter_entity."""
+        interest = CounterInterest()
+        for entity in self._get_counter_read_entities(target_switch):
+            if entity.WhichOneof('entity') == 'counter_entry':
+                interest.counter_ids.add(entity.counter_entry.counter_id)
+            else:
+                interest.direct_counter_table_ids.add(entity.direct_counter_entry.table_entry.table_id)
+        return interest
+
+    def _get_counter_read_entities(self,
+                                   target_switch: TargetSwitchObject,
+                                   load_simple_counters: bool = True,
+                                   load_direct_counters: bool = True) -> List[p4runtime_pb2.Entity]:
+        """Converted read entities of the counters of this source on the target switch, one per counter id that the target has.
+
+        They are used instead of a wildcard read, which would read the counters of every source sharing the target switch.
+        """
+        ret = []
+        if load_direct_counters:
+            for direct_counter in self.from_p4info_helper.p4info.direct_counters:
+                name = P4NameConverter.get_p4_name_from_id(self.from_p4info_helper, 'table', direct_counter.direct_table_id)
+                if (target_switch.names is None or name in target_switch.names) and \
+                        direct_counter.direct_table_id in target_switch.converter.forward_id_table['table']:
+                    entity = p4runtime_pb2.Entity()
+                    entity.direct_counter_entry.table_entry.table_id = direct_counter.direct_table_id
+                    target_switch.converter.convert_entity(entity, verbose=self.verbose_name_converting)
+                    ret.append(entity)
+
+        if load_simple_counters:
+            for counter in self.from_p4info_helper.p4info.counters:
+                if (target_switch.names is None or counter.preamble.name in target_switch.names) and \
+                        counter.preamble.id in target_switch.converter.forward_id_table['counter']:
+                    entity = p4runtime_pb2.Entity()
+                    entity.counter_entry.counter_id = counter.preamble.id
+                    target_switch.converter.convert_entity(entity, verbose=self.verbose_name_converting)
+                    ret.append(entity)
+        return ret
+
+    async def _read_shadowed_entities(self, target_switch: TargetSwitchObject) -> List[p4runtime_pb2.Entity]:
+        """The table entries and meter entries of this source on the target switch, in source ids."""
+        request = p4runtime_pb2.ReadRequest()
+        request.device_id = target_switch.high_level_connection.device_id
+        for which_one, id_type in [('table_entry', 'table'), ('meter_entry', 'meter')]:
+            for source_id in self._wildcard_read_ids[which_one]:
+                name = P4NameConverter.get_p4_name_from_id(self.from_p4info_helper, id_type, source_id)
+                if target_switch.names is None or name in target_switch.names:
+                    entity = request.entities.add()
+                    getattr(entity, which_one).SetInParent()
+                    P4NameConverter.set_entity_routing_id(entity, source_id)
+                    target_switch.converter.convert_entity(entity, verbose=self.verbose_name_converting)
+
+        ret = []
+        if len(request.entities) == 0:
+            return ret
+        async for response in target_switch.high_level_connection.connection.client_stub.Read(request):
+            for entity in response.entities:
+                entity_name = target_switch.converter.get_target_entity_name(entity)
+                if get_pure_p4_name(entity_name).startswith(self.prefix):
+                    target_switch.converter.convert_entity(entity, reverse=True, verbose=self.verbose_name_converting)
+                    ret.append(entity)
+        return ret
+
+    @staticmethod
+    def _stop_shadow_store(target_switch: TargetSwitchObject) -> None:
+        if target_switch.shadow_store is not None:
+            target_switch.shadow_store.stop()
+
+    @staticmethod
+    def _unsubscribe_from_counters(target_switch: TargetSwitchObject) -> None:
+        if target_switch.counter_subscription is not None:
+            target_switch.high_level_connection.counter_poller.unsubscribe(target_switch.counter_subscription)
+            target_switch.counter_subscription = None
+
+    def _get_translation_group(self, converter: P4NameConverter) -> int:
+        for index, translation_group in self._translation_group_by_target.items():
+            if self._target_switches[index].converter.has_same_forward_translation(converter):
+                return translation_group
+        return next(self._translation_group_counter)
+
+    def _add_target_switch_to_routing_index(self, target_switch_index: str, target_switch: TargetSwitchObject) -> None:
+        # A replaced target keeps its place in _target_switches, so its index goes before the indices of the later targets
+        later_indices = set(itertools.dropwhile(lambda index: index != target_switch_index, self._target_switches))
+        later_indices.discard(target_switch_index)
+        for id_type in ROUTED_ID_TYPES:
+            for p4info_entity in getattr(self.from_p4info_helper.p4info, P4INFO_FIELD_BY_ID_TYPE[id_type]):
+                if target_switch.names is None or p4info_entity.preamble.name in target_switch.names:
+                    target_switch_indices = self._routing_index.setdefault((id_type, p4info_entity.preamble.id), [])
+                    position = next((position for position, index in enumerate(target_switch_indices) if index in later_indices),
+                                    len(target_switch_indices))
+                    target_switch_indices.insert(position, target_switch_index)
+
+    def _remove_target_switch_from_routing_index(self, target_switch_index: str) -> None:
+        for target_switch_indices in self._routing_index.values():
+            if target_switch_index in target_switch_indices:
+                target_switch_indices.remove(target_switch_index)
 
     async def add_target_switch(self, new_target_switch: TargetSwitchConfig) -> None:
         self._add_target_switch(new_target_switch)
+        self.invalidate_read_cache()
         if RedisMode.is_writing(self.redis_mode):
             switch_address = new_target_switch.high_level_connection.get_address()
             await self.fill_from_redis_one_target(self._target_switches[switch_address], switch_address)
 
     async def remove_target_switch(self, host: str, port: int) -> None:
         target_switch = self._target_switches.pop(f'{host}:{port}', None)
+        self._remove_target_switch_from_routing_index(f'{host}:{port}')
+        self._translation_group_by_target.pop(f'{host}:{port}', None)
+        self.invalidate_read_cache()
         await self._save_removed_counter_nodes(target_switch)
+        self._unsubscribe_from_counters(target_switch)
+        self._stop_shadow_store(target_switch)
         target_switch.high_level_connection.unsubscribe_from_stream_with_queue(self.stream_queue_from_target)
 
     async def _save_removed_counter_nodes(self, target_switch):
         if RedisMode.is_writing(self.redis_mode):
             async for entity in self.return_all_counter_entity(target_switch, skip_empty_data=True):
-                if self.verbose:
-                    print('SAVING TO REMOVED_COUNTER_ENTRIES------')
-                    print(entity)
-                get_redis().rpush(self.redis_keys.REMOVED_COUNTER_ENTRIES, MessageToJson(entity))
+                self._save_removed_counter_entity(entity)
+            await self.redis_journal.flush()
+
+    def _save_removed_counter_entity(self, entity: p4runtime_pb2.Entity) -> None:
+        if self.verbose:
+            print('SAVING TO REMOVED_COUNTER_ENTRIES------')
+            print(entity)
+        if RedisMode.is_reading(self.redis_mode):
+            # Loaded before the journal appends, so the cache never misses an entity that is not flushed yet
+            removed_counters = self._get_removed_counters()
+            cached_entity = p4runtime_pb2.Entity()
+            cached_entity.CopyFrom(entity)
+            removed_counters.add(cached_entity)
+        self.redis_journal.append('rpush', self.redis_keys.REMOVED_COUNTER_ENTRIES, self.encode_redis_record(entity))
+
+    def _get_removed_counters(self) -> EntityMerger:
+        if self._removed_counters is None:
+            self._removed_counters = EntityMerger()
+            for redis_record in get_redis().lrange(self.redis_keys.REMOVED_COUNTER_ENTRIES, 0, -1):
+                self._removed_counters.add(decode_redis_record(redis_record, p4runtime_pb2.Entity))
+        return self._removed_counters
 
     async def add_filter_params_allow_only_to_host(self, host: str, port: int, filters_to_add: ProxyAllowedParamsDict) -> None:
         key = f'{host}:{port}'
@@ -166,19 +482,10 @@ class ProxyP4RuntimeServicer(P4RuntimeServicer):
             raise ValueError(f'Cannot find {key} address target switch')
         target_switch = self._target_switches[key]
 
-        new_added_params_dict: ProxyAllowedParamsDict = {k: [] for k in filters_to_add}
-        if target_switch.filter_params_allow_only is None:
-            target_switch.filter_params_allow_only = {}
-        actual_params_dict = target_switch.filter_params_allow_only
-        for param_name, allowed_values in filters_to_add.items():
-            if param_name in actual_params_dict:
-                for allowed_value in allowed_values:
-                    if allowed_value not in actual_params_dict[param_name]:
-                        actual_params_dict[param_name].append(allowed_value)
-                        new_added_params_dict[param_name].append(allowed_value)
-            else:
-                actual_params_dict[param_name] = allowed_values[:]
-                new_added_params_dict[param_name] = allowed_values[:]
+        if target_switch.allowed_params_filter is None:
+            target_switch.allowed_params_filter = AllowedParamsFilter(self.from_p4info_helper)
+            target_switch.filter_params_allow_only = target_switch.allowed_params_filter.filter_params_allow_only
+        new_added_params_dict = target_switch.allowed_params_filter.add(filters_to_add)
 
         await self.fill_from_redis_one_target(target_switch, key, filter_by_params_allow_only=new_added_params_dict)
 
@@ -188,13 +495,12 @@ class ProxyP4RuntimeServicer(P4RuntimeServicer):
             raise ValueError(f'Cannot find {target_switch_index} address target switch')
         target_switch = self._target_switches[target_switch_index]
 
-        before_params_dict = copy.deepcopy(target_switch.filter_params_allow_only)
-        actual_params_dict = target_switch.filter_params_allow_only
-        for param_name, values_to_remove in filters_to_remove.items():
-            if param_name in actual_params_dict:
-                for value in values_to_remove:
-                    if value in actual_params_dict[param_name]:
-                        actual_params_dict[param_name].remove(value)
+        if target_switch.allowed_params_filter is None:
+            print(f'{target_switch_index} has no filter, every parameter is allowed')
+            return
+
+        before_params_filter = AllowedParamsFilter(self.from_p4info_helper, target_switch.filter_params_allow_only)
+        target_switch.allowed_params_filter.remove(filters_to_remove)
         print(target_switch.filter_params_allow_only)
         redis_p4info_helper = self.build_source_p4infohelper_from_redis()
         if redis_p4info_helper is None:
@@ -204,43 +510,60 @@ class ProxyP4RuntimeServicer(P4RuntimeServicer):
         high_level_connection = target_switch.high_level_connection
         p4name_converter = P4NameConverter(redis_p4info_helper, high_level_connection.p4info_helper, self.prefix, target_switch.names)
         virtual_target_switch_for_load = TargetSwitchObject(high_level_connection, p4name_converter, target_switch.names)
-        for protobuf_message_json_object in get_redis().lrange(self.redis_keys.TABLE_ENTRIES, 0, -1):
-            parsed_update_object = Parse(protobuf_message_json_object, p4runtime_pb2.Update())
-
+        # The non-empty direct counters of the target, read only once if an entry is removed
+        direct_counter_entities_by_match_key: Optional[Dict[TableEntryMatchKey, List[p4runtime_pb2.Entity]]] = None
+        for parsed_update_object in await self.load_table_entry_updates_from_redis():
             print('READ FROM REDIS')
             print(parsed_update_object)
             name = p4name_converter.get_source_entity_name(parsed_update_object.entity)
             if virtual_target_switch_for_load.names is None or name in virtual_target_switch_for_load.names:
-                if (self.is_parameters_allowed_by_filters(parsed_update_object.entity, before_params_dict)
-                        and not self.is_parameters_allowed_by_filters(parsed_update_object.entity, target_switch.filter_params_allow_only)):
+                if (self.is_parameters_allowed_by_filters(parsed_update_object.entity, before_params_filter)
+                        and not self.is_parameters_allowed_by_filters(parsed_update_object.entity, target_switch.allowed_params_filter)):
 
                     if RedisMode.is_writing(self.redis_mode):
-                        async for entity in self.return_all_counter_entity(target_switch, skip_empty_data=True, load_simple_counters=False):
-                            if EntityHelper.is_table_id_and_match_equals(parsed_update_object.entity.table_entry, entity.direct_counter_entry.table_entry):
-                                if self.verbose:
-                                    print('SAVING TO REMOVED_COUNTER_ENTRIES------')
-                                    print(entity)
-                                get_redis().rpush(self.redis_keys.REMOVED_COUNTER_ENTRIES, MessageToJson(entity))
+                        if direct_counter_entities_by_match_key is None:
+                            direct_counter_entities_by_match_key = {}
+                            async for entity in self.return_all_counter_entity(target_switch, skip_empty_data=True, load_simple_counters=False):
+                                match_key = EntityHelper.get_table_entry_match_key(entity.direct_counter_entry.table_entry)
+                                direct_counter_entities_by_match_key.setdefault(match_key, []).append(entity)
+
+                        match_key = EntityHelper.get_table_entry_match_key(parsed_update_object.entity.table_entry)
+                        for entity in direct_counter_entities_by_match_key.get(match_key, []):
+                            self._save_removed_counter_entity(entity)
                     parsed_update_object.type = Update.DELETE
                     await self._write_update_object(parsed_update_object, p4name_converter, target_switch_index, use_filtering=False)
 
+        if self.redis_journal is not None:
+            await self.redis_journal.flush()
 
     async def start(self) -> None:
         asyncio.create_task(self.heartbeat())
+        self._start_stream_publisher()
 
     async def heartbeat(self) -> None:
         while self.running:
             if RedisMode.is_writing(self.redis_mode):
-                await self.save_counters_state_to_redis()
+                # The counters read for another source within the interval are good for this checkpoint too
+                await self.save_counters_state_to_redis(max_age=self.redis_settings.checkpoint_interval)
 
-            await asyncio.sleep(2)
+            # The jitter spreads the checkpoints of the proxies sharing a Redis
+            await asyncio.sleep(self.redis_settings.checkpoint_interval + random.uniform(0, self.redis_settings.checkpoint_jitter))
 
 
     async def stop(self) -> None:
         self.running = False
+        if self._stream_publisher_task is not None:
+            self._stream_publisher_task.cancel()
+            self._stream_publisher_task = None
+        if self.digest_aggregator is not None:
+            self.digest_aggregator.stop()
         if RedisMode.is_writing(self.redis_mode):
             await self.save_counters_state_to_redis()
+            await self.redis_journal.stop()
         for target_switch in self._target_switches.values():
+            await target_switch.high_level_connection.connection.write_window.drain()
+            self._unsubscribe_from_counters(target_switch)
+            self._stop_shadow_store(target_switch)
             target_switch.high_level_connection.unsubscribe_from_stream_with_queue(self.stream_queue_from_target)
 
 
@@ -249,6 +572,16 @@ class ProxyP4RuntimeServicer(P4RuntimeServicer):
             first_element_index, first_element = next(iter(self._target_switches.items()))
             return [(first_element, first_element_index)]
 
+        target_switch_indices = self._routing_index.get(P4NameConverter.get_entity_routing_key(entity))
+        if target_switch_indices is None:
+            return self._get_multi_target_switch_and_index_by_names(entity)
+
+        if self.verbose:
+            for index in target_switch_indices:
+                print(f'Choosen target switch: {self._target_switches[index].high_level_connection.filename}, {index}')
+        return [(self._target_switches[index], index) for index in target_switch_indices]
+
+    def _get_multi_target_switch_and_index_by_names(self, entity: p4runtime_pb2.Entity) -> List[Tuple[TargetSwitchObject, str]]:
         ret: List[Tuple[TargetSwitchObject, str]] = []
         entity_name = P4NameConverter.get_entity_name(self.from_p4info_helper, entity)
         for index, target_switch in self._target_switches.items():
@@ -264,39 +597,22 @@ class ProxyP4RuntimeServicer(P4RuntimeServicer):
             first_element_index, first_element = next(iter(self._target_switches.items()))
             return first_element, first_element_index
 
-        entity_name = P4NameConverter.get_entity_name(self.from_p4info_helper, entity)
-        for index, target_switch in self._target_switches.items():
-            if target_switch.names is None or entity_name in target_switch.names:
-                if self.verbose:
-                    print(f'Choosen target switch: {target_switch.high_level_connection.filename}, {target_switch.high_level_connection.port}')
-                return target_switch, index
+        target_switches_and_indices = self.get_multi_target_switch_and_index(entity)
+        if len(target_switches_and_indices) == 0:
+            entity_name = P4NameConverter.get_entity_name(self.from_p4info_helper, entity)
+            raise Exception(f'Cannot find a target switch for {entity_name=}')
 
-        raise Exception(f'Cannot find a target switch for {entity_name=}')
+        return target_switches_and_indices[0]
 
     def get_target_switch(self, entity: p4runtime_pb2.Entity) -> TargetSwitchObject:
         target_switch, _ = self.get_target_switch_and_index(entity)
         return target_switch
 
-    def is_parameters_allowed_by_filters(self, entity: p4runtime_pb2.Entity, filter_params_allow_only: ProxyAllowedParamsDict) -> bool:
-        if filter_params_allow_only is None:
+    def is_parameters_allowed_by_filters(self, entity: p4runtime_pb2.Entity, allowed_params_filter: Optional[AllowedParamsFilter]) -> bool:
+        if allowed_params_filter is None:
             return True
 
-        which_one = entity.WhichOneof('entity')
-        if which_one == 'table_entry':
-            for match in entity.table_entry.match:
-                match_which = match.WhichOneof('field_match_type')
-
-                if match_which == 'exact':
-                    table_name = self.from_p4info_helper.get_tables_name(entity.table_entry.table_id)
-                    match_field_name = self.from_p4info_helper.get_match_field_name(table_name, match.field_id)
-
-                    for allowed_param_rule_key, values in filter_params_allow_only.items():
-                        if allowed_param_rule_key == match_field_name:
-                            encoded_values = [self.from_p4info_helper.get_match_field_pb(table_name, match_field_name, value).exact.value for value in values]
-                            if match.exact.value not in encoded_values:
-                                return False
-
-        return True
+        return allowed_params_filter.is_entity_allowed(entity)
 
     async def Write(self,
                     request,
@@ -306,14 +622,22 @@ class ProxyP4RuntimeServicer(P4RuntimeServicer):
                     save_to_redis: bool = True,
                     use_filtering: bool = True) -> None:
         start_time = time.time()
+        self.invalidate_read_cache()
 
         if self.verbose:
             print('------------------- Write -------------------')
             print(request)
 
 
-        updates_distributed_by_target = {k : [] for k in self._target_switches.keys()}
+        # The translated updates of every target, serialized as the updates field of a WriteRequest.
+        # The original request is not modified.
+        serialized_updates_by_target: Dict[str, List[bytes]] = {}
+        # The updates the shadow table stores of the targets are updated with, once the targets acknowledged them.
+        # None if the store cannot follow the write, it is synced from the switch after the write.
+        shadowed_updates_by_target: Dict[str, Optional[List[p4runtime_pb2.Update]]] = {}
         tasks_to_wait = []
+        journal_appended = False
+        journal_since = None if self.redis_journal is None else self.redis_journal.next_sequence
         for update in request.updates:
             if update.type == Update.INSERT or update.type == Update.MODIFY or update.type == Update.DELETE:
                 entity = update.entity
@@ -321,9 +645,11 @@ class ProxyP4RuntimeServicer(P4RuntimeServicer):
 
                 if save_to_redis and RedisMode.is_writing(self.redis_mode):
                     if which_one == 'table_entry':
-                        get_redis().rpush(self.redis_keys.TABLE_ENTRIES, MessageToJson(update))
+                        self._append_table_entry_update_to_journal(update)
+                        journal_appended = True
                     elif which_one == 'meter_entry' or which_one == 'direct_meter_entry':
-                        get_redis().rpush(self.redis_keys.METER_ENTRIES, MessageToJson(entity))
+                        self.redis_journal.append('rpush', self.redis_keys.METER_ENTRIES, self.encode_redis_record(entity))
+                        journal_appended = True
 
                 if target_switch_override_index is None:
                     switches_to_iterate_on = self.get_multi_target_switch_and_index(entity)
@@ -333,32 +659,72 @@ class ProxyP4RuntimeServicer(P4RuntimeServicer):
                 if use_filtering:
                     switches_to_iterate_on = [
                         switch_and_index for switch_and_index in switches_to_iterate_on
-                            if self.is_parameters_allowed_by_filters(entity, switch_and_index[0].filter_params_allow_only)
+                            if self.is_parameters_allowed_by_filters(entity, switch_and_index[0].allowed_params_filter)
                     ]
 
 
+                serialized_update_by_translation_group: Dict[int, bytes] = {}
+                shadowed_update = None
                 for target_switch, target_switch_index in switches_to_iterate_on:
                     if converter_override is None:
                         converter = target_switch.converter
+                        translation_group = self._translation_group_by_target[target_switch_index]
                     else:
                         converter = converter_override
-
-                    try:
-                        converter.convert_entity(entity, verbose=self.verbose_name_converting)
-                    except Exception as e:
-                        raise Exception(f'Conversion failed while trying to convert to target switch with index {target_switch_index}, entity: {entity}') from e
-                    updates_distributed_by_target[target_switch_index].append(update)
+                        translation_group = -1
+
+                    # The digest configs can be different on the targets of the same translation group
+                    has_digest_settings = which_one == 'digest_entry' and target_switch.digest_settings_by_id is not None
+                    serialized_update = None if has_digest_settings else serialized_update_by_translation_group.get(translation_group)
+                    if serialized_update is None:
+                        try:
+                            serialized_update = self._translate_and_serialize_update(update, converter,
+                                                                                     target_switch.digest_settings_by_id if has_digest_settings else None)
+                        except Exception as e:
+                            raise Exception(f'Conversion failed while trying to convert to target switch with index {target_switch_index}, entity: {entity}') from e
+                        if not has_digest_settings:
+                            serialized_update_by_translation_group[translation_group] = serialized_update
+                    serialized_updates_by_target.setdefault(target_switch_index, []).append(serialized_update)
+
+                    if target_switch.shadow_store is not None and which_one in SHADOWED_ENTITY_TYPES:
+                        if converter_override is not None:
+                            # Written in the ids of another p4info (e.g. restored from Redis)
+                            shadowed_updates_by_target[target_switch_index] = None
+                        elif shadowed_updates_by_target.get(target_switch_index, []) is not None:
+                            if shadowed_update is None:
+                                shadowed_update = p4runtime_pb2.Update()
+                                shadowed_update.CopyFrom(update)
+                            shadowed_updates_by_target.setdefault(target_switch_index, []).append(shadowed_update)
             else:
                 raise Exception(f'Unhandled update type {update.Type.Name(update.type)}')
 
-        for target_switch_index, updates in updates_distributed_by_target.items():
-            if len(updates) == 0:
-                continue
+        journal_flush = None
+        if journal_appended and self.redis_settings.durability == RedisJournalDurability.AFTER_FLUSH:
+            # Queued before anything is awaited, so it covers exactly the records of this Write, in whichever batches they are written
+            journal_flush = self.redis_journal.queue_flush(journal_since)
+
+        for target_switch_index, serialized_updates in serialized_updates_by_target.items():
             if self.verbose:
                 print(f'== SENDING to target {target_switch_index}')
-                print(updates)
-
-            tasks_to_wait.append(asyncio.ensure_future(self._target_switches[target_switch_index].high_level_connection.connection.WriteUpdates(updates)))
+                print(p4runtime_pb2.WriteRequest.FromString(b''.join(serialized_updates)))
+
+            # Waits only if the write window of the target is full, the acknowledgement is awaited below if needed.
+            # The window sends the Writes of the target in this order, unless its ordered_writes is turned off.
+            target_switch = self._target_switches[target_switch_index]
+            connection = target_switch.high_level_connection.connection
+            is_shadowed = target_switch_index in shadowed_updates_by_target
+            shadow_write_ticket = target_switch.shadow_store.begin_write() if is_shadowed else None
+            try:
+                write_task = await connection.WriteSerializedUpdatesPipelined(b''.join(serialized_updates), len(serialized_updates))
+            except BaseException:
+                # The later writes are applied only after this ticket is finished, the store is synced again from the switch
+                if is_shadowed:
+                    target_switch.shadow_store.finish_write(shadow_write_ticket, None)
+                    target_switch.shadow_store.invalidate()
+                raise
+            if is_shadowed:
+                write_task.add_done_callback(self._get_shadow_write_callback(target_switch.shadow_store, shadow_write_ticket, shadowed_updates_by_target[target_switch_index]))
+            tasks_to_wait.append(write_task)
 
         if self.verbose:
             self.runtime_measurer.measure('write', time.time() - start_time)
@@ -368,81 +734,367 @@ class ProxyP4RuntimeServicer(P4RuntimeServicer):
 
         if not enviroment_settings.production_mode:
             await asyncio.gather(*tasks_to_wait)
+        if journal_flush is not None:
+            await journal_flush
         if self.verbose:
             print('------ End Write')
         return WriteResponse()
 
+    @staticmethod
+    def _get_shadow_write_callback(shadow_store: ShadowTableStore,
+                                   ticket: int,
+                                   updates: Optional[List[p4runtime_pb2.Update]]) -> Callable[[asyncio.Task], None]:
+        def on_write_done(write_task: asyncio.Task) -> None:
+            is_acknowledged = not write_task.cancelled() and write_task.exception() is None
+            shadow_store.finish_write(ticket, updates if is_acknowledged else None)
+        return on_write_done
+
+    def _translate_and_serialize_update(self,
+                                        update: p4runtime_pb2.Update,
+                                        converter: P4NameConverter,
+                                        digest_settings_by_id: Optional[Dict[int, ProxyDigestSettings]] = None) -> bytes:
+        # Serialized as a WriteRequest with this one update, so the results can be concatenated into the updates of a request
+        request = p4runtime_pb2.WriteRequest()
+        translated_update = request.updates.add()
+        translated_update.CopyFrom(update)
+        converter.convert_entity(translated_update.entity, verbose=self.verbose_name_converting)
+        if digest_settings_by_id is not None and translated_update.type != Update.DELETE:
+            digest_entry = translated_update.entity.digest_entry
+            digest_settings = digest_settings_by_id.get(digest_entry.digest_id)
+            if digest_settings is not None:
+                self._apply_digest_settings(digest_entry.config, digest_settings)
+        return request.SerializeToString()
+
+    @staticmethod
+    def _apply_digest_settings(config: p4runtime_pb2.DigestEntry.Config, digest_settings: ProxyDigestSettings) -> None:
+        if digest_settings.max_list_size is not None:
+            config.max_list_size = digest_settings.max_list_size
+        if digest_settings.max_timeout_ns is not None:
+            config.max_timeout_ns = digest_settings.max_timeout_ns
+        if digest_settings.ack_timeout_ns is not None:
+            config.ack_timeout_ns = digest_settings.ack_timeout_ns
+
     async def Read(self, original_request: p4runtime_pb2.ReadRequest, context):
         """Read one or more P4 entities from the target.
+
+        The answer is streamed in ReadResponses of at most max_response_entities entities.
+        The answers can be shared with identical Read requests, so they must not be modified.
         """
         if self.verbose:
             print('------------------- Read -------------------')
 
-        read_entites_by_target_switch = {k: [] for k in self._target_switches.keys()}
-        for entity in original_request.entities:
+        async for response in self._read_coalesced(original_request):
+            if self.verbose:
+                print('--------- Response for read:')
+                print(response)
+            yield response
+
+    async def _read_coalesced(self, original_request: p4runtime_pb2.ReadRequest) -> AsyncIterator[ReadResponse]:
+        cache_ttl = self._get_read_cache_ttl(original_request)
+        if cache_ttl is None and not self.read_settings.coalesce_reads:
+            self.read_cache_stats.misses += 1
+            async for response in self._read_from_target_switches(original_request):
+                yield response
+            return
+
+        request_key = original_request.SerializeToString(deterministic=True)
+        shared_answer = None
+        if cache_ttl is not None:
+            cached = self._read_cache.get(request_key)
+            if cached is not None and cached[0] > time.monotonic():
+                self.read_cache_stats.hits += 1
+                shared_answer = cached[1]
+
+        if shared_answer is None:
+            shared_answer = self._in_flight_reads.get(request_key)
+            if shared_answer is not None:
+                self.read_cache_stats.coalesced += 1
+            elif cache_ttl is None and request_key not in self._in_flight_direct_reads:
+                # Nothing to share the answer with, it is streamed without keeping its responses
+                self.read_cache_stats.misses += 1
+                self._in_flight_direct_reads[request_key] = self._in_flight_direct_reads.get(request_key, 0) + 1
+                try:
+                    async for response in self._read_from_target_switches(original_request):
+                        yield response
+                finally:
+                    self._in_flight_direct_reads[request_key] -= 1
+                    if self._in_flight_direct_reads[request_key] == 0:
+                        del self._in_flight_direct_reads[request_key]
+                return
+            else:
+                self.read_cache_stats.misses += 1
+                shared_answer = self._start_shared_read(request_key, original_request, cache_ttl)
+
+        async for response in shared_answer.replay():
+            yield response
+
+    def _start_shared_read(self, request_key: bytes, original_request: p4runtime_pb2.ReadRequest, cache_ttl: Optional[float]) -> SharedReadAnswer:
+        """Reads the targets in a task of its own, so a cancelled Read does not cancel the answer of the identical Reads."""
+        shared_answer = SharedReadAnswer()
+        generation = self._read_cache_generation
+
+        async def read() -> None:
             try:
-                for target_switch, target_switch_index in self.get_multi_target_switch_and_index(entity):
-                    read_entites_by_target_switch[target_switch_index].append(entity)
-            except EntityCannotHaveZeroId:
-                for target_switch_index, target_switch in self._target_switches.items():
+                async for response in self._read_from_target_switches(original_request):
+                    shared_answer.add(response)
+                shared_answer.finish()
+                if cache_ttl is not None and generation == self._read_cache_generation:
+                    self._read_cache[request_key] = (time.monotonic() + cache_ttl, shared_answer)
+            except Exception as e:
+                shared_answer.finish(e)
+            finally:
+                if not shared_answer.done:
+                    shared_answer.finish(Exception('The Read of the target switches was cancelled'))
+                if self._in_flight_reads.get(request_key) is shared_answer:
+                    del self._in_flight_reads[request_key]
+
+        if self.read_settings.coalesce_reads:
+            self._in_flight_reads[request_key] = shared_answer
+        asyncio.ensure_future(read())
+        return shared_answer
+
+    def _get_read_cache_ttl(self, request: p4runtime_pb2.ReadRequest) -> Optional[float]:
+        """The shortest TTL of the requested entity types, None if any of them is not cached."""
+        if len(self.read_settings.cache_ttl) == 0 or len(request.entities) == 0:
+            return None
+
+        ttl = None
+        for entity in request.entities:
+            entity_ttl = self.read_settings.cache_ttl.get(entity.WhichOneof('entity'))
+            if entity_ttl is None or entity_ttl <= 0:
+                return None
+            ttl = entity_ttl if ttl is None else min(ttl, entity_ttl)
+        return ttl
+
+    def invalidate_read_cache(self) -> None:
+        """Called when the state of the targets changes, later Reads do not get an answer read before it."""
+        self._read_cache_generation += 1
+        self._read_cache.clear()
+        self._in_flight_reads.clear()
+
+    async def _read_from_target_switches(self, original_request: p4runtime_pb2.ReadRequest) -> AsyncIterator[ReadResponse]:
+        """Streams the entities read from the targets as soon as they arrive.
+
+        Only the entities that are read from more than one target switch (or more than once) and the counters
+        that the counters of the removed target switches are added to are merged, they are sent after all reads finished.
+        """
+        read_entites_by_target_switch = {k: [] for k in self._target_switches.keys()}
+        read_count_by_merge_key: Dict[ReadMergeKey, int] = {}
+        for original_entity in original_request.entities:
+            # Only the entities of this source are read, not every entity of the shared target switches
+            for entity, target_switches_and_indices in self._expand_wildcard_read_entity(original_entity):
+                for target_switch, target_switch_index in target_switches_and_indices:
                     read_entites_by_target_switch[target_switch_index].append(entity)
+                    merge_key = self._get_read_merge_key(entity)
+                    if merge_key is not None:
+                        read_count_by_merge_key[merge_key] = read_count_by_merge_key.get(merge_key, 0) + 1
+
+        merge_removed_counters = RedisMode.is_reading(self.redis_mode) and len(self._get_removed_counters()) > 0
+        merged_keys = {
+            merge_key
+            for merge_key, read_count in read_count_by_merge_key.items()
+            if read_count > 1 or (merge_removed_counters and merge_key[0] in ['counter_entry', 'direct_counter_entry'])
+        }
 
-        received_entries = []
+        # Answered by the shadow table stores of the targets, instead of reading the switches
+        shadowed_entities_by_target_switch: Dict[str, List[p4runtime_pb2.Entity]] = {}
         for target_switch_index, read_entites_for_target_switch in read_entites_by_target_switch.items():
-            if len(read_entites_for_target_switch) == 0:
+            shadow_store = self._target_switches[target_switch_index].shadow_store
+            if shadow_store is None:
                 continue
-            target_switch_object = self._target_switches[target_switch_index]
+            not_shadowed_read_entities = []
+            for entity in read_entites_for_target_switch:
+                shadowed_entities = shadow_store.read(entity)
+                if shadowed_entities is None:
+                    not_shadowed_read_entities.append(entity)
+                else:
+                    shadowed_entities_by_target_switch.setdefault(target_switch_index, []).extend(shadowed_entities)
+            read_entites_by_target_switch[target_switch_index] = not_shadowed_read_entities
+
+        merger = EntityMerger()
+        # Batches of entities that are sent without merging, None when every read finished
+        streamed_entities: asyncio.Queue = asyncio.Queue(maxsize=2)
+        read_tasks = {
+            asyncio.ensure_future(self._read_from_target_switch(target_switch_index, read_entites_for_target_switch, merger,
+                                                                merged_keys, streamed_entities)): target_switch_index
+            for target_switch_index, read_entites_for_target_switch in read_entites_by_target_switch.items()
+            if len(read_entites_for_target_switch) > 0
+        }
+        for target_switch_index, shadowed_entities in shadowed_entities_by_target_switch.items():
+            read_tasks[asyncio.ensure_future(self._forward_read_entities(shadowed_entities, merger, merged_keys, streamed_entities))] = target_switch_index
 
-            new_request = p4runtime_pb2.ReadRequest()
-            new_request.device_id = target_switch_object.high_level_connection.device_id
+        async def wait_for_target_reads() -> None:
+            # Cancelled when the consumer is gone, then nobody would take the None from the full queue, so it is not put
+            try:
+                await self._wait_for_target_reads(read_tasks)
+            except Exception:
+                # The consumer stops at the None and gets the error from the task
+                await streamed_entities.put(None)
+                raise
+            await streamed_entities.put(None)
+
+        wait_task = asyncio.ensure_future(wait_for_target_reads())
+        try:
+            response = ReadResponse()
+            is_any_sent = False
+            while True:
+                entities = await streamed_entities.get()
+                if entities is None:
+                    break
+                for entity in entities:
+                    response.entities.add().CopyFrom(entity)
+                    if len(response.entities) >= self.read_settings.max_response_entities:
+                        yield response
+                        is_any_sent = True
+                        response = ReadResponse()
+            await wait_task
+        finally:
+            wait_task.cancel()
+            for read_task in read_tasks:
+                read_task.cancel()
 
-            for original_read_entity in read_entites_for_target_switch:
-                read_entity = new_request.entities.add()
-                read_entity.CopyFrom(original_read_entity)
-                target_switch_object.converter.convert_entity(read_entity, reverse=False, verbose=self.verbose_name_converting)
+        if merge_removed_counters:
+            for entity in merger.merge_known_entities_from(self._get_removed_counters()):
+                if self.verbose:
+                    print('Found relevant entity in removed nodes: ')
+                    print(entity)
 
-            if self.verbose:
-                print(f'Request for switch {target_switch_index}')
-                print(new_request)
+        for entity in merger.get_entities():
+            response.entities.add().CopyFrom(entity)
+            if len(response.entities) >= self.read_settings.max_response_entities:
+                yield response
+                is_any_sent = True
+                response = ReadResponse()
+
+        if len(response.entities) > 0 or not is_any_sent:
+            yield response
+
+    def _get_read_merge_key(self, entity: p4runtime_pb2.Entity) -> Optional[ReadMergeKey]:
+        """The read entities and the answered entities with the same key can overlap, None if the entity is not routed by id."""
+        which_one = entity.WhichOneof('entity')
+        if which_one not in self._wildcard_read_ids:
+            return None
+        return which_one, P4NameConverter.get_entity_routing_key(entity)
+
+    def _expand_wildcard_read_entity(self, entity: p4runtime_pb2.Entity) -> List[Tuple[p4runtime_pb2.Entity, List[Tuple[TargetSwitchObject, str]]]]:
+        """The entity with its target switches, or one entity per source id if it reads every entity of its type with 0 id.
 
+        An expanded entity goes only to the target switches that have the entity of its id, the ids without any are left out.
+        """
+        if entity.WhichOneof('entity') not in self._wildcard_read_ids:
+            return [(entity, self.get_multi_target_switch_and_index(entity))]
+        try:
+            P4NameConverter.get_entity_routing_key(entity)
+            return [(entity, self.get_multi_target_switch_and_index(entity))]
+        except EntityCannotHaveZeroId:
+            pass
+
+        ret = []
+        for source_id in self._wildcard_read_ids.get(entity.WhichOneof('entity'), []):
+            expanded_entity = p4runtime_pb2.Entity()
+            expanded_entity.CopyFrom(entity)
+            P4NameConverter.set_entity_routing_id(expanded_entity, source_id)
+            routing_key = P4NameConverter.get_entity_routing_key(expanded_entity)
+            id_type, _ = routing_key
+            target_switches_and_indices = [
+                (self._target_switches[index], index)
+                for index in self._routing_index.get(routing_key, [])
+                if source_id in self._target_switches[index].converter.forward_id_table[id_type]
+            ]
+            if len(target_switches_and_indices) > 0:
+                ret.append((expanded_entity, target_switches_and_indices))
+        return ret
+
+    async def _read_from_target_switch(self,
+                                       target_switch_index: str,
+                                       read_entities: List[p4runtime_pb2.Entity],
+                                       merger: EntityMerger,
+                                       merged_keys: Set[ReadMergeKey],
+                                       streamed_entities: asyncio.Queue) -> None:
+        target_switch_object = self._target_switches[target_switch_index]
+
+        new_request = p4runtime_pb2.ReadRequest()
+        new_request.device_id = target_switch_object.high_level_connection.device_id
+
+        for original_read_entity in read_entities:
+            read_entity = new_request.entities.add()
+            read_entity.CopyFrom(original_read_entity)
+            target_switch_object.converter.convert_entity(read_entity, reverse=False, verbose=self.verbose_name_converting)
+
+        if self.verbose:
+            print(f'Request for switch {target_switch_index}')
+            print(new_request)
+
+        async def read_stream() -> None:
             async for result in target_switch_object.high_level_connection.connection.client_stub.Read(new_request):
                 if self.verbose:
-                    print('result:')
+                    print(f'result from switch {target_switch_index}:')
                     print(result)
+                entities = []
                 for entity in result.entities:
                     entity_name = target_switch_object.converter.get_target_entity_name(entity)
                     if get_pure_p4_name(entity_name).startswith(self.prefix):
                         target_switch_object.converter.convert_entity(entity, reverse=True, verbose=self.verbose_name_converting)
-                        received_entries.append(entity)
+                        entities.append(entity)
+                await self._forward_read_entities(entities, merger, merged_keys, streamed_entities)
 
-        if RedisMode.is_reading(self.redis_mode):
-            for protobuf_entity_json_object in get_redis().lrange(self.redis_keys.REMOVED_COUNTER_ENTRIES, 0, -1):
-                entity = Parse(protobuf_entity_json_object, p4runtime_pb2.Entity())
-                if EntityHelper.is_entity_mergable_to_entity_list(entity, received_entries):
-                    if self.verbose:
-                        print('Found relevant entity in removed nodes: ')
-                        print(entity)
-                    received_entries.append(entity)
+        if self.read_settings.target_timeout is None:
+            await read_stream()
+        else:
+            await asyncio.wait_for(read_stream(), self.read_settings.target_timeout)
+
+    async def _forward_read_entities(self,
+                                     entities: List[p4runtime_pb2.Entity],
+                                     merger: EntityMerger,
+                                     merged_keys: Set[ReadMergeKey],
+                                     streamed_entities: asyncio.Queue) -> None:
+        entities_to_stream = []
+        for entity in entities:
+            if self._get_read_merge_key(entity) in merged_keys:
+                merger.add(entity)
+            else:
+                entities_to_stream.append(entity)
+
+        # The batches are bounded, so a large answer of a target does not pile up while the client is slower
+        for batch_start in range(0, len(entities_to_stream), self.read_settings.max_response_entities):
+            await streamed_entities.put(entities_to_stream[batch_start:batch_start + self.read_settings.max_response_entities])
+
+    async def _wait_for_target_reads(self, read_tasks: Dict[asyncio.Task, str]) -> None:
+        """Waits for the reads of the target switches, a failed or timed out read is handled by the partial result policy.
 
+        With the PARTIAL policy the entities already merged from a failed target switch are kept in the answer.
+        """
+        if len(read_tasks) == 0:
+            return
 
-        received_entries = EntityHelper.merge_duplicates_for_read_answer(received_entries)
+        pending = set(read_tasks.keys())
+        while len(pending) > 0:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_EXCEPTION)
+            for task in done:
+                error = task.exception()
+                if error is None:
+                    continue
 
-        ret = ReadResponse()
-        for entity in received_entries:
-            ret_entity = ret.entities.add()
-            ret_entity.CopyFrom(entity)
+                target_switch_index = read_tasks[task]
+                if isinstance(error, asyncio.TimeoutError):
+                    message = f'Read from target switch {target_switch_index} timed out after {self.read_settings.target_timeout}s'
+                else:
+                    message = f'Read from target switch {target_switch_index} failed: {error}'
 
-        if self.verbose:
-            print('--------- Response for read:')
-            print(ret)
+                if self.read_settings.partial_result_policy == ReadPartialResultPolicy.FAIL:
+                    for pending_task in pending:
+                        pending_task.cancel()
+                    raise Exception(message) from error
 
-        yield ret
+                logger.warning(f'{message}, answering with partial results')
 
     async def SetForwardingPipelineConfig(self, request: p4runtime_pb2.SetForwardingPipelineConfigRequest, context):
         if self.verbose:
             print('SetForwardingPipelineConfig')
             logger.info(request)
         # Do not forward p4info just save it, on init we load the p4info
+        if self.redis_journal is not None:
+            await self.redis_journal.flush()
         self.delete_redis_entries_for_this_service()
         self.raw_p4info = MessageToString(request.config.p4info)
         if RedisMode.is_writing(self.redis_mode):
@@ -476,23 +1128,175 @@ class ProxyP4RuntimeServicer(P4RuntimeServicer):
                     print('Sendin back master arbitrage ACK')
                 yield response
 
-                while self.running:
-                    stream_response: StreamMessageResponseWithInfo = await self.stream_queue_from_target.get()
-                    target_switch = self._target_switches[stream_response.extra_information]
-                    if self.verbose:
-                        print('Arrived stream_response_from target')
-                        print(stream_response)
-                    which_one = stream_response.message.WhichOneof('update')
-                    if which_one == 'digest':
-                        name = target_switch.converter.get_target_p4_name_from_id('digest', stream_response.message.digest.digest_id)
-                        if name.startswith(self.prefix):
-                            target_switch.converter.convert_stream_response(stream_response.message)
-                            yield stream_response.message
-                    else:
-                        raise Exception('Only handling digest messages from the dataplane')
+                self._start_stream_publisher()
+                subscription = self.stream_message_bus.subscribe()
+                # The later messages of the controller are read while the stream messages are sent to it
+                request_handler_task = asyncio.ensure_future(self._handle_stream_requests(request_iterator))
+                try:
+                    while self.running:
+                        yield await self.stream_message_bus.get(subscription)
+                finally:
+                    request_handler_task.cancel()
+                    self.stream_message_bus.unsubscribe(subscription)
             else:
                 raise Exception(f'Unhandled Stream field type {request.WhichOneof}')
 
+    async def _handle_stream_requests(self, request_iterator) -> None:
+        """Handles the messages of a controller stream that arrive after the arbitration."""
+        async for request in request_iterator:
+            if self.verbose:
+                print(request)
+            which_one = request.WhichOneof('update')
+            if which_one == 'packet':
+                await self._forward_packet_out(request)
+            elif which_one == 'digest_ack':
+                await self._forward_digest_ack(request.digest_ack)
+            else:
+                logger.warning(f'Unhandled Stream field type {which_one}, dropping the message')
+
+    async def _forward_packet_out(self, request: p4runtime_pb2.StreamMessageRequest) -> None:
+        target_switch = self._get_packet_out_target_switch(request.packet)
+        if target_switch is None:
+            logger.warning('No target switch of the source takes the packet-out, dropping it')
+            return
+
+        # The request is not used after this, so it is translated in place and sent as it is
+        target_switch.converter.convert_packet_metadata(request.packet)
+        await target_switch.high_level_connection.connection.SendStreamMessage(request)
+
+    def _get_packet_out_target_switch(self, packet: p4runtime_pb2.PacketOut) -> Optional[TargetSwitchObject]:
+        """The target switch of the source that the packet-out is sent to.
+
+        If the source has more target switches with a packet_out controller header, the one whose packet_ports
+        contain the egress_port of the packet-out is chosen, otherwise the first one without packet_ports (it has all ports).
+        """
+        target_switches = [target_switch for target_switch in self._target_switches.values() if target_switch.converter.packet_out_metadata_table is not None]
+        if len(target_switches) == 1 and target_switches[0].packet_ports is None:
+            return target_switches[0]
+
+        egress_port = self._get_packet_port(packet, self._packet_out_port_metadata_id)
+        for target_switch in target_switches:
+            if target_switch.packet_ports is not None and egress_port in target_switch.packet_ports:
+                return target_switch
+        for target_switch in target_switches:
+            if target_switch.packet_ports is None:
+                return target_switch
+        return None
+
+    def _get_source_packet_metadata_id(self, controller_header_name: str, metadata_name: str) -> Optional[int]:
+        for controller_header in self.from_p4info_helper.p4info.controller_packet_metadata:
+            if controller_header.preamble.name == controller_header_name:
+                for metadata in controller_header.metadata:
+                    if metadata.name == metadata_name:
+                        return metadata.id
+        return None
+
+    @staticmethod
+    def _get_packet_port(packet: Union[p4runtime_pb2.PacketIn, p4runtime_pb2.PacketOut],
+                         port_metadata_id: Optional[int],
+                         metadata_table: Optional[Dict[int, int]] = None) -> Optional[int]:
+        """The port in the metadata of the packet, metadata_table translates the metadata ids of a target packet-in to the source."""
+        if port_metadata_id is None:
+            return None
+        for metadata in packet.metadata:
+            metadata_id = metadata.metadata_id if metadata_table is None else metadata_table.get(metadata.metadata_id)
+            if metadata_id == port_metadata_id:
+                return int.from_bytes(metadata.value, 'big')
+        return None
+
+    async def _forward_digest_ack(self, digest_ack: p4runtime_pb2.DigestListAck) -> None:
+        if self.stream_settings.digest_ack_mode == DigestAckMode.AUTO:
+            # The proxy acked the DigestLists of the targets when they were enqueued
+            return
+
+        origins = self._unacked_digest_lists.pop((digest_ack.digest_id, digest_ack.list_id), None)
+        if origins is None:
+            # Acked by another controller stream already, or forgotten
+            return
+        for target_switch_index, target_digest_id, target_list_id in origins:
+            target_switch = self._target_switches.get(target_switch_index)
+            if target_switch is not None:
+                await target_switch.high_level_connection.connection.SendDigestListAck(target_digest_id, target_list_id)
+
+    def _start_stream_publisher(self) -> None:
+        if self._stream_publisher_task is None:
+            self._stream_publisher_task = asyncio.ensure_future(self._publish_stream_messages())
+
+    async def _publish_stream_messages(self) -> None:
+        """Converts the messages of the targets' streams to the source and publishes them to the StreamChannels."""
+        while self.running:
+            stream_response: StreamMessageResponseWithInfo = await self.stream_queue_from_target.get()
+            try:
+                await self._publish_stream_message(stream_response)
+            except Exception:
+                # A message that cannot be converted must not stop the delivery of the others
+                logger.exception(f'Cannot publish a stream message of {stream_response.extra_information}, dropping it')
+
+    async def _publish_stream_message(self, stream_response: StreamMessageResponseWithInfo) -> None:
+        target_switch = self._target_switches.get(stream_response.extra_information)
+        if target_switch is None:
+            # Arrived before the target switch was removed
+            return
+        if self.verbose:
+            print('Arrived stream_response_from target')
+            print(stream_response)
+        message = stream_response.message
+        which_one = message.WhichOneof('update')
+        if which_one == 'digest':
+            # Digests of other prefixes have no source id
+            source_digest_id = target_switch.converter.get_source_id('digest', message.digest.digest_id)
+            if source_digest_id is None:
+                return
+            origin = (stream_response.extra_information, message.digest.digest_id, message.digest.list_id)
+            if self.digest_aggregator is not None:
+                await self.digest_aggregator.add(source_digest_id, message.digest, origin)
+            else:
+                pass_through_acks = self.stream_settings.digest_ack_mode == DigestAckMode.PASS_THROUGH
+                outbound_message = message
+                if source_digest_id != message.digest.digest_id or pass_through_acks:
+                    # The message is shared with the other subscribers of the target switch, only the outbound copy is translated
+                    outbound_message = p4runtime_pb2.StreamMessageResponse()
+                    outbound_message.digest.CopyFrom(message.digest)
+                    outbound_message.digest.digest_id = source_digest_id
+                    if pass_through_acks:
+                        # The targets number their lists independently, so the list_id of the proxy identifies the ack
+                        outbound_message.digest.list_id = next(self._digest_list_ids)
+                await self._publish_digest_list(outbound_message, [origin])
+            if self.stream_settings.digest_ack_mode == DigestAckMode.AUTO:
+                await target_switch.high_level_connection.connection.SendDigestListAck(message.digest.digest_id, message.digest.list_id)
+        elif which_one == 'packet':
+            metadata_table = target_switch.converter.packet_in_metadata_table
+            if metadata_table is None:
+                # The source has no packet_in controller header
+                return
+            if target_switch.packet_ports is not None and \
+                    self._get_packet_port(message.packet, self._packet_in_port_metadata_id, metadata_table) not in target_switch.packet_ports:
+                # Arrived on a port of the target that belongs to another source
+                return
+            outbound_message = message
+            if any(metadata_table.get(metadata.metadata_id) != metadata.metadata_id for metadata in message.packet.metadata):
+                # Shared with the other subscribers of the target switch like the digests
+                outbound_message = p4runtime_pb2.StreamMessageResponse()
+                outbound_message.packet.CopyFrom(message.packet)
+                target_switch.converter.convert_packet_metadata(outbound_message.packet, reverse=True)
+            await self.stream_message_bus.publish(outbound_message)
+        else:
+            logger.warning(f'Only digest and packet messages are handled from the dataplane, dropping a {which_one} message')
+
+    async def _publish_digest_list(self, message: p4runtime_pb2.StreamMessageResponse, origins: List[DigestListOrigin]) -> None:
+        if self.stream_settings.digest_ack_mode == DigestAckMode.PASS_THROUGH:
+            # Remembered before it is published, so the ack of a fast controller finds it
+            self._unacked_digest_lists[(message.digest.digest_id, message.digest.list_id)] = origins
+            if len(self._unacked_digest_lists) > MAX_UNACKED_DIGEST_LISTS:
+                del self._unacked_digest_lists[next(iter(self._unacked_digest_lists))]
+        await self.stream_message_bus.publish(message)
+
+    def get_stream_subscriber_stats(self) -> List[StreamSubscriberStats]:
+        return self.stream_message_bus.get_stats()
+
+    def get_digest_aggregator_stats(self) -> Optional[DigestAggregatorStats]:
+        return None if self.digest_aggregator is None else self.digest_aggregator.get_stats()
+
     async def Capabilities(self, request: p4runtime_pb2.CapabilitiesRequest, context):
         if self.verbose:
             print('Capabilities')
@@ -522,57 +1326,127 @@ class ProxyP4RuntimeServicer(P4RuntimeServicer):
         if redis_p4info_helper is None:
             return
 
-        for address, target_switch in self._target_switches.items():
-            await self.fill_from_redis_one_target(target_switch, address, redis_p4info_helper)
+        table_entry_updates = await self.load_table_entry_updates_from_redis()
+        await asyncio.gather(*[
+            self.fill_from_redis_one_target(target_switch, address, redis_p4info_helper, table_entry_updates=table_entry_updates)
+            for address, target_switch in self._target_switches.items()
+        ])
 
     async def fill_from_redis_one_target(
             self,
             target_switch: TargetSwitchObject,
             target_switch_index: str,
             redis_p4info_helper: Optional[P4InfoHelper] = None,
-            filter_by_params_allow_only: Optional[ProxyAllowedParamsDict] = None
-    ):
+            filter_by_params_allow_only: Optional[ProxyAllowedParamsDict] = None,
+            table_entry_updates: Optional[List[p4runtime_pb2.Update]] = None
+    ) -> Optional[RedisRestoreStats]:
         if redis_p4info_helper is None:
             redis_p4info_helper = self.build_source_p4infohelper_from_redis()
             if redis_p4info_helper is None:
                 print('Cannot find p4infohelper, skipping filling from redis')
-                return
+                return None
+
+        if table_entry_updates is None:
+            table_entry_updates = await self.load_table_entry_updates_from_redis()
 
         print(f'FILLING FROM REDIS to {target_switch.high_level_connection.host}:{target_switch.high_level_connection.port}')
         if filter_by_params_allow_only is None:
-            used_filter_params_allow_only = target_switch.filter_params_allow_only
+            used_allowed_params_filter = target_switch.allowed_params_filter
         else:
-            used_filter_params_allow_only = filter_by_params_allow_only
+            used_allowed_params_filter = AllowedParamsFilter(self.from_p4info_helper, filter_by_params_allow_only)
 
         high_level_connection = target_switch.high_level_connection
         p4name_converter = P4NameConverter(redis_p4info_helper, high_level_connection.p4info_helper, self.prefix, target_switch.names)
         virtual_target_switch_for_load = TargetSwitchObject(high_level_connection, p4name_converter, target_switch.names)
-        for protobuf_message_json_object in get_redis().lrange(self.redis_keys.TABLE_ENTRIES, 0, -1):
-            parsed_update_object = Parse(protobuf_message_json_object, p4runtime_pb2.Update())
+        restore_stats = RedisRestoreStats(target_switch_index)
+        start_time = time.monotonic()
+        request = self._new_restore_write_request()
+        for parsed_update_object in table_entry_updates:
             name = p4name_converter.get_source_entity_name(parsed_update_object.entity)
             if virtual_target_switch_for_load.names is None or name in virtual_target_switch_for_load.names:
-                if used_filter_params_allow_only is not None and not self.is_parameters_allowed_by_filters(parsed_update_object.entity, used_filter_params_allow_only):
+                if not self.is_parameters_allowed_by_filters(parsed_update_object.entity, used_allowed_params_filter):
                     continue
 
                 if self.verbose:
                     print(parsed_update_object)
-                await self._write_update_object(parsed_update_object, p4name_converter, target_switch_index)
+                request.updates.add().CopyFrom(parsed_update_object)
+                request = await self._send_restore_write_request_if_full(request, p4name_converter, restore_stats, start_time)
 
         if target_switch.fill_counter_from_redis:
-            for protobuf_message_json_object in itertools.chain(get_redis().lrange(self.redis_keys.COUNTER_ENTRIES, 0, -1), get_redis().lrange(self.redis_keys.METER_ENTRIES, 0, -1), ):
-                entity = Parse(protobuf_message_json_object, p4runtime_pb2.Entity())
-                name = p4name_converter.get_source_entity_name(entity)
-                if virtual_target_switch_for_load.names is None or name in virtual_target_switch_for_load.names:
-                    if used_filter_params_allow_only is not None and not self.is_parameters_allowed_by_filters(entity, used_filter_params_allow_only):
-                        continue
-
-                    if self.verbose:
-                        print(entity)
-
-                    update = p4runtime_pb2.Update()
-                    update.type = p4runtime_pb2.Update.MODIFY
-                    update.entity.CopyFrom(entity)
-                    await self._write_update_object(update, p4name_converter, target_switch_index)
+            page_size = self.redis_settings.restore_page_size
+            # Counters are in COUNTER_STATE with the KEYED layout and in COUNTER_ENTRIES with the LOG layout
+            all_redis_pages = [
+                iter_redis_hash_pages(get_async_redis(), self.redis_keys.COUNTER_STATE, page_size),
+                iter_redis_list_pages(get_async_redis(), self.redis_keys.COUNTER_ENTRIES, page_size),
+                iter_redis_list_pages(get_async_redis(), self.redis_keys.METER_ENTRIES, page_size),
+            ]
+            for redis_pages in all_redis_pages:
+                async for page in redis_pages:
+                    for protobuf_message_json_object in page:
+                        entity = decode_redis_record(protobuf_message_json_object, p4runtime_pb2.Entity)
+                        name = p4name_converter.get_source_entity_name(entity)
+                        if virtual_target_switch_for_load.names is None or name in virtual_target_switch_for_load.names:
+                            if not self.is_parameters_allowed_by_filters(entity, used_allowed_params_filter):
+                                continue
+
+                            if self.verbose:
+                                print(entity)
+
+                            update = request.updates.add()
+                            update.type = p4runtime_pb2.Update.MODIFY
+                            update.entity.CopyFrom(entity)
+                            request = await self._send_restore_write_request_if_full(request, p4name_converter, restore_stats, start_time)
+
+        await self._send_restore_write_request(request, p4name_converter, restore_stats, start_time)
+        print(f'Restored {restore_stats.entries} entries to {target_switch_index} in {restore_stats.write_requests} write requests, '
+              f'{restore_stats.elapsed:.2f}s ({restore_stats.entries_per_sec:.0f} entries/s)')
+        return restore_stats
+
+    async def load_table_entry_updates_from_redis(self) -> List[p4runtime_pb2.Update]:
+        """Reads the table entry state and log from redis page by page and collapses them into the live entries."""
+        if self.redis_journal is not None:
+            await self.redis_journal.flush()
+
+        page_size = self.redis_settings.restore_page_size
+        collapsed: Dict[bytes, p4runtime_pb2.Update] = {}
+        # A log next to the hash is always newer, it is left only by the LOG layout
+        async for page in iter_redis_hash_pages(get_async_redis(), self.redis_keys.TABLE_STATE, page_size):
+            EntityHelper.collapse_table_entry_updates((decode_redis_record(raw_record, p4runtime_pb2.Update) for raw_record in page), collapsed)
+        async for page in iter_redis_list_pages(get_async_redis(), self.redis_keys.TABLE_ENTRIES, page_size):
+            EntityHelper.collapse_table_entry_updates((decode_redis_record(raw_record, p4runtime_pb2.Update) for raw_record in page), collapsed)
+
+        return list(collapsed.values())
+
+    @staticmethod
+    def _new_restore_write_request() -> p4runtime_pb2.WriteRequest:
+        request = p4runtime_pb2.WriteRequest()
+        request.device_id = 0
+        request.election_id.low = 1
+        return request
+
+    async def _send_restore_write_request_if_full(self,
+                                                  request: p4runtime_pb2.WriteRequest,
+                                                  converter: P4NameConverter,
+                                                  restore_stats: RedisRestoreStats,
+                                                  start_time: float) -> p4runtime_pb2.WriteRequest:
+        if len(request.updates) < self.redis_settings.restore_batch_size:
+            return request
+
+        await self._send_restore_write_request(request, converter, restore_stats, start_time)
+        if self.ticker.is_tick_passed(f'restore_{restore_stats.target_switch_index}', 1):
+            print(f'Restoring to {restore_stats.target_switch_index}: {restore_stats.entries} entries sent ({restore_stats.entries_per_sec:.0f} entries/s)')
+        return self._new_restore_write_request()
+
+    async def _send_restore_write_request(self,
+                                          request: p4runtime_pb2.WriteRequest,
+                                          converter: P4NameConverter,
+                                          restore_stats: RedisRestoreStats,
+                                          start_time: float) -> None:
+        if len(request.updates) > 0:
+            await self.Write(request, None, converter, restore_stats.target_switch_index, save_to_redis=False)
+            restore_stats.entries += len(request.updates)
+            restore_stats.write_requests += 1
+        restore_stats.elapsed = time.monotonic() - start_time
 
     async def _write_update_object(self,
                                    update_object: p4runtime_pb2.Update,
@@ -586,22 +1460,155 @@ class ProxyP4RuntimeServicer(P4RuntimeServicer):
         update.CopyFrom(update_object)
         await self.Write(request, None, converter, target_switch_index, save_to_redis=False, use_filtering=use_filtering)
 
+    def _append_table_entry_update_to_journal(self, update: p4runtime_pb2.Update) -> None:
+        if self.redis_settings.state_layout == RedisStateLayout.KEYED:
+            key = EntityHelper.get_table_entry_key(update.entity.table_entry)
+            if update.type == Update.DELETE:
+                self.redis_journal.append('hdel', self.redis_keys.TABLE_STATE, key)
+            else:
+                # Only the live entry is kept, so it is restored with INSERT, except the default entry that can be only modified
+                stored_update = Update()
+                stored_update.type = Update.MODIFY if update.entity.table_entry.is_default_action else Update.INSERT
+                stored_update.entity.CopyFrom(update.entity)
+                self.redis_journal.append('hset', self.redis_keys.TABLE_STATE, key, self.encode_redis_record(stored_update))
+        else:
+            self.redis_journal.append('rpush', self.redis_keys.TABLE_ENTRIES, self.encode_redis_record(update))
+
+    def compact_redis_table_entries(self) -> None:
+        if not RedisMode.is_writing(self.redis_mode) or self.redis_settings.state_layout != RedisStateLayout.KEYED:
+            return
+
+        compacted_num = compact_table_entries_log(get_redis(), self.redis_keys.TABLE_ENTRIES, self.redis_keys.TABLE_STATE, self.redis_settings.storage_format)
+        if compacted_num > 0:
+            print(f'Compacted {compacted_num} updates of {self.redis_keys.TABLE_ENTRIES} into {self.redis_keys.TABLE_STATE}')
+
+    def encode_redis_record(self, message: Message) -> Union[bytes, str]:
+        return encode_redis_record(message, self.redis_settings.storage_format)
+
+    def migrate_redis_storage_format(self) -> None:
+        if not RedisMode.is_writing(self.redis_mode):
+            return
+
+        for redis_record in [RedisRecords.TABLE_ENTRIES, RedisRecords.COUNTER_ENTRIES, RedisRecords.METER_ENTRIES, RedisRecords.REMOVED_COUNTER_ENTRIES]:
+            redis_key = getattr(self.redis_keys, redis_record.postfix)
+            converted_num = migrate_redis_list_storage_format(get_redis(), redis_key, redis_record.message_class, self.redis_settings.storage_format)
+            if converted_num > 0:
+                print(f'Migrated {converted_num} records of {redis_key} to {self.redis_settings.storage_format.value} format')
+
+        for redis_record in [RedisRecords.TABLE_STATE, RedisRecords.COUNTER_STATE]:
+            redis_key = getattr(self.redis_keys, redis_record.postfix)
+            converted_num = migrate_redis_hash_storage_format(get_redis(), redis_key, redis_record.message_class, self.redis_settings.storage_format)
+            if converted_num > 0:
+                print(f'Migrated {converted_num} records of {redis_key} to {self.redis_settings.storage_format.value} format')
+
+    def get_write_window_stats(self) -> Dict[str, WriteWindowStats]:
+        return {index: target_switch.high_level_connection.connection.write_window.get_stats() for index, target_switch in self._target_switches.items()}
+
+    def get_read_cache_stats(self) -> ReadCacheStats:
+        return self.read_cache_stats
+
+    def get_counter_poller_stats(self) -> Dict[str, CounterPollerStats]:
+        return {index: target_switch.high_level_connection.counter_poller.get_stats() for index, target_switch in self._target_switches.items()}
+
+    def get_shadow_table_store_stats(self) -> Dict[str, ShadowTableStoreStats]:
+        return {index: target_switch.shadow_store.get_stats() for index, target_switch in self._target_switches.items() if target_switch.shadow_store is not None}
+
+    def get_counter_rates(self, entities: List[p4runtime_pb2.Entity], window: float) -> CounterRates:
+        """Rates of counter and direct counter entities of the source from the counter histories of the target switches.
+
+        The rates of the same counter on several target switches are summed, like the counters of a Read.
+        Target switches without counter history are skipped, the switches are not read.
+        """
+        ret = CounterRates.zeros(len(entities))
+        # target switch index -> positions in entities and the keys of them in the counter history
+        keys_by_target_switch: Dict[str, Tuple[List[int], List[bytes]]] = {}
+        for position, entity in enumerate(entities):
+            for target_switch, target_switch_index in self.get_multi_target_switch_and_index(entity):
+                if target_switch.high_level_connection.counter_poller.history is None:
+                    continue
+                target_entity = p4runtime_pb2.Entity()
+                target_entity.CopyFrom(entity)
+                target_switch.converter.convert_entity(target_entity, verbose=self.verbose_name_converting)
+                positions, keys = keys_by_target_switch.setdefault(target_switch_index, ([], []))
+                positions.append(position)
+                keys.append(EntityHelper.get_counter_entity_key(target_entity))
+
+        for target_switch_index, (positions, keys) in keys_by_target_switch.items():
+            history = self._target_switches[target_switch_index].high_level_connection.counter_poller.history
+            rates = history.get_rates(keys, window)
+            ret.packets_per_sec[positions] += rates.packets_per_sec
+            ret.bytes_per_sec[positions] += rates.bytes_per_sec
+            ret.elapsed[positions] = np.maximum(ret.elapsed[positions], rates.elapsed)
+        return ret
+
+    def get_redis_journal_stats(self) -> Optional[RedisJournalStats]:
+        if self.redis_journal is None:
+            return None
+        return self.redis_journal.get_stats()
+
     def delete_redis_entries_for_this_service(self) -> None:
         if RedisMode.is_writing(self.redis_mode):
             get_redis().delete(self.redis_keys.TABLE_ENTRIES)
+            get_redis().delete(self.redis_keys.TABLE_STATE)
             get_redis().delete(self.redis_keys.COUNTER_ENTRIES)
+            get_redis().delete(self.redis_keys.COUNTER_STATE)
             get_redis().delete(self.redis_keys.METER_ENTRIES)
             get_redis().delete(self.redis_keys.HEARTBEAT)
 
-    async def save_counters_state_to_redis(self) -> None:
-        with get_redis().pipeline() as pipe:
-            pipe.multi()
-            pipe.delete(self.redis_keys.COUNTER_ENTRIES)
-            for target_switch in self._target_switches.values():
-                async for entity in self.return_all_counter_entity(target_switch):
-                    pipe.rpush(self.redis_keys.COUNTER_ENTRIES, MessageToJson(entity))
+    async def save_counters_state_to_redis(self, max_age: float = 0.0) -> int:
+        """Checkpoints the counters of the target switches, returns the number of counter records written to Redis.
+
+        The counters are read through the shared counter poller of the target switches, max_age is passed to it.
+
+        With the KEYED layout only the counters changed since the last checkpoint are written into the COUNTER_STATE hash,
+        with the LOG layout the COUNTER_ENTRIES list is rewritten only if a counter changed.
+        """
+        target_switches = list(self._target_switches.items())
+        entities_by_target_switch = await asyncio.gather(*[self._read_all_counter_entities(target_switch, max_age) for _, target_switch in target_switches])
+
+        # The same counter of different target switches is stored separately, as every target switch has its own value
+        counter_records: Dict[bytes, Tuple[bytes, p4runtime_pb2.Entity]] = {}
+        for (target_switch_index, _), entities in zip(target_switches, entities_by_target_switch):
+            for entity in entities:
+                field = f'{target_switch_index}/'.encode() + EntityHelper.get_counter_entity_key(entity)
+                counter_records[field] = (EntityHelper.get_counter_data(entity).SerializeToString(deterministic=True), entity)
+
+        previous_data = self._checkpointed_counter_data
+        changed_fields = [field for field, (data, _) in counter_records.items() if previous_data is None or previous_data.get(field) != data]
+        removed_fields = [] if previous_data is None else [field for field in previous_data if field not in counter_records]
+
+        written_num = 0
+        async with get_async_redis().pipeline(transaction=True) as pipe:
+            if self.redis_settings.state_layout == RedisStateLayout.KEYED:
+                if previous_data is None:
+                    # The first checkpoint replaces the counters of earlier runs, and of the LOG layout
+                    pipe.delete(self.redis_keys.COUNTER_STATE, self.redis_keys.COUNTER_ENTRIES)
+                if len(removed_fields) > 0:
+                    pipe.hdel(self.redis_keys.COUNTER_STATE, *removed_fields)
+                if len(changed_fields) > 0:
+                    pipe.hset(self.redis_keys.COUNTER_STATE, mapping={field: self.encode_redis_record(counter_records[field][1]) for field in changed_fields})
+                written_num = len(changed_fields)
+            elif previous_data is None or len(changed_fields) > 0 or len(removed_fields) > 0:
+                pipe.delete(self.redis_keys.COUNTER_ENTRIES)
+                if len(counter_records) > 0:
+                    pipe.rpush(self.redis_keys.COUNTER_ENTRIES, *[self.encode_redis_record(entity) for _, entity in counter_records.values()])
+                written_num = len(counter_records)
             pipe.set(self.redis_keys.HEARTBEAT, time.time())
-            pipe.execute()
+            await pipe.execute()
+
+        self._checkpointed_counter_data = {field: data for field, (data, _) in counter_records.items()}
+        if self.verbose:
+            print(f'Counter checkpoint: {len(counter_records)} counters, {written_num} written, {len(removed_fields)} removed')
+        return written_num
+
+    async def _read_all_counter_entities(self, target_switch: TargetSwitchObject, max_age: float) -> List[p4runtime_pb2.Entity]:
+        ret = []
+        for shared_entity in await target_switch.high_level_connection.counter_poller.read(target_switch.counter_subscription, max_age):
+            entity = p4runtime_pb2.Entity()
+            entity.CopyFrom(shared_entity)
+            target_switch.converter.convert_entity(entity, reverse=True, verbose=self.verbose_name_converting)
+            ret.append(entity)
+        return ret
 
     async def return_all_counter_entity(self,
                                         target_switch: TargetSwitchObject,
@@ -611,18 +1618,10 @@ class ProxyP4RuntimeServicer(P4RuntimeServicer):
                                         ) -> AsyncIterator[p4runtime_pb2.Entity]:
 
         request = p4runtime_pb2.ReadRequest()
-        if load_direct_counters:
-            request.device_id = target_switch.high_level_connection.connection.device_id
-            for direct_counter in self.from_p4info_helper.p4info.direct_counters:
-                name = P4NameConverter.get_p4_name_from_id(self.from_p4info_helper, 'table', direct_counter.direct_table_id)
-                if target_switch.names is None or name in target_switch.names:
-                    entity = request.entities.add()
-                    entity.direct_counter_entry.table_entry.table_id = direct_counter.direct_table_id
-                    target_switch.converter.convert_entity(entity, verbose=self.verbose_name_converting)
-
-        if load_simple_counters:
-            entity = request.entities.add()
-            entity.counter_entry.counter_id = 0
+        request.device_id = target_switch.high_level_connection.connection.device_id
+        request.entities.extend(self._get_counter_read_entities(target_switch, load_simple_counters, load_direct_counters))
+        if len(request.entities) == 0:
+            return
 
         async for response in target_switch.high_level_connection.connection.client_stub.Read(request):
             for entity in response.entities:
@@ -644,7 +1643,10 @@ class ProxyServer:
                  prefix: str,
                  from_p4info_path: str,
                  target_switche_configs_or_one_connection: Union[List[TargetSwitchConfig], HighLevelSwitchConnection],
-                 redis_mode: RedisMode):
+                 redis_mode: RedisMode,
+                 redis_settings: Optional[ProxyRedisSettings] = None,
+                 read_settings: Optional[ProxyReadSettings] = None,
+                 stream_settings: Optional[ProxyStreamSettings] = None):
         self.port = port
         self.prefix = prefix
         self.from_p4info_path = from_p4info_path
@@ -658,12 +1660,18 @@ class ProxyServer:
         self.server = None
         self.servicer = None
         self.redis_mode = redis_mode
+        self.redis_settings = redis_settings
+        self.read_settings = read_settings
+        self.stream_settings = stream_settings
         self.awaitable = None
 
     async def start(self) -> None:
         self.server = grpc.aio.server()
-        self.servicer = ProxyP4RuntimeServicer(self.prefix, self.from_p4info_path, self.target_switch_configs, self.redis_mode)
+        self.servicer = ProxyP4RuntimeServicer(self.prefix, self.from_p4info_path, self.target_switch_configs, self.redis_mode, self.redis_settings, self.read_settings,
+                                               self.stream_settings)
         servicer_awaitable = self.servicer.start()
+        self.servicer.migrate_redis_storage_format()
+        self.servicer.compact_redis_table_entries()
         if RedisMode.is_reading(self.redis_mode):
             await self.servicer.fill_from_redis()
         add_P4RuntimeServicer_to_server(self.servicer, self.server)
@@ -688,6 +1696,34 @@ class ProxyServer:
         await self.servicer.remove_from_filter_params_allow_only_to_host(host, port, filters_to_remove)
 
 
+    def get_write_window_stats(self) -> Dict[str, WriteWindowStats]:
+        self.assert_inited()
+        return self.servicer.get_write_window_stats()
+
+    def get_read_cache_stats(self) -> ReadCacheStats:
+        self.assert_inited()
+        return self.servicer.get_read_cache_stats()
+
+    def get_counter_poller_stats(self) -> Dict[str, CounterPollerStats]:
+        self.assert_inited()
+        return self.servicer.get_counter_poller_stats()
+
+    def get_stream_subscriber_stats(self) -> List[StreamSubscriberStats]:
+        self.assert_inited()
+        return self.servicer.get_stream_subscriber_stats()
+
+    def get_digest_aggregator_stats(self) -> Optional[DigestAggregatorStats]:
+        self.assert_inited()
+        return self.servicer.get_digest_aggregator_stats()
+
+    def get_shadow_table_store_stats(self) -> Dict[str, ShadowTableStoreStats]:
+        self.assert_inited()
+        return self.servicer.get_shadow_table_store_stats()
+
+    def get_counter_rates(self, entities: List[p4runtime_pb2.Entity], window: float) -> CounterRates:
+        self.assert_inited()
+        return self.servicer.get_counter_rates(entities, window)
+
     def assert_inited(self) -> None:
         if self.servicer is None:
             raise Exception('Proxy server has to be started to remove a node')
@@ -700,7 +1736,7 @@ class ProxyServer:
 
     async def stop(self) -> None:
         await self.servicer.stop()
-        self.server.stop(grace=None)
+        await self.server.stop(grace=None)
 
 
 async def start_servers_by_proxy_config(proxy_config: ProxyConfig) -> List[ProxyServer]:
@@ -725,15 +1761,27 @@ async def start_servers_by_proxy_config(proxy_config: ProxyConfig) -> List[Proxy
                 rate_limit=target_config_raw.rate_limit,
                 rate_limiter_buffer_size=target_config_raw.rate_limiter_buffer_size,
                 batch_delay=target_config_raw.batch_delay,
-                host=target_config_raw.host
+                host=target_config_raw.host,
+                max_in_flight_writes=target_config_raw.max_in_flight_writes,
+                ordered_writes=target_config_raw.ordered_writes,
+                counter_history_depth=target_config_raw.counter_history_depth,
+                counter_poll_interval=target_config_raw.counter_poll_interval
                 )
             await mapping_target_switch.init()
 
-            target_switch_configs.append(TargetSwitchConfig(mapping_target_switch, target_config_raw.names, target_config_raw.filter_params_allow_only))
+            target_switch_configs.append(TargetSwitchConfig(
+                mapping_target_switch,
+                target_config_raw.names,
+                target_config_raw.filter_params_allow_only,
+                shadow_reconcile_interval=target_config_raw.shadow_reconcile_interval,
+                digest_settings=target_config_raw.digests,
+                packet_ports=target_config_raw.packet_ports
+            ))
 
         for source in source_configs_raw:
             p4info_path = f"build/{source.program_name}.p4.p4info.txt"
-            proxy_server = ProxyServer(source.port, source.prefix, p4info_path, target_switch_configs, proxy_config.redis)
+            proxy_server = ProxyServer(source.port, source.prefix, p4info_path, target_switch_configs, proxy_config.redis, proxy_config.redis_settings,
+                                       source.read_settings, source.stream_settings)
             proxy_server.awaitable = proxy_server.start()
             servers.append(proxy_server)
 
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+import sys
+
+from p4.v1 import p4runtime_pb2
+
+from common.allowed_params_filter import AllowedParamsFilter
+from common.controller_helper import ControllerExceptionHandling
+from common.p4runtime_lib.helper import P4InfoHelper
+from common.validator_tools import Validator
+
+P4INFO = '''
+tables {
+  preamble { id: 1 name: "MyIngress.fwd" alias: "fwd" }
+  match_fields { id: 1 name: "hdr.ipv4.dstAddr" bitwidth: 32 match_type: EXACT }
+  match_fields { id: 2 name: "standard_metadata.ingress_port" bitwidth: 9 match_type: EXACT }
+}
+tables {
+  preamble { id: 2 name: "MyIngress.lpm" alias: "lpm" }
+  match_fields { id: 1 name: "hdr.ipv4.dstAddr" bitwidth: 32 match_type: LPM }
+}
+tables {
+  preamble { id: 3 name: "MyIngress.mac" alias: "mac" }
+  match_fields { id: 1 name: "hdr.ethernet.dstAddr" bitwidth: 48 match_type: EXACT }
+}
+'''
+
+
+def build_table_entity(p4info_helper: P4InfoHelper, table_name: str, match_fields: dict) -> p4runtime_pb2.Entity:
+    entity = p4runtime_pb2.Entity()
+    for match_field_name, value in match_fields.items():
+        entity.table_entry.match.append(p4info_helper.get_match_field_pb(table_name, match_field_name, value))
+    entity.table_entry.table_id = p4info_helper.get_tables_id(table_name)
+    return entity
+
+
+with ControllerExceptionHandling():
+    validator = Validator()
+    p4info_helper = P4InfoHelper(raw_p4info=P4INFO)
+    allowed_params_filter = AllowedParamsFilter(p4info_helper, {'hdr.ipv4.dstAddr': ['10.0.0.1']})
+
+    def is_fwd_allowed(address: str, port: int) -> bool:
+        return allowed_params_filter.is_entity_allowed(build_table_entity(p4info_helper, 'MyIngress.fwd', {
+            'hdr.ipv4.dstAddr': address,
+            'standard_metadata.ingress_port': port,
+        }))
+
+    # Only the exact match fields with the filtered name are checked
+    validator.should_be_true(is_fwd_allowed('10.0.0.1', 1))
+    validator.should_be_true(not is_fwd_allowed('10.0.0.2', 1))
+    validator.should_be_true(allowed_params_filter.is_entity_allowed(build_table_entity(p4info_helper, 'MyIngress.lpm', {'hdr.ipv4.dstAddr': ('10.0.0.2', 32)})))
+    validator.should_be_true(allowed_params_filter.is_entity_allowed(build_table_entity(p4info_helper, 'MyIngress.mac', {'hdr.ethernet.dstAddr': '08:00:00:00:02:22'})))
+    meter_entity = p4runtime_pb2.Entity()
+    meter_entity.meter_entry.meter_id = 1
+    validator.should_be_true(allowed_params_filter.is_entity_allowed(meter_entity))
+
+    # Adding returns the values that were not allowed before, every filtered field has to be allowed
+    validator.should_be_equal({'hdr.ipv4.dstAddr': ['10.0.0.2'], 'standard_metadata.ingress_port': [1]},
+                              allowed_params_filter.add({'hdr.ipv4.dstAddr': ['10.0.0.1', '10.0.0.2'], 'standard_metadata.ingress_port': [1]}))
+    validator.should_be_true(is_fwd_allowed('10.0.0.2', 1))
+    validator.should_be_true(not is_fwd_allowed('10.0.0.2', 2))
+
+    # 167772161 is 10.0.0.1 too, it stays allowed after the string form is removed
+    allowed_params_filter.add({'hdr.ipv4.dstAddr': [167772161]})
+    allowed_params_filter.remove({'hdr.ipv4.dstAddr': ['10.0.0.1', '10.0.0.2'], 'hdr.unknown': ['1']})
+    validator.should_be_true(is_fwd_allowed('10.0.0.1', 1))
+    validator.should_be_true(not is_fwd_allowed('10.0.0.2', 1))
+    validator.should_be_equal([167772161], allowed_params_filter.filter_params_allow_only['hdr.ipv4.dstAddr'])
+
+    if validator.was_successful():
+        print('Validation succeed')
+    else:
+        print('Validation failed')
+        sys.exit(1)
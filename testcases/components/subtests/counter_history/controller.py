@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+import sys
+
+from common.controller_helper import ControllerExceptionHandling
+from common.counter_history import CounterHistory
+from common.validator_tools import Validator
+
+with ControllerExceptionHandling():
+    validator = Validator()
+
+    # The initial capacity is smaller than the number of counters, so the rows have to grow
+    history = CounterHistory(depth=3, initial_capacity=2)
+    samples = [(0.0, 0, 100), (1.0, 100, 5), (2.0, 110, 7), (3.0, 130, 9), (4.0, 160, 11)]
+    for timestamp, wrapping_count, reset_count in samples:
+        history.record(['wrapping', 'reset'], [wrapping_count, reset_count], [wrapping_count * 10, reset_count * 10], timestamp)
+    history.record(['single'], [1], [10], 4.0)
+    validator.should_be_equal(3, len(history))
+
+    # The ring keeps the samples of 2.0, 3.0 and 4.0 only, so the rate is (160 - 110) / 2 and not 160 / 4
+    rates = history.get_rates(['wrapping', 'unknown', 'single', 'reset'], window=10.0)
+    validator.should_be_equal([25.0, 0.0, 0.0, 2.0], rates.packets_per_sec.tolist())
+    validator.should_be_equal([250.0, 0.0, 0.0, 20.0], rates.bytes_per_sec.tolist())
+    validator.should_be_equal([2.0, 0.0, 0.0, 2.0], rates.elapsed.tolist())
+
+    # Only the samples of the window are used
+    rates = history.get_rates(['wrapping'], window=1.0)
+    validator.should_be_equal([30.0], rates.packets_per_sec.tolist())
+    validator.should_be_equal([1.0], rates.elapsed.tolist())
+
+    # A counter reset of the switch does not give a negative rate
+    history.record(['reset'], [0], [0], 5.0)
+    rates = history.get_rates(['reset'], window=1.0)
+    validator.should_be_equal([0.0], rates.packets_per_sec.tolist())
+    validator.should_be_equal([1.0], rates.elapsed.tolist())
+
+    try:
+        CounterHistory(depth=1)
+        validator.should_be_true(False)
+    except ValueError:
+        pass
+
+    if validator.was_successful():
+        print('Validation succeed')
+    else:
+        print('Validation failed')
+        sys.exit(1)
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+import asyncio
+import sys
+
+from p4.v1 import p4runtime_pb2
+
+from common.controller_helper import ControllerExceptionHandling
+from common.high_level_switch_connection_async import CounterInterest, CounterPoller
+from common.validator_tools import Validator
+
+# Counter id -> number of indexes of the stand-in switch
+COUNTER_SIZES = {1: 2, 2: 3}
+DIRECT_COUNTER_TABLE_ID = 10
+
+
+class StandInStub:
+    """Answers the counter reads like a switch and counts the Read calls."""
+    def __init__(self) -> None:
+        self.read_requests = []
+
+    async def Read(self, request: p4runtime_pb2.ReadRequest):
+        self.read_requests.append(request)
+        # A slow switch, so the concurrent subscribers wait for the same read
+        await asyncio.sleep(0.1)
+        response = p4runtime_pb2.ReadResponse()
+        for requested in request.entities:
+            if requested.WhichOneof('entity') == 'counter_entry':
+                for index in range(COUNTER_SIZES[requested.counter_entry.counter_id]):
+                    entity = response.entities.add()
+                    entity.counter_entry.counter_id = requested.counter_entry.counter_id
+                    entity.counter_entry.index.index = index
+                    entity.counter_entry.data.packet_count = len(self.read_requests)
+            else:
+                entity = response.entities.add()
+                entity.direct_counter_entry.table_entry.table_id = requested.direct_counter_entry.table_entry.table_id
+                entity.direct_counter_entry.data.packet_count = len(self.read_requests)
+        yield response
+
+
+class StandInConnection:
+    def __init__(self) -> None:
+        self.address = 'stand-in'
+        self.device_id = 0
+        self.client_stub = StandInStub()
+
+
+async def main(validator: Validator) -> None:
+    connection = StandInConnection()
+    poller = CounterPoller(connection)
+    first = poller.subscribe(CounterInterest(counter_ids={1}))
+    second = poller.subscribe(CounterInterest(counter_ids={1, 2}, direct_counter_table_ids={DIRECT_COUNTER_TABLE_ID}))
+
+    # The concurrent subscribers share one read of the switch, the answer is split by their interest
+    first_entities, second_entities = await asyncio.gather(poller.read(first), poller.read(second))
+    validator.should_be_equal(1, len(connection.client_stub.read_requests))
+    request = connection.client_stub.read_requests[0]
+    validator.should_be_equal(3, len(request.entities))
+    validator.should_be_equal(2, len(first_entities))
+    validator.should_be_true(all(entity.counter_entry.counter_id == 1 for entity in first_entities))
+    validator.should_be_equal(6, len(second_entities))
+    validator.should_be_equal(1, len([entity for entity in second_entities if entity.WhichOneof('entity') == 'direct_counter_entry']))
+    stats = poller.get_stats()
+    validator.should_be_equal((2, 1, 1), (stats.subscriptions, stats.reads, stats.shared_reads))
+
+    # A read within max_age is answered without the switch, an older one is read again
+    await poller.read(first, max_age=10.0)
+    validator.should_be_equal(1, len(connection.client_stub.read_requests))
+    first_entities = await poller.read(first)
+    validator.should_be_equal(2, len(connection.client_stub.read_requests))
+    validator.should_be_equal(2, first_entities[0].counter_entry.data.packet_count)
+
+    # The subscribers asking while a read is in flight do not get its older result, they share the next read
+    in_flight_read = asyncio.ensure_future(poller.read(first))
+    await asyncio.sleep(0.05)
+    late_first_entities, _, _ = await asyncio.gather(poller.read(first), poller.read(second), in_flight_read)
+    validator.should_be_equal(4, len(connection.client_stub.read_requests))
+    validator.should_be_equal(4, late_first_entities[0].counter_entry.data.packet_count)
+
+    # The counters of the unsubscribed sources are not read anymore
+    poller.unsubscribe(second)
+    await poller.read(first)
+    validator.should_be_equal([1], [entity.counter_entry.counter_id for entity in connection.client_stub.read_requests[-1].entities])
+    try:
+        await poller.read(second)
+        validator.should_be_true(False)
+    except Exception as e:
+        validator.should_be_true('cancelled subscription' in str(e))
+
+
+with ControllerExceptionHandling():
+    validator = Validator()
+    asyncio.get_event_loop().run_until_complete(main(validator))
+
+    if validator.was_successful():
+        print('Validation succeed')
+    else:
+        print('Validation failed')
+        sys.exit(1)
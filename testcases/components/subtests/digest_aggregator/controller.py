@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+import asyncio
+import sys
+from typing import Any, List, Tuple
+
+from p4.v1 import p4runtime_pb2
+
+from common.controller_helper import ControllerExceptionHandling
+from common.digest_aggregator import DigestAggregator
+from common.validator_tools import Validator
+
+DIGEST_ID = 5
+WINDOW = 0.2
+
+
+def build_digest_list(values: List[int]) -> p4runtime_pb2.DigestList:
+    digest_list = p4runtime_pb2.DigestList()
+    for value in values:
+        digest_list.data.add().bitstring = bytes([value])
+    return digest_list
+
+
+def get_values(message: p4runtime_pb2.StreamMessageResponse) -> List[int]:
+    return [data.bitstring[0] for data in message.digest.data]
+
+
+async def main(validator: Validator) -> None:
+    published: List[Tuple[p4runtime_pb2.StreamMessageResponse, List[Any]]] = []
+
+    async def publish(message: p4runtime_pb2.StreamMessageResponse, origins: List[Any]) -> None:
+        published.append((message, origins))
+
+    # A full list is published right away, the rest waits for the window of its first digest
+    aggregator = DigestAggregator(WINDOW, max_list_size=3, suppress_duplicates=False, publish=publish)
+    await aggregator.add(DIGEST_ID, build_digest_list([1, 2]), origin='target1')
+    await aggregator.add(DIGEST_ID, build_digest_list([3, 4]), origin='target2')
+    validator.should_be_equal(1, len(published))
+    validator.should_be_equal([1, 2, 3], get_values(published[0][0]))
+    # The DigestList of target2 started in the published list
+    validator.should_be_equal(['target1', 'target2'], published[0][1])
+    validator.should_be_equal(DIGEST_ID, published[0][0].digest.digest_id)
+
+    await asyncio.sleep(WINDOW / 2)
+    validator.should_be_equal(1, len(published))
+    await asyncio.sleep(WINDOW)
+    validator.should_be_equal(2, len(published))
+    validator.should_be_equal([4], get_values(published[1][0]))
+    validator.should_be_equal([], published[1][1])
+    # Every aggregated list has its own list_id
+    validator.should_be_true(published[0][0].digest.list_id != published[1][0].digest.list_id)
+
+    # The same payload is published once per window
+    published.clear()
+    aggregator = DigestAggregator(WINDOW, max_list_size=100, suppress_duplicates=True, publish=publish)
+    await aggregator.add(DIGEST_ID, build_digest_list([1, 2]), origin='target1')
+    await aggregator.add(DIGEST_ID, build_digest_list([2, 3]), origin='target2')
+    await asyncio.sleep(WINDOW * 1.5)
+    validator.should_be_equal(1, len(published))
+    validator.should_be_equal([1, 2, 3], get_values(published[0][0]))
+    stats = aggregator.get_stats()
+    validator.should_be_equal((2, 1, 1), (stats.received_lists, stats.published_lists, stats.suppressed_duplicates))
+
+    # Stopping drops the lists that are not published yet
+    await aggregator.add(DIGEST_ID, build_digest_list([9]), origin='target1')
+    aggregator.stop()
+    await asyncio.sleep(WINDOW * 1.5)
+    validator.should_be_equal(1, len(published))
+
+
+with ControllerExceptionHandling():
+    validator = Validator()
+    asyncio.get_event_loop().run_until_complete(main(validator))
+
+    if validator.was_successful():
+        print('Validation succeed')
+    else:
+        print('Validation failed')
+        sys.exit(1)
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+import sys
+
+from p4.v1 import p4runtime_pb2
+
+from common.controller_helper import ControllerExceptionHandling
+from common.entity_helper import EntityMerger
+from common.validator_tools import Validator
+
+
+def build_counter_entity(counter_id: int, index: int, packet_count: int, byte_count: int) -> p4runtime_pb2.Entity:
+    entity = p4runtime_pb2.Entity()
+    entity.counter_entry.counter_id = counter_id
+    entity.counter_entry.index.index = index
+    entity.counter_entry.data.packet_count = packet_count
+    entity.counter_entry.data.byte_count = byte_count
+    return entity
+
+
+def build_table_entity(address: bytes, port: int, priority: int = 0, reverse_match: bool = False) -> p4runtime_pb2.Entity:
+    entity = p4runtime_pb2.Entity()
+    entity.table_entry.table_id = 1
+    entity.table_entry.priority = priority
+    matches = [(1, address), (2, b'\x08\x00')]
+    if reverse_match:
+        matches.reverse()
+    for field_id, value in matches:
+        match = entity.table_entry.match.add()
+        match.field_id = field_id
+        match.exact.value = value
+    entity.table_entry.action.action.action_id = 10
+    param = entity.table_entry.action.action.params.add()
+    param.param_id = 1
+    param.value = bytes([port])
+    return entity
+
+
+with ControllerExceptionHandling():
+    validator = Validator()
+
+    # The counters of the targets arrive one by one and are summed per index
+    merger = EntityMerger()
+    for target_counters in [[(0, 1, 100), (1, 2, 200)], [(0, 3, 300)], [(1, 4, 400), (2, 5, 500)]]:
+        for index, packet_count, byte_count in target_counters:
+            merger.add(build_counter_entity(7, index, packet_count, byte_count))
+    validator.should_be_equal(3, len(merger))
+    counters = {entity.counter_entry.index.index: entity.counter_entry.data for entity in merger.get_entities()}
+    validator.should_be_equal((4, 400), (counters[0].packet_count, counters[0].byte_count))
+    validator.should_be_equal((6, 600), (counters[1].packet_count, counters[1].byte_count))
+    validator.should_be_equal((5, 500), (counters[2].packet_count, counters[2].byte_count))
+
+    # The same table entry of the replicated targets is answered once, a different answer fails the merge
+    merger = EntityMerger()
+    merger.add(build_table_entity(b'\x0a\x00\x00\x01', 1))
+    merger.add(build_table_entity(b'\x0a\x00\x00\x01', 1))
+    merger.add(build_table_entity(b'\x0a\x00\x00\x02', 2))
+    validator.should_be_equal(2, len(merger))
+    try:
+        merger.add(build_table_entity(b'\x0a\x00\x00\x01', 3))
+        validator.should_be_true(False)
+    except Exception as e:
+        validator.should_be_true('Cannot merge' in str(e))
+
+    # The entities are keyed by their structure: the order of the match fields does not matter, the priority does
+    merger = EntityMerger()
+    merger.add(build_table_entity(b'\x0a\x00\x00\x01', 1))
+    merger.add(build_table_entity(b'\x0a\x00\x00\x01', 1, reverse_match=True))
+    validator.should_be_equal(1, len(merger))
+    merger.add(build_table_entity(b'\x0a\x00\x00\x01', 1, priority=10))
+    validator.should_be_equal(2, len(merger))
+
+    # The direct counters of a table entry are summed independently of the match field order of the targets
+    merger = EntityMerger()
+    for packet_count, reverse_match in [(1, False), (2, True)]:
+        entity = p4runtime_pb2.Entity()
+        entity.direct_counter_entry.table_entry.CopyFrom(build_table_entity(b'\x0a\x00\x00\x01', 1, reverse_match=reverse_match).table_entry)
+        entity.direct_counter_entry.data.packet_count = packet_count
+        merger.add(entity)
+    validator.should_be_equal(1, len(merger))
+    validator.should_be_equal(3, merger.get_entities()[0].direct_counter_entry.data.packet_count)
+
+    # Only the entities that are already known are merged from an other merger
+    merger = EntityMerger()
+    merger.add(build_counter_entity(7, 0, 1, 10))
+    other = EntityMerger()
+    other.add(build_counter_entity(7, 0, 2, 20))
+    other.add(build_counter_entity(7, 1, 3, 30))
+    merged = merger.merge_known_entities_from(other)
+    validator.should_be_equal(1, len(merged))
+    validator.should_be_equal(1, len(merger))
+    validator.should_be_equal(3, merger.get_entities()[0].counter_entry.data.packet_count)
+
+    if validator.was_successful():
+        print('Validation succeed')
+    else:
+        print('Validation failed')
+        sys.exit(1)
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+import asyncio
+import os
+import sys
+import tempfile
+
+import redis.asyncio
+from p4.v1 import p4runtime_pb2
+
+from common.controller_helper import ControllerExceptionHandling
+from common.model.proxy_config import ProxyRedisSettings, RedisMode
+from common.redis_journal import RedisJournalWriter
+from common.validator_tools import Validator
+from proxy import ProxyP4RuntimeServicer
+
+LIST_KEY = 'TEST_JOURNAL_LIST'
+STRING_KEY = 'TEST_JOURNAL_STRING'
+PROXY_PREFIX = 'TEST_JOURNAL_'
+
+P4INFO = '''
+tables {
+  preamble { id: 1 name: "MyIngress.fwd" alias: "fwd" }
+  match_fields { id: 1 name: "hdr.ipv4.dstAddr" bitwidth: 32 match_type: EXACT }
+  action_refs { id: 10 }
+}
+actions {
+  preamble { id: 10 name: "MyIngress.set_port" alias: "set_port" }
+  params { id: 1 name: "port" bitwidth: 9 }
+}
+meters {
+  preamble { id: 20 name: "MyIngress.limit" alias: "limit" }
+  spec { unit: PACKETS }
+  size: 16
+}
+'''
+
+
+def build_write_request() -> p4runtime_pb2.WriteRequest:
+    """Two table entries and two meter configs, they are journaled to two different redis keys."""
+    request = p4runtime_pb2.WriteRequest()
+    for index in range(2):
+        update = request.updates.add(type=p4runtime_pb2.Update.INSERT)
+        table_entry = update.entity.table_entry
+        table_entry.table_id = 1
+        match = table_entry.match.add(field_id=1)
+        match.exact.value = bytes([10, 0, 0, index + 1])
+        table_entry.action.action.action_id = 10
+        table_entry.action.action.params.add(param_id=1, value=bytes([index + 1]))
+    for index in range(2):
+        update = request.updates.add(type=p4runtime_pb2.Update.MODIFY)
+        update.entity.meter_entry.meter_id = 20
+        update.entity.meter_entry.index.index = index
+        update.entity.meter_entry.config.cir = 100
+    return request
+
+
+async def test_proxy_write(validator: Validator, redis_client: redis.asyncio.Redis) -> None:
+    p4info_path = os.path.join(tempfile.mkdtemp(), 'journal.p4info.txt')
+    with open(p4info_path, 'w') as f:
+        f.write(P4INFO)
+    # Every batch holds two records, the table entries are in the first one, the meter configs in the second one
+    servicer = ProxyP4RuntimeServicer(PROXY_PREFIX, p4info_path, [], RedisMode.ONLY_WRITE, ProxyRedisSettings(journal_max_batch_size=2))
+    table_entries_key = servicer.redis_keys.TABLE_ENTRIES
+    meter_entries_key = servicer.redis_keys.METER_ENTRIES
+    await redis_client.delete(table_entries_key, meter_entries_key)
+
+    # The first batch of the Write fails, the batch with the flush marker succeeds, the Write has to fail
+    await redis_client.set(table_entries_key, 'not a list')
+    try:
+        await servicer.Write(build_write_request(), None)
+        validator.should_be_true(False)
+    except redis.ResponseError:
+        pass
+    validator.should_be_equal(2, await redis_client.llen(meter_entries_key))
+
+    # The failure is reported to the Write it belongs to only
+    await redis_client.delete(table_entries_key)
+    await servicer.Write(build_write_request(), None)
+    validator.should_be_equal(2, await redis_client.llen(table_entries_key))
+
+    await servicer.redis_journal.stop()
+    await redis_client.delete(table_entries_key, meter_entries_key)
+
+
+async def main(validator: Validator) -> None:
+    redis_client = redis.asyncio.Redis()
+    await redis_client.delete(LIST_KEY, STRING_KEY)
+
+    # The records are written in the order they were appended, in batches of at most max_batch_size
+    journal = RedisJournalWriter(redis_client, max_batch_size=3, max_batch_delay=0.05)
+    for index in range(7):
+        journal.append('rpush', LIST_KEY, index)
+    validator.should_be_equal(7, journal.queue_depth)
+    await journal.flush()
+    validator.should_be_equal([str(index).encode() for index in range(7)], await redis_client.lrange(LIST_KEY, 0, -1))
+    stats = journal.get_stats()
+    validator.should_be_equal((0, 3, 7, 0), (stats.queue_depth, stats.flush_count, stats.flushed_records, stats.failed_records))
+
+    # A failed batch raises on the flush waiting for it, the journal goes on with the next batch
+    await redis_client.set(STRING_KEY, 'not a list')
+    journal.append('rpush', STRING_KEY, 'value')
+    try:
+        await journal.flush()
+        validator.should_be_true(False)
+    except redis.ResponseError:
+        pass
+    validator.should_be_equal(1, journal.get_stats().failed_records)
+    journal.append('rpush', LIST_KEY, 7)
+    await journal.flush()
+    validator.should_be_equal(8, await redis_client.llen(LIST_KEY))
+
+    # A flush covers the records from since, also the ones written in an earlier batch than the flush marker
+    since = journal.next_sequence
+    journal.append('rpush', STRING_KEY, 'value')
+    for index in range(9, 12):
+        journal.append('rpush', LIST_KEY, index)
+    try:
+        await journal.flush(since)
+        validator.should_be_true(False)
+    except redis.ResponseError:
+        pass
+    validator.should_be_equal(11, await redis_client.llen(LIST_KEY))
+    journal.append('rpush', LIST_KEY, 12)
+    await journal.flush()
+
+    # Stopping writes the records that are still waiting
+    journal.append('rpush', LIST_KEY, 13)
+    await journal.stop()
+    validator.should_be_equal(b'13', await redis_client.lindex(LIST_KEY, -1))
+
+    await redis_client.delete(LIST_KEY, STRING_KEY)
+    await test_proxy_write(validator, redis_client)
+
+
+with ControllerExceptionHandling():
+    validator = Validator()
+    asyncio.get_event_loop().run_until_complete(main(validator))
+
+    if validator.was_successful():
+        print('Validation succeed')
+    else:
+        print('Validation failed')
+        sys.exit(1)
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+import sys
+
+from p4.v1 import p4runtime_pb2
+
+from common.controller_helper import ControllerExceptionHandling
+from common.entity_helper import EntityHelper
+from common.model.proxy_config import RedisStorageFormat
+from common.redis_codec import BINARY_RECORD_HEADER, BINARY_RECORD_MAGIC, UnknownRedisRecordVersion, encode_redis_record, decode_redis_record, \
+    is_redis_record_in_format, redis_record_to_json
+from common.redis_helper import redis, compact_table_entries_log
+from common.validator_tools import Validator
+
+LOG_KEY = 'TEST_TABLE_ENTRIES'
+STATE_KEY = 'TEST_TABLE_STATE'
+
+
+def build_update(update_type: int, address: bytes, port: int, reverse_match: bool = False) -> p4runtime_pb2.Update:
+    update = p4runtime_pb2.Update(type=update_type)
+    table_entry = update.entity.table_entry
+    table_entry.table_id = 1
+    matches = [(1, address), (2, bytes([port]))]
+    if reverse_match:
+        matches.reverse()
+    for field_id, value in matches:
+        match = table_entry.match.add()
+        match.field_id = field_id
+        match.exact.value = value
+    table_entry.action.action.action_id = 10
+    param = table_entry.action.action.params.add()
+    param.param_id = 1
+    param.value = bytes([port])
+    return update
+
+
+with ControllerExceptionHandling():
+    validator = Validator()
+    update = build_update(p4runtime_pb2.Update.INSERT, b'\x0a\x00\x00\x01', 1)
+
+    # Codec: the binary records carry the header and the version, both formats are read back
+    binary_record = encode_redis_record(update, RedisStorageFormat.BINARY)
+    validator.should_be_equal(BINARY_RECORD_HEADER, binary_record[:len(BINARY_RECORD_HEADER)])
+    validator.should_be_equal(update, decode_redis_record(binary_record, p4runtime_pb2.Update))
+    json_record = encode_redis_record(update, RedisStorageFormat.JSON)
+    validator.should_be_equal(update, decode_redis_record(json_record, p4runtime_pb2.Update))
+    validator.should_be_true(is_redis_record_in_format(binary_record, RedisStorageFormat.BINARY))
+    validator.should_be_true(not is_redis_record_in_format(binary_record, RedisStorageFormat.JSON))
+    validator.should_be_true(is_redis_record_in_format(json_record, RedisStorageFormat.JSON))
+    validator.should_be_equal(redis_record_to_json(json_record, p4runtime_pb2.Update), redis_record_to_json(binary_record, p4runtime_pb2.Update))
+    try:
+        decode_redis_record(BINARY_RECORD_MAGIC + bytes([99]) + update.SerializeToString(), p4runtime_pb2.Update)
+        validator.should_be_true(False)
+    except UnknownRedisRecordVersion:
+        pass
+
+    # KEYED layout: the key does not depend on the order of the match fields or the action
+    validator.should_be_equal(
+        EntityHelper.get_table_entry_key(build_update(p4runtime_pb2.Update.INSERT, b'\x0a\x00\x00\x01', 1).entity.table_entry),
+        EntityHelper.get_table_entry_key(build_update(p4runtime_pb2.Update.MODIFY, b'\x0a\x00\x00\x01', 1, reverse_match=True).entity.table_entry)
+    )
+
+    # The LOG layout replayed into the live entries, the same as the KEYED layout stores
+    log = [
+        build_update(p4runtime_pb2.Update.INSERT, b'\x0a\x00\x00\x01', 1),
+        build_update(p4runtime_pb2.Update.INSERT, b'\x0a\x00\x00\x02', 2),
+        build_update(p4runtime_pb2.Update.INSERT, b'\x0a\x00\x00\x03', 3),
+        build_update(p4runtime_pb2.Update.DELETE, b'\x0a\x00\x00\x02', 2),
+    ]
+    modify = build_update(p4runtime_pb2.Update.MODIFY, b'\x0a\x00\x00\x01', 1)
+    modify.entity.table_entry.action.action.params[0].value = b'\x07'
+    log.append(modify)
+    live = EntityHelper.collapse_table_entry_updates(log)
+    validator.should_be_equal(2, len(live))
+    live_entry = live[EntityHelper.get_table_entry_key(modify.entity.table_entry)]
+    validator.should_be_equal(p4runtime_pb2.Update.INSERT, live_entry.type)
+    validator.should_be_equal(modify.entity, live_entry.entity)
+
+    # Compacting the log into the hash, the log is replayed on top of the entries already in the hash
+    redis.delete(LOG_KEY, STATE_KEY)
+    for logged_update in log:
+        redis.rpush(LOG_KEY, encode_redis_record(logged_update, RedisStorageFormat.BINARY))
+    stored = build_update(p4runtime_pb2.Update.INSERT, b'\x0a\x00\x00\x04', 4)
+    stored_key = EntityHelper.get_table_entry_key(stored.entity.table_entry)
+    redis.hset(STATE_KEY, stored_key, encode_redis_record(stored, RedisStorageFormat.BINARY))
+    validator.should_be_equal(len(log), compact_table_entries_log(redis, LOG_KEY, STATE_KEY, RedisStorageFormat.BINARY))
+    validator.should_be_equal(0, redis.exists(LOG_KEY))
+    state = {key: decode_redis_record(raw_record, p4runtime_pb2.Update) for key, raw_record in redis.hgetall(STATE_KEY).items()}
+    validator.should_be_equal(3, len(state))
+    validator.should_be_equal(stored, state[stored_key])
+    validator.should_be_equal(live_entry, state[EntityHelper.get_table_entry_key(modify.entity.table_entry)])
+    validator.should_be_equal(0, compact_table_entries_log(redis, LOG_KEY, STATE_KEY, RedisStorageFormat.BINARY))
+    redis.delete(LOG_KEY, STATE_KEY)
+
+    if validator.was_successful():
+        print('Validation succeed')
+    else:
+        print('Validation failed')
+        sys.exit(1)
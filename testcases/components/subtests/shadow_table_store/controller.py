@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+import asyncio
+import sys
+from typing import List, Optional
+
+from p4.v1 import p4runtime_pb2
+
+from common.controller_helper import ControllerExceptionHandling
+from common.shadow_table_store import ShadowTableStore
+from common.validator_tools import Validator
+
+
+def build_table_entity(address: bytes, port: int) -> p4runtime_pb2.Entity:
+    entity = p4runtime_pb2.Entity()
+    entity.table_entry.table_id = 1
+    match = entity.table_entry.match.add()
+    match.field_id = 1
+    match.exact.value = address
+    entity.table_entry.action.action.action_id = 10
+    param = entity.table_entry.action.action.params.add()
+    param.param_id = 1
+    param.value = bytes([port])
+    return entity
+
+
+def build_update(update_type: int, address: bytes, port: int) -> p4runtime_pb2.Update:
+    update = p4runtime_pb2.Update(type=update_type)
+    update.entity.CopyFrom(build_table_entity(address, port))
+    return update
+
+
+def read_port(store: ShadowTableStore, address: bytes) -> Optional[int]:
+    read_entity = p4runtime_pb2.Entity()
+    read_entity.table_entry.table_id = 1
+    match = read_entity.table_entry.match.add()
+    match.field_id = 1
+    match.exact.value = address
+    entities = store.read(read_entity)
+    if entities is None or len(entities) == 0:
+        return None
+    return entities[0].table_entry.action.action.params[0].value[0]
+
+
+async def main(validator: Validator) -> None:
+    switch_entities: List[p4runtime_pb2.Entity] = [build_table_entity(b'\x0a\x00\x00\x01', 1)]
+
+    async def read_target() -> List[p4runtime_pb2.Entity]:
+        return list(switch_entities)
+
+    store = ShadowTableStore(reconcile_interval=60.0)
+    validator.should_be_true(store.read(build_table_entity(b'\x0a\x00\x00\x01', 1)) is None)
+    validator.should_be_equal(0, await store.reconcile(read_target))
+    validator.should_be_true(store.synced)
+    validator.should_be_equal(1, read_port(store, b'\x0a\x00\x00\x01'))
+
+    # The reads asking for more than the store knows go to the switch
+    counter_read = p4runtime_pb2.Entity()
+    counter_read.table_entry.table_id = 1
+    counter_read.table_entry.counter_data.packet_count = 0
+    validator.should_be_true(store.read(counter_read) is None)
+
+    # The writes are applied in the order of their tickets, even if the second one is acknowledged first
+    insert_ticket = store.begin_write()
+    modify_ticket = store.begin_write()
+    store.finish_write(modify_ticket, [build_update(p4runtime_pb2.Update.MODIFY, b'\x0a\x00\x00\x02', 3)])
+    validator.should_be_equal(None, read_port(store, b'\x0a\x00\x00\x02'))
+    store.finish_write(insert_ticket, [build_update(p4runtime_pb2.Update.INSERT, b'\x0a\x00\x00\x02', 2)])
+    validator.should_be_equal(3, read_port(store, b'\x0a\x00\x00\x02'))
+    delete_ticket = store.begin_write()
+    store.finish_write(delete_ticket, [build_update(p4runtime_pb2.Update.DELETE, b'\x0a\x00\x00\x01', 1)])
+    validator.should_be_equal(None, read_port(store, b'\x0a\x00\x00\x01'))
+
+    # The default entry is not stored, the switch does not answer it to table reads, and its reads go to the switch
+    default_ticket = store.begin_write()
+    default_update = p4runtime_pb2.Update(type=p4runtime_pb2.Update.MODIFY)
+    default_update.entity.table_entry.table_id = 1
+    default_update.entity.table_entry.is_default_action = True
+    default_update.entity.table_entry.action.action.action_id = 11
+    store.finish_write(default_ticket, [default_update])
+    table_read = p4runtime_pb2.Entity()
+    table_read.table_entry.table_id = 1
+    validator.should_be_equal([b'\x0a\x00\x00\x02'], [entity.table_entry.match[0].exact.value for entity in store.read(table_read)])
+    default_read = p4runtime_pb2.Entity()
+    default_read.table_entry.table_id = 1
+    default_read.table_entry.is_default_action = True
+    validator.should_be_true(store.read(default_read) is None)
+
+    # The switch is different from the store, the reconciliation counts it and takes the content of the switch
+    switch_entities = [build_table_entity(b'\x0a\x00\x00\x02', 4)]
+    validator.should_be_equal(1, await store.reconcile(read_target))
+    validator.should_be_equal(4, read_port(store, b'\x0a\x00\x00\x02'))
+
+    # A failed write makes the store out of sync, the later writes wait for it and are not served either
+    failed_ticket = store.begin_write()
+    later_ticket = store.begin_write()
+    store.finish_write(later_ticket, [build_update(p4runtime_pb2.Update.INSERT, b'\x0a\x00\x00\x03', 3)])
+    validator.should_be_true(store.synced)
+    store.finish_write(failed_ticket, None)
+    validator.should_be_true(not store.synced)
+    validator.should_be_true(store.read(build_table_entity(b'\x0a\x00\x00\x03', 3)) is None)
+
+    # The writes acknowledged while the switch is read are replayed on the read content
+    read_started = asyncio.Event()
+    release_read = asyncio.Event()
+
+    async def slow_read_target() -> List[p4runtime_pb2.Entity]:
+        entities = list(switch_entities)
+        read_started.set()
+        await release_read.wait()
+        return entities
+
+    reconcile_task = asyncio.ensure_future(store.reconcile(slow_read_target))
+    await read_started.wait()
+    during_sync_ticket = store.begin_write()
+    store.finish_write(during_sync_ticket, [build_update(p4runtime_pb2.Update.INSERT, b'\x0a\x00\x00\x05', 5)])
+    release_read.set()
+    await reconcile_task
+    validator.should_be_true(store.synced)
+    validator.should_be_equal(5, read_port(store, b'\x0a\x00\x00\x05'))
+    validator.should_be_equal(4, read_port(store, b'\x0a\x00\x00\x02'))
+
+    stats = store.get_stats()
+    validator.should_be_equal((2, 3, 1), (stats.entities, stats.reconciliations, stats.mismatches))
+
+
+with ControllerExceptionHandling():
+    validator = Validator()
+    asyncio.get_event_loop().run_until_complete(main(validator))
+
+    if validator.was_successful():
+        print('Validation succeed')
+    else:
+        print('Validation failed')
+        sys.exit(1)
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+import asyncio
+import sys
+from typing import List
+
+from p4.v1 import p4runtime_pb2
+
+from common.controller_helper import ControllerExceptionHandling
+from common.model.proxy_config import StreamOverflowPolicy
+from common.stream_message_bus import StreamMessageBus, StreamSubscription
+from common.validator_tools import Validator
+
+QUEUE_SIZE = 2
+
+
+def build_message(index: int) -> p4runtime_pb2.StreamMessageResponse:
+    message = p4runtime_pb2.StreamMessageResponse()
+    message.packet.payload = bytes([index])
+    return message
+
+
+def drain(subscription: StreamSubscription) -> List[int]:
+    ret = []
+    while not subscription.queue.empty():
+        ret.append(subscription.queue.get_nowait().packet.payload[0])
+    return ret
+
+
+async def test_drop_policy(validator: Validator, overflow_policy: StreamOverflowPolicy, expected_slow_messages: List[int]) -> None:
+    bus = StreamMessageBus(QUEUE_SIZE, overflow_policy)
+    fast = bus.subscribe()
+    slow = bus.subscribe()
+    fast_messages = []
+    for index in range(1, 5):
+        await bus.publish(build_message(index))
+        fast_messages.append((await bus.get(fast)).packet.payload[0])
+
+    # Only the slow subscriber loses messages
+    validator.should_be_equal([1, 2, 3, 4], fast_messages)
+    validator.should_be_equal(expected_slow_messages, drain(slow))
+    validator.should_be_equal((0, 4), (fast.dropped, fast.delivered))
+    validator.should_be_equal((2, QUEUE_SIZE), (slow.dropped, slow.max_lag))
+
+
+async def test_block_policy(validator: Validator) -> None:
+    bus = StreamMessageBus(QUEUE_SIZE, StreamOverflowPolicy.BLOCK)
+    slow = bus.subscribe()
+    for index in range(1, 3):
+        await bus.publish(build_message(index))
+
+    # The publisher waits for the slow subscriber, nothing is dropped
+    blocked_publish = asyncio.ensure_future(bus.publish(build_message(3)))
+    await asyncio.sleep(0.1)
+    validator.should_be_true(not blocked_publish.done())
+    validator.should_be_equal(1, (await bus.get(slow)).packet.payload[0])
+    await asyncio.wait_for(blocked_publish, timeout=1)
+    validator.should_be_equal([2, 3], drain(slow))
+    validator.should_be_equal(0, slow.dropped)
+
+    # A subscriber leaving releases the publisher blocked on its queue
+    for index in range(4, 6):
+        await bus.publish(build_message(index))
+    blocked_publish = asyncio.ensure_future(bus.publish(build_message(6)))
+    await asyncio.sleep(0.1)
+    validator.should_be_true(not blocked_publish.done())
+    bus.unsubscribe(slow)
+    await asyncio.wait_for(blocked_publish, timeout=1)
+
+    # Without subscribers the messages are only counted
+    await bus.publish(build_message(7))
+    validator.should_be_equal(1, bus.unsubscribed_drops)
+
+
+async def main(validator: Validator) -> None:
+    await test_drop_policy(validator, StreamOverflowPolicy.DROP_OLDEST, [3, 4])
+    await test_drop_policy(validator, StreamOverflowPolicy.DROP_NEWEST, [1, 2])
+    await test_block_policy(validator)
+
+
+with ControllerExceptionHandling():
+    validator = Validator()
+    asyncio.get_event_loop().run_until_complete(main(validator))
+
+    if validator.was_successful():
+        print('Validation succeed')
+    else:
+        print('Validation failed')
+        sys.exit(1)
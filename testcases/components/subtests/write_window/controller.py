@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+import asyncio
+import sys
+from typing import List
+
+from common.controller_helper import ControllerExceptionHandling
+from common.high_level_switch_connection_async import WriteWindow
+from common.validator_tools import Validator
+
+
+async def submit_writes(window: WriteWindow, durations: List[float], events: List[str], fail_index: int = -1) -> List[asyncio.Task]:
+    """Submits one write per duration, the earlier writes take longer to acknowledge."""
+    tasks = []
+    for index, duration in enumerate(durations):
+        async def write(index=index, duration=duration) -> None:
+            events.append(f'start {index}')
+            await asyncio.sleep(duration)
+            events.append(f'ack {index}')
+            if index == fail_index:
+                raise Exception(f'Write {index} failed')
+
+        tasks.append(await window.submit(1, write, lambda: []))
+    return tasks
+
+
+async def main(validator: Validator) -> None:
+    # Ordered: the submits return right away, but every write is sent after the previous one is acknowledged
+    events = []
+    window = WriteWindow(max_in_flight=8)
+    tasks = await submit_writes(window, [0.15, 0.1, 0.05], events, fail_index=0)
+    validator.should_be_equal(3, window.in_flight)
+    await window.drain()
+    validator.should_be_equal(['start 0', 'ack 0', 'start 1', 'ack 1', 'start 2', 'ack 2'], events)
+    # A failed write does not stop the later ones
+    validator.should_be_true(tasks[0].exception() is not None)
+    validator.should_be_equal((2, 1, 0), (window.completed_writes, window.failed_writes, window.in_flight))
+
+    # Unordered: the writes are sent together, the shorter ones are acknowledged first
+    events = []
+    window = WriteWindow(max_in_flight=8, ordered=False)
+    await submit_writes(window, [0.15, 0.1, 0.05], events)
+    await window.drain()
+    validator.should_be_equal(['start 0', 'start 1', 'start 2', 'ack 2', 'ack 1', 'ack 0'], events)
+
+    # A full window makes the submitters wait, they get the room in submit order
+    events = []
+    window = WriteWindow(max_in_flight=1, ordered=False)
+    submitters = [asyncio.ensure_future(submit_writes(window, [0.05], events)) for _ in range(3)]
+    await asyncio.sleep(0.01)
+    validator.should_be_equal(1, window.in_flight)
+    validator.should_be_equal(1, len([submitter for submitter in submitters if submitter.done()]))
+    await asyncio.gather(*submitters)
+    await window.drain()
+    validator.should_be_equal(['start 0', 'ack 0'] * 3, events)
+    validator.should_be_equal(0, window.in_flight)
+
+
+with ControllerExceptionHandling():
+    validator = Validator()
+    asyncio.get_event_loop().run_until_complete(main(validator))
+
+    if validator.was_successful():
+        print('Validation succeed')
+    else:
+        print('Validation failed')
+        sys.exit(1)
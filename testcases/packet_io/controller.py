@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+import queue
+import sys
+from pathlib import Path
+
+from common.controller_helper import ControllerExceptionHandling
+from common.high_level_switch_connection import HighLevelSwitchConnection
+from common.p4runtime_lib.convert import encodeNum, decodeNum
+from common.p4runtime_lib.switch import ShutdownAllSwitchConnections
+from common.validator_tools import Validator
+
+# Packets of test_h1_input.pcap
+PACKET_NUM = 10
+
+with ControllerExceptionHandling():
+    s1 = HighLevelSwitchConnection(0, 'packet_io', '60051')
+
+    validator = Validator()
+    s1_recv_queue = queue.Queue()
+    s1.subscribe_to_stream_with_queue(s1_recv_queue)
+
+    packet_in_metadata_ids = {metadata.name: metadata.id for metadata in s1.p4info_helper.get('controller_packet_metadata', name='packet_in').metadata}
+    packet_out_metadata_ids = {metadata.name: metadata.id for metadata in s1.p4info_helper.get('controller_packet_metadata', name='packet_out').metadata}
+    Path('.controller_ready').touch()
+
+    for i in range(PACKET_NUM):
+        stream_message_response = s1_recv_queue.get(block=True, timeout=10)
+        validator.should_be_equal('packet', stream_message_response.message.WhichOneof('update'))
+        packet_in = stream_message_response.message.packet
+        ingress_ports = [decodeNum(metadata.value) for metadata in packet_in.metadata if metadata.metadata_id == packet_in_metadata_ids['ingress_port']]
+        validator.should_be_equal([1], ingress_ports)
+
+        # Sent out to h2 as it arrived from h1, test_h2_expected.pcap checks that every packet-out arrived
+        s1.connection.SendPacketOut(packet_in.payload, {
+            packet_out_metadata_ids['egress_port']: encodeNum(2, 9),
+            packet_out_metadata_ids['_pad']: encodeNum(0, 7),
+        })
+
+    ShutdownAllSwitchConnections()
+
+    if validator.was_successful():
+        print('Validation succeed')
+    else:
+        print('Validation failed')
+        sys.exit(1)
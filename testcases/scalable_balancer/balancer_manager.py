@@ -110,6 +110,22 @@ async def remove_from_filter(params: AddFilterParameters) -> web.Response:
     return web.json_response({'status': 'OK'})
 
 
+class CounterRatesParameters(BaseModel):
+    counter_name: str
+    indices: List[int]
+    window: float = 5.0
+
+@api_endpoint('post', '/counter_rates', CounterRatesParameters)
+async def counter_rates(params: CounterRatesParameters) -> web.Response:
+    global manager
+    rates = manager.get_counter_rates(params.counter_name, params.indices, params.window)
+    return web.json_response({
+        'packets_per_sec': rates.packets_per_sec.tolist(),
+        'bytes_per_sec': rates.bytes_per_sec.tolist(),
+        'elapsed': rates.elapsed.tolist(),
+    })
+
+
 class Settings(BaseSettings):
     model_config = SettingsConfigDict(env_file='.env', env_file_encoding='utf-8')
     api_host: str = '127.0.0.1'
@@ -121,6 +137,7 @@ class Settings(BaseSettings):
     balancer_port: int = 50051
     balancer_device_id: int = 0
     balancer_p4_program_name: str = 'scalable_simple_balancer'
+    counter_history_depth: Optional[int] = 60
 
 
 if __name__ == "__main__":
@@ -142,7 +159,8 @@ if __name__ == "__main__":
                 settings.balancer_host,
                 settings.balancer_port,
                 settings.balancer_device_id,
-                settings.balancer_p4_program_name
+                settings.balancer_p4_program_name,
+                counter_history_depth=settings.counter_history_depth
             )
             await manager.init()
 
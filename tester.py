@@ -23,6 +23,7 @@ class TestCase(TypedDict):
 test_cases : List[TestCase] = [
     {'name': 'l3fwd','subtest': None},
     {'name': 'l3fwd','subtest': 'load_from_redis'},
+    {'name': 'l3fwd','subtest': 'load_from_redis_keyed'},
     {'name': 'l3fwd','subtest': 'simple_forward'},
     {'name': 'l3fwd','subtest': 'delete_entry'},
     {'name': 'l3fwd','subtest': 'multiple_update'},
@@ -55,6 +56,8 @@ test_cases : List[TestCase] = [
     {'name': 'direct_meter','subtest': 'preload'},
     {'name': 'digest','subtest': None},
     {'name': 'digest','subtest': 'disaggregate'},
+    {'name': 'packet_io','subtest': None},
+    {'name': 'packet_io','subtest': 'disaggregate'},
     {'name': 'l2fwd_disaggregation','subtest': None},
     {'name': 'balancer','subtest': 'fixed_traffic'},
     {'name': 'balancer','subtest': 'changing_traffic'},
@@ -68,6 +71,16 @@ test_cases : List[TestCase] = [
     {'name': 'scalable_balancer','subtest': None},
     {'name': 'replicate','subtest': None},
     {'name': 'entry_filtering','subtest': None},
+    {'name': 'components','subtest': 'redis_storage'},
+    {'name': 'components','subtest': 'redis_journal'},
+    {'name': 'components','subtest': 'allowed_params_filter'},
+    {'name': 'components','subtest': 'entity_merger'},
+    {'name': 'components','subtest': 'counter_poller'},
+    {'name': 'components','subtest': 'counter_history'},
+    {'name': 'components','subtest': 'shadow_table_store'},
+    {'name': 'components','subtest': 'stream_message_bus'},
+    {'name': 'components','subtest': 'digest_aggregator'},
+    {'name': 'components','subtest': 'write_window'},
 ]
 
 TARGET_TEST_FOLDER = '__temporary_test_folder'
@@ -147,6 +160,9 @@ def prepare_environment() -> None:
                 if "list" in table_obj:
                     for data_one_record in table_obj["list"]:
                        redis.rpush(redis_key, data_one_record)
+                if "hash" in table_obj:
+                    for field_hex, data_one_record in table_obj["hash"].items():
+                       redis.hset(redis_key, bytes.fromhex(field_hex), data_one_record)
                 if "string" in table_obj:
                     redis.set(redis_key, table_obj['string'])
 
@@ -361,7 +377,7 @@ def run_test_cases(test_cases_to_run: list):
                 clear_folder(TARGET_TEST_FOLDER)
             success_counter += 1
         finally:
-            close_everything_and_save_logs()
+            close_everything_and_save_logs(ExtendableConfig(f'{TARGET_TEST_FOLDER}/test_config.json', ignore_missing_file=True).get('start_mininet', True))
     if success_counter == len(test_cases_to_run):
         print(f'{COLOR_GREEN}----------------------------------')
         print('All tests were passed successfully')
@@ -395,7 +411,7 @@ def dump_controller_output() -> None:
         print(f'{COLOR_RED_BG} --- Controller output end --- {COLOR_END}')
 
 
-def close_everything_and_save_logs() -> None:
+def close_everything_and_save_logs(mininet_started: bool = True) -> None:
     if os.path.exists(f'{TARGET_TEST_FOLDER}/logs'):
         tmux(f'capture-pane -S - -pt {mininet_pane_name} > {TARGET_TEST_FOLDER}/logs/mininet.log')
         tmux(f'capture-pane -S - -pt {controller_pane_name} > {TARGET_TEST_FOLDER}/logs/controller.log')
@@ -403,12 +419,13 @@ def close_everything_and_save_logs() -> None:
     tmux_shell(f'C-c', proxy_pane_name)
     tmux_shell(f'C-c', proxy_pane_name)
     tmux_shell(f'C-c', controller_pane_name)
-    tmux_shell(f'C-c', mininet_pane_name)
-    wait_for_output('^mininet>', mininet_pane_name)
-    tmux_shell(f'quit', mininet_pane_name)
-    wait_for_output('^mininet@mininet-vm', mininet_pane_name)
-    tmux_shell(f'make stop', mininet_pane_name)
-    wait_for_output('^mininet@mininet-vm', mininet_pane_name)
+    if mininet_started:
+        tmux_shell(f'C-c', mininet_pane_name)
+        wait_for_output('^mininet>', mininet_pane_name)
+        tmux_shell(f'quit', mininet_pane_name)
+        wait_for_output('^mininet@mininet-vm', mininet_pane_name)
+        tmux_shell(f'make stop', mininet_pane_name)
+        wait_for_output('^mininet@mininet-vm', mininet_pane_name)
     tmux_shell(f'tmux kill-session -t {TMUX_WINDOW_NAME}')
 
 
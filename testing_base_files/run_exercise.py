@@ -91,7 +91,10 @@ class ExerciseTopo(Topo):
             else:
                 # add default switch
                 switchClass = None
-            self.addSwitch(sw, log_file="%s/%s.log" %(log_dir, sw), cls=switchClass)
+            switch_opts = {}
+            if "cpu_port" in params:
+                switch_opts["cpu_port"] = params["cpu_port"]
+            self.addSwitch(sw, log_file="%s/%s.log" %(log_dir, sw), cls=switchClass, **switch_opts)
 
         for link in host_links:
             host_name = link['node1']